@@ -9,16 +9,27 @@ import sys
 import yaml
 import textwrap
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 import argparse
 from datetime import datetime
 import socket
-import lockfile
+import fcntl
+import signal
 import time
 import subprocess
 import re
+import shlex
+import threading
+import functools
+import queue
+import atexit
+import json
+import concurrent.futures
 import gzip
+import glob
 import tarfile
+import hashlib
+import pickle
 
 # Constants
 LOGO="rsnapshot_backup"
@@ -30,6 +41,891 @@ LOG_FILE = "rsnapshot_backup.log"
 LOCK_FILE = "/run/rsnapshot_backup"
 RSNAPSHOT_CONF = "/opt/sysadmws/rsnapshot_backup/rsnapshot.conf"
 RSNAPSHOT_PASSWD = "/opt/sysadmws/rsnapshot_backup/rsnapshot.passwd"
+PROBE_CACHE_FILE = "/opt/sysadmws/rsnapshot_backup/probe_cache.json"
+# CSafeLoader (libyaml) parses configs much faster, fall back to the pure python loader where libyaml is not installed
+YAML_SAFE_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+# Item types which are backed up over ssh and the subset which dump databases first
+SSH_TYPES = frozenset({"RSYNC_SSH", "MYSQL_SSH", "POSTGRESQL_SSH", "MONGODB_SSH"})
+DB_SSH_TYPES = frozenset({"MYSQL_SSH", "POSTGRESQL_SSH", "MONGODB_SSH"})
+RSYNC_TYPES = frozenset({"RSYNC_SSH", "RSYNC_NATIVE"})
+# Guards the shared paths_processed list when items are processed in parallel
+# ControlMaster multiplexing makes the 2nd..Nth ssh/rsync connection to the same host
+# reuse the already authenticated channel instead of a full handshake per call
+# ControlPath is kept in /run tmpfs - same place as LOCK_FILE
+SSH_ARGS = "-o BatchMode=yes -o StrictHostKeyChecking=no -o ControlMaster=auto -o ControlPath=/run/rsnapshot_backup-cm-%C -o ControlPersist=60s"
+
+PATHS_PROCESSED_LOCK = threading.Lock()
+PROBE_CACHE_LOCK = threading.Lock()
+# Item key defaults, config values take precedence on merge
+ITEM_DEFAULTS = {
+    "retain_daily": 7,
+    "retain_weekly": 4,
+    "retain_monthly": 3,
+    "connect_user": "root",
+    "validate_hostname": True,
+    "mysql_noevents": False,
+    "postgresql_noclean": False,
+    "postgresql_skip_globals": False,
+    "native_txt_check": False,
+    "native_10h_limit": False,
+    "rsync_args": "",
+    "ignore_remote_dump_failed": False,
+    "dump_attempts": 1,
+    # pigz thread count for remote dump compression, empty lets pigz use all cores
+    "compression_threads": "",
+    # gzip (through pigz when available) or zstd for POSTGRESQL_SSH / MONGODB_SSH dumps
+    "compressor": "gzip",
+    "parallel_dbs": 1,
+    "mysql_dump_skip_unchanged": False,
+    "mongodump_archive": False,
+    "mysqldump_stream": False,
+    "optimize_first_run": False,
+    # Seconds a successful .backup probe stays valid in the probe cache, 0 probes every run
+    "probe_ttl": 0,
+    "skip_if_unchanged": False,
+    # rsync transport compression: zlib (-z, historical default), auto (also -z, rsync >= 3.2
+    # negotiates zstd itself when both ends support it), zstd (forced, both ends must be
+    # rsync >= 3.2 or the transfer aborts) and none for fast local links
+    "rsync_compress": "zlib",
+    "mysql_dump_dir": "/var/backups/mysql",
+    "postgresql_dump_dir": "/var/backups/postgresql",
+    "mongodb_dump_dir": "/var/backups/mongodb",
+    "dump_prefix_cmd": "",
+    "exec_before_dump": "",
+    "exec_after_dump": "",
+    "mysqldump_args": "",
+    "pg_dump_args": "",
+    "pg_dump_filter": "grep -v -e \"pg_dump.*: finished item\" -e \"pg_dump.*: creating\" -e \"pg_dump.*: executing\" -e \"pg_dump.*: last built-in\" -e \"pg_dump.*: reading\" -e \"pg_dump.*: identifying\" -e \"pg_dump.*: finding\" -e \"pg_dump.*: flagging\" -e \"pg_dump.*: saving\" -e \"pg_dump.*: dropping\" -e \"pg_dump.*: dumping\" -e \"pg_dump.*: running\" -e \"pg_dump.*: processing\" >&2",
+    "mongo_args": "",
+    "mongo_secondary_ok": False,
+    "mongodump_skip_tar": False,
+    "xtrabackup_throttle": "20", # 20 MB IO limit by default https://www.percona.com/doc/percona-xtrabackup/2.3/advanced/throttling_backups.html
+    "xtrabackup_parallel": "2",
+    # Use half of the remote cores but at least 2 for dump compression, expanded by the remote shell
+    "xtrabackup_compress_threads": "$(( $(nproc) / 2 > 2 ? $(nproc) / 2 : 2 ))",
+    "xtrabackup_args": "",
+    # Compression algorithm suffix for xtrabackup --compress, e.g. zstd on PXB >= 8.0.30, empty keeps the tool default
+    "xtrabackup_compress": "",
+    "xtrabackup_stream": False,
+    # mariadb-backup is a xtrabackup fork and has the same options
+    "mariadb-backup_throttle": "20",
+    "mariadb-backup_parallel": "2",
+    "mariadb-backup_compress_threads": "$(( $(nproc) / 2 > 2 ? $(nproc) / 2 : 2 ))",
+    "mariadb-backup_args": "",
+    "mysqlsh_connect_args": "",
+    "mysqlsh_args": "",
+    "mysqlsh_max_rate": "20M", # 20 MB IO limit by default
+    "mysqlsh_bytes_per_chunk": "100M",
+    "mysqlsh_threads": "2",
+    "docker_mode": False,
+    "docker_container": "empty",
+    "db_user": None
+}
+
+# rsnapshot conf and helper script templates, dedented once at import
+CONF_ROTATE_TEMPLATE = textwrap.dedent(
+    """\
+    config_version	1.2
+    snapshot_root	{snapshot_root}
+    cmd_cp		/bin/cp
+    cmd_rm		/bin/rm
+    cmd_rsync	/usr/bin/rsync
+    cmd_ssh		/usr/bin/ssh
+    cmd_logger	/usr/bin/logger
+    {retain_hourly_comment}retain		hourly	{retain_hourly}
+    {retain__daily_comment}retain		daily	{retain_daily}
+    {retain_weekly_comment}retain		weekly	{retain_weekly}
+    {retain_monthlycomment}retain		monthly	{retain_monthly}
+    verbose		{verbosity_level}
+    loglevel	3
+    logfile		/opt/sysadmws/rsnapshot_backup/rsnapshot.log
+    lockfile	/opt/sysadmws/rsnapshot_backup/rsnapshot.pid.{number}
+    sync_first	1
+    # any backup definition enough for rotation
+    backup		/etc/		rsnapshot/
+    """
+    )
+
+LOOPBACK_AUTH_SCRIPT = textwrap.dedent(
+    """\
+    #!/bin/bash
+    set -e
+
+    if [[ ! -e /root/.ssh/id_rsa.pub ]]; then
+            ssh-keygen -b 4096 -f /root/.ssh/id_rsa -q -N ''
+    fi
+
+    if [[ ! -e /root/.ssh/authorized_keys ]]; then
+            cat /root/.ssh/id_rsa.pub >> /root/.ssh/authorized_keys
+            chmod 600 /root/.ssh/authorized_keys
+    fi
+
+    if ! grep -q "$(cat /root/.ssh/id_rsa.pub)" /root/.ssh/authorized_keys; then
+            cat /root/.ssh/id_rsa.pub >> /root/.ssh/authorized_keys
+            chmod 600 /root/.ssh/authorized_keys
+    fi
+    """
+    )
+
+CONF_BACKUP_LINE_TEMPLATE_SELF = textwrap.dedent(
+    """\
+    backup		{source}/	rsnapshot/{tab_before_rsync_long_args}{rsync_long_args}
+    """
+    )
+
+CONF_BACKUP_LINE_TEMPLATE_SSH = textwrap.dedent(
+    """\
+    backup		{user}@{host}:{source}/	rsnapshot/{tab_before_rsync_long_args}{rsync_long_args}
+    """
+    )
+
+CONF_SYNC_TEMPLATE = textwrap.dedent(
+    """\
+    config_version	1.2
+    snapshot_root	{snapshot_root}
+    cmd_cp		/bin/cp
+    cmd_rm		/bin/rm
+    cmd_rsync	/usr/bin/rsync
+    cmd_ssh		/usr/bin/ssh
+    cmd_logger	/usr/bin/logger
+    {retain_hourly_comment}retain		hourly	{retain_hourly}
+    {retain__daily_comment}retain		daily	{retain_daily}
+    {retain_weekly_comment}retain		weekly	{retain_weekly}
+    {retain_monthlycomment}retain		monthly	{retain_monthly}
+    verbose		{verbosity_level}
+    loglevel	3
+    logfile		/opt/sysadmws/rsnapshot_backup/rsnapshot.log
+    lockfile	/opt/sysadmws/rsnapshot_backup/rsnapshot.pid.{number}
+    ssh_args	{ssh_args} -p {port}
+    rsync_long_args	-a {rsync_compress_args} {sync_mode_args} --numeric-ids --relative {rsync_verbosity_args} {rsync_args}
+    sync_first	1
+    {conf_backup_lines}
+    """
+    )
+
+CONF_NATIVE_TEMPLATE = textwrap.dedent(
+    """\
+    config_version	1.2
+    snapshot_root	{snapshot_root}
+    cmd_cp		/bin/cp
+    cmd_rm		/bin/rm
+    cmd_rsync	/usr/bin/rsync
+    cmd_ssh		/usr/bin/ssh
+    cmd_logger	/usr/bin/logger
+    {retain_hourly_comment}retain		hourly	{retain_hourly}
+    {retain__daily_comment}retain		daily	{retain_daily}
+    {retain_weekly_comment}retain		weekly	{retain_weekly}
+    {retain_monthlycomment}retain		monthly	{retain_monthly}
+    verbose		{verbosity_level}
+    loglevel	3
+    logfile		/opt/sysadmws/rsnapshot_backup/rsnapshot.log
+    lockfile	/opt/sysadmws/rsnapshot_backup/rsnapshot.pid.{number}
+    rsync_long_args	-a {rsync_compress_args} {sync_mode_args} --no-owner --no-group --numeric-ids --relative --timeout=900 --password-file={passwd} {rsync_verbosity_args} {rsync_args}
+    sync_first	1
+    backup		rsync://{user}@{host}:{port}{source}/		rsnapshot/
+    """
+    )
+
+# Remote dump and cleanup script templates, dedented once at import
+MYSQL_XTRABACKUP_STREAM_SCRIPT = textwrap.dedent(
+    """\
+    #!/bin/bash
+    set -e
+    set -o pipefail
+    mkdir -p {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}
+    find {snapshot_root}/.sync/rsnapshot{mysql_dump_dir} -type f -name "*.xbstream.partial" -delete
+    find {snapshot_root}/.sync/rsnapshot{mysql_dump_dir} -type f -name "*.xbstream" -mmin +{mmin} -delete
+    if [[ ! -f {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}/{stream_file} ]]; then
+        ssh {ssh_args} -p {port} {user}@{host} '{dump_prefix_cmd} xtrabackup --backup --stream=xbstream --compress{xtrabackup_compress_arg} --throttle={xtrabackup_throttle} --parallel={xtrabackup_parallel} --compress-threads={xtrabackup_compress_threads} --target-dir=/tmp {stream_databases_arg} {xtrabackup_args} 2>/dev/null' > {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}/{stream_file}.partial
+        mv {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}/{stream_file}.partial {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}/{stream_file}
+    else
+        echo "NOTICE: Valid dump already exists, skipping"
+    fi
+    """
+)
+
+MYSQL_XTRABACKUP_DUMP_ALL_PART = textwrap.dedent(
+    """\
+    WAS_ERR=0
+    set +e
+    if [[ ! -d {mysql_dump_dir}/all.xtrabackup ]]; then
+            {exec_before_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
+                {dump_prefix_cmd} xtrabackup --backup --compress{xtrabackup_compress_arg} --throttle={xtrabackup_throttle} --parallel={xtrabackup_parallel} --compress-threads={xtrabackup_compress_threads} --target-dir={mysql_dump_dir}/all.xtrabackup {databases_exclude} {xtrabackup_args} 2>&1 | {xtrabackup_output_filter}
+                if [[ $? -ne 0 ]]; then
+                    WAS_ERR=1
+                    echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                else
+                    echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                    break
+                fi
+            done
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            {exec_after_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+    else
+        echo "NOTICE: Valid dump already exists, skipping"
+    fi
+    set -e
+    if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
+    """
+)
+
+MYSQL_XTRABACKUP_DUMP_ONE_PART = textwrap.dedent(
+    """\
+    WAS_ERR=0
+    set +e
+    if [[ ! -d {mysql_dump_dir}/{source}.xtrabackup ]]; then
+            {exec_before_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
+                {dump_prefix_cmd} xtrabackup --backup --compress{xtrabackup_compress_arg} --throttle={xtrabackup_throttle} --parallel={xtrabackup_parallel} --compress-threads={xtrabackup_compress_threads} --target-dir={mysql_dump_dir}/{source}.xtrabackup --databases={source} {xtrabackup_args} 2>&1 | {xtrabackup_output_filter}
+                if [[ $? -ne 0 ]]; then
+                    WAS_ERR=1
+                    echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                else
+                    echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                    break
+                fi
+            done
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            {exec_after_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+    else
+        echo "NOTICE: Valid dump already exists, skipping"
+    fi
+    set -e
+    if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
+    """
+)
+
+MYSQL_XTRABACKUP_SCRIPT = textwrap.dedent(
+    """\
+    #!/bin/bash
+    set -e
+
+    ssh {ssh_args} -p {port} {user}@{host} '
+        set -x
+        set -e
+        set -o pipefail
+        mkdir -p {mysql_dump_dir}
+        chmod 700 {mysql_dump_dir}
+        exec 9>{mysql_dump_dir}/dump.flock
+        flock -x 9
+        cd {mysql_dump_dir}
+        find {mysql_dump_dir} -type d -name "*.xtrabackup" -mmin +{mmin} -exec rm -rf {{}} +
+        {script_dump_part}
+    '
+    """
+)
+
+MARIADB_BACKUP_DUMP_ALL_PART = textwrap.dedent(
+    """\
+    WAS_ERR=0
+    set +e
+    if [[ ! -d {mysql_dump_dir}/all.mariadb-backup ]]; then
+            {exec_before_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
+                {dump_prefix_cmd} mariadb-backup --backup --compress --throttle={mariadb_backup_throttle} --parallel={mariadb_backup_parallel} --compress-threads={mariadb_backup_compress_threads} --target-dir={mysql_dump_dir}/all.mariadb-backup {databases_exclude} {mariadb_backup_args} 2>&1 | {mariadb_backup_output_filter}
+                if [[ $? -ne 0 ]]; then
+                    WAS_ERR=1
+                    echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                else
+                    echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                    break
+                fi
+            done
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            {exec_after_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+    else
+        echo "NOTICE: Valid dump already exists, skipping"
+    fi
+    set -e
+    if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
+    """
+)
+
+MARIADB_BACKUP_DUMP_ONE_PART = textwrap.dedent(
+    """\
+    WAS_ERR=0
+    set +e
+    if [[ ! -d {mysql_dump_dir}/{source}.mariadb-backup ]]; then
+            {exec_before_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
+                {dump_prefix_cmd} mariadb-backup --backup --compress --throttle={mariadb_backup_throttle} --parallel={mariadb_backup_parallel} --compress-threads={mariadb_backup_compress_threads} --target-dir={mysql_dump_dir}/{source}.mariadb-backup --databases={source} {mariadb_backup_args} 2>&1 | {mariadb_backup_output_filter}
+                if [[ $? -ne 0 ]]; then
+                    WAS_ERR=1
+                    echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                else
+                    echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                    break
+                fi
+            done
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            {exec_after_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+    else
+        echo "NOTICE: Valid dump already exists, skipping"
+    fi
+    set -e
+    if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
+    """
+)
+
+MARIADB_BACKUP_SCRIPT = textwrap.dedent(
+    """\
+    #!/bin/bash
+    set -e
+
+    ssh {ssh_args} -p {port} {user}@{host} '
+        set -x
+        set -e
+        set -o pipefail
+        mkdir -p {mysql_dump_dir}
+        chmod 700 {mysql_dump_dir}
+        exec 9>{mysql_dump_dir}/dump.flock
+        flock -x 9
+        cd {mysql_dump_dir}
+        find {mysql_dump_dir} -type d -name "*.mariadb-backup" -mmin +{mmin} -exec rm -rf {{}} +
+        {script_dump_part}
+    '
+    """
+)
+
+MYSQLSH_DUMP_ALL_PART = textwrap.dedent(
+    """\
+    WAS_ERR=0
+    set +e
+    if [[ ! -d {mysql_dump_dir}/all.mysqlsh ]]; then
+            {exec_before_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
+                {dump_prefix_cmd} mysqlsh {mysqlsh_connect_args} -- util dump-instance {mysql_dump_dir}/all.mysqlsh --maxRate={mysqlsh_max_rate} --bytesPerChunk={mysqlsh_bytes_per_chunk} --threads={mysqlsh_threads} {databases_exclude} {mysqlsh_args} 2>&1 | {mysqlsh_output_filter}
+                if [[ $? -ne 0 ]]; then
+                    WAS_ERR=1
+                    echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                else
+                    echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                    break
+                fi
+            done
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            {exec_after_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+    else
+        echo "NOTICE: Valid dump already exists, skipping"
+    fi
+    set -e
+    if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
+    """
+)
+
+MYSQLSH_DUMP_ONE_PART = textwrap.dedent(
+    """\
+    WAS_ERR=0
+    set +e
+    if [[ ! -d {mysql_dump_dir}/{source}.mysqlsh ]]; then
+            {exec_before_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
+                {dump_prefix_cmd} mysqlsh {mysqlsh_connect_args} -- util dump-schemas {source} --outputUrl={mysql_dump_dir}/{source}.mysqlsh --maxRate={mysqlsh_max_rate} --bytesPerChunk={mysqlsh_bytes_per_chunk} --threads={mysqlsh_threads} {mysqlsh_args} 2>&1 | {mysqlsh_output_filter}
+                if [[ $? -ne 0 ]]; then
+                    WAS_ERR=1
+                    echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                else
+                    echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                    break
+                fi
+            done
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            {exec_after_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+    else
+        echo "NOTICE: Valid dump already exists, skipping"
+    fi
+    set -e
+    if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
+    """
+)
+
+MYSQLSH_SCRIPT = textwrap.dedent(
+    """\
+    #!/bin/bash
+    set -e
+
+    ssh {ssh_args} -p {port} {user}@{host} '
+        set -x
+        set -e
+        set -o pipefail
+        mkdir -p {mysql_dump_dir}
+        chmod 700 {mysql_dump_dir}
+        exec 9>{mysql_dump_dir}/dump.flock
+        flock -x 9
+        cd {mysql_dump_dir}
+        find {mysql_dump_dir} -type d -name "*.mysqlsh" -mmin +{mmin} -exec rm -rf {{}} +
+        {script_dump_part}
+    '
+    """
+)
+
+MYSQL_DOCKER_DUMP_ALL_PART = textwrap.dedent(
+    """\
+    docker exec {container} sh -lc 'mysql -u"$MYSQL_USER" -p"$MYSQL_PASSWORD" --skip-column-names --batch -e "SHOW DATABASES;"' | grep -v -e information_schema -e performance_schema {grep_db_filter} > {mysql_dump_dir}/db_list.txt
+    WAS_ERR=0
+    for db in $(cat {mysql_dump_dir}/db_list.txt); do
+            set +e
+            if [[ ! -f {mysql_dump_dir}/$db.gz ]]; then
+                    {exec_before_dump}
+                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+                    for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
+                        docker exec {container} sh -lc '{dump_prefix_cmd} mysqldump -u"$MYSQL_USER" -p"$MYSQL_PASSWORD" --force --opt --single-transaction --quick --skip-lock-tables {mysql_events} --databases $1 --max_allowed_packet=1G {mysqldump_args}' -- $db | $GZIP_CMD > {mysql_dump_dir}/$db.gz
+                        if [[ $? -ne 0 ]]; then
+                            WAS_ERR=1
+                            echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                        else
+                            echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                            break
+                        fi
+                    done
+                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+                    {exec_after_dump}
+                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            else
+                echo "NOTICE: Valid dump already exists, skipping"
+            fi
+            set -e
+    done
+    if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
+    """
+)
+
+MYSQL_DOCKER_DUMP_ONE_PART = textwrap.dedent(
+    """\
+    WAS_ERR=0
+    set +e
+    if [[ ! -f {mysql_dump_dir}/{source}.gz ]]; then
+            {exec_before_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
+                docker exec {container} sh -lc '{dump_prefix_cmd} mysqldump -u"$MYSQL_USER" -p"$MYSQL_PASSWORD" --force --opt --single-transaction --quick --skip-lock-tables {mysql_events} --databases {source} --max_allowed_packet=1G {mysqldump_args}' | $GZIP_CMD > {mysql_dump_dir}/{source}.gz
+                if [[ $? -ne 0 ]]; then
+                    WAS_ERR=1
+                    echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                else
+                    echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                    break
+                fi
+            done
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            {exec_after_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+    else
+        echo "NOTICE: Valid dump already exists, skipping"
+    fi
+    set -e
+    if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
+    """
+)
+
+MYSQL_DOCKER_SCRIPT = textwrap.dedent(
+    """\
+    #!/bin/bash
+    set -e
+
+    ssh {ssh_args} -p {port} {user}@{host} bash -se <<'EOF'
+        set -x
+        set -e
+        set -o pipefail
+        GZIP_CMD="$(command -v pigz > /dev/null && echo "pigz{pigz_threads_arg} --rsyncable" || (echo | gzip --rsyncable > /dev/null 2>&1 && echo "gzip --rsyncable" || echo gzip))"
+        mkdir -p {mysql_dump_dir}
+        chmod 700 {mysql_dump_dir}
+        exec 9>{mysql_dump_dir}/dump.flock
+        flock -x 9
+        cd {mysql_dump_dir}
+        find {mysql_dump_dir} -type f -name "*.gz" -mmin +{mmin} -delete
+        {script_dump_part}
+    EOF
+    """
+)
+
+MYSQL_DUMP_ALL_PART = textwrap.dedent(
+    """\
+    mysql --defaults-file=/etc/mysql/debian.cnf --skip-column-names --batch -e "SHOW DATABASES;" | grep -v -e information_schema -e performance_schema {grep_db_filter} > {mysql_dump_dir}/db_list.txt
+    dump_one() {{
+            set +e
+            set -o pipefail
+            db=$1
+            WAS_ERR=0
+            {skip_unchanged_part}
+            if [[ ! -f {mysql_dump_dir}/$db.gz ]]; then
+                    {exec_before_dump}
+                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+                    for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
+                        {dump_prefix_cmd} mysqldump --defaults-file=/etc/mysql/debian.cnf --force --opt --single-transaction --quick --skip-lock-tables {mysql_events} --databases $db --max_allowed_packet=1G {mysqldump_args} | $GZIP_CMD > {mysql_dump_dir}/$db.gz
+                        if [[ $? -ne 0 ]]; then
+                            WAS_ERR=1
+                            echo "ERROR: Dump of $db failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                        else
+                            echo "NOTICE: Dump of $db succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                            break
+                        fi
+                    done
+                    {exec_after_dump}
+                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            else
+                echo "NOTICE: Valid dump of $db already exists, skipping"
+            fi
+            {sig_write_part}
+            if [[ $WAS_ERR -ne 0 ]]; then return 1; fi
+    }}
+    export -f dump_one
+    export GZIP_CMD
+    xargs -a {mysql_dump_dir}/db_list.txt -P {parallel_dbs} -I @DB@ bash -c "dump_one @DB@"
+    """
+)
+
+MYSQL_DUMP_ONE_PART = textwrap.dedent(
+    """\
+    WAS_ERR=0
+    set +e
+    {skip_unchanged_part}
+    if [[ ! -f {mysql_dump_dir}/{source}.gz ]]; then
+            {exec_before_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
+                {dump_prefix_cmd} mysqldump --defaults-file=/etc/mysql/debian.cnf --force --opt --single-transaction --quick --skip-lock-tables {mysql_events} --databases {source} --max_allowed_packet=1G {mysqldump_args} | $GZIP_CMD > {mysql_dump_dir}/{source}.gz
+                if [[ $? -ne 0 ]]; then
+                    WAS_ERR=1
+                    echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                else
+                    echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                    break
+                fi
+            done
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            {exec_after_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+    else
+        echo "NOTICE: Valid dump already exists, skipping"
+    fi
+    {sig_write_part}
+    set -e
+    if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
+    """
+)
+
+MYSQL_STREAM_SCRIPT = textwrap.dedent(
+    """\
+    #!/bin/bash
+    set -e
+    set -o pipefail
+    mkdir -p {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}
+    find {snapshot_root}/.sync/rsnapshot{mysql_dump_dir} -type f -name "*.gz.partial" -delete
+    find {snapshot_root}/.sync/rsnapshot{mysql_dump_dir} -type f -name "*.gz" -mmin +{mmin} -delete
+    GZIP_CMD=$(ssh {ssh_args} -p {port} {user}@{host} 'command -v pigz > /dev/null && echo "pigz --rsyncable" || (echo | gzip --rsyncable > /dev/null 2>&1 && echo "gzip --rsyncable" || echo gzip)')
+    {stream_dump_part}
+    """
+)
+
+MYSQL_STREAM_DUMP_ALL_PART = textwrap.dedent(
+    """\
+    ssh {ssh_args} -p {port} {user}@{host} 'mysql --defaults-file=/etc/mysql/debian.cnf --skip-column-names --batch -e "SHOW DATABASES;"' | grep -v -e information_schema -e performance_schema {grep_db_filter} > {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}/db_list.txt
+    WAS_ERR=0
+    for db in $(cat {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}/db_list.txt); do
+            set +e
+            if [[ ! -f {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}/$db.gz ]]; then
+                    ssh {ssh_args} -p {port} {user}@{host} 'set -o pipefail; {dump_prefix_cmd} mysqldump --defaults-file=/etc/mysql/debian.cnf --force --opt --single-transaction --quick --skip-lock-tables {mysql_events} --databases '"$db"' --max_allowed_packet=1G {mysqldump_args} | '"$GZIP_CMD" > {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}/$db.gz.partial
+                    if [[ $? -ne 0 ]]; then
+                        WAS_ERR=1
+                        echo "ERROR: Streamed dump of $db failed"
+                    else
+                        mv {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}/$db.gz.partial {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}/$db.gz
+                        echo "NOTICE: Streamed dump of $db succeeded"
+                    fi
+            else
+                echo "NOTICE: Valid dump already exists, skipping"
+            fi
+            set -e
+    done
+    if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
+    """
+)
+
+MYSQL_STREAM_DUMP_ONE_PART = textwrap.dedent(
+    """\
+    WAS_ERR=0
+    set +e
+    if [[ ! -f {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}/{source}.gz ]]; then
+            ssh {ssh_args} -p {port} {user}@{host} 'set -o pipefail; {dump_prefix_cmd} mysqldump --defaults-file=/etc/mysql/debian.cnf --force --opt --single-transaction --quick --skip-lock-tables {mysql_events} --databases {source} --max_allowed_packet=1G {mysqldump_args} | '"$GZIP_CMD" > {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}/{source}.gz.partial
+            if [[ $? -ne 0 ]]; then
+                WAS_ERR=1
+                echo "ERROR: Streamed dump of {source} failed"
+            else
+                mv {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}/{source}.gz.partial {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}/{source}.gz
+                echo "NOTICE: Streamed dump of {source} succeeded"
+            fi
+    else
+        echo "NOTICE: Valid dump already exists, skipping"
+    fi
+    set -e
+    if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
+    """
+)
+
+MYSQL_SKIP_UNCHANGED_PART = textwrap.dedent(
+    """\
+    cur_sig=$(mysql --defaults-file=/etc/mysql/debian.cnf --skip-column-names --batch -e "SET SESSION group_concat_max_len = 1000000; SELECT COALESCE(GROUP_CONCAT(TABLE_NAME, ':', COALESCE(UPDATE_TIME, ''), ':', COALESCE(TABLE_ROWS, ''), ':', COALESCE(DATA_LENGTH, ''), ':', COALESCE(AUTO_INCREMENT, '') ORDER BY TABLE_NAME), '') FROM information_schema.tables WHERE TABLE_SCHEMA = '{db}'")
+    prev_sig=$(cat {mysql_dump_dir}/{db}.sig 2> /dev/null)
+    if [[ -n "$cur_sig" && "$cur_sig" == "$prev_sig" && -f {mysql_dump_dir}/{db}.gz ]]; then
+            echo "NOTICE: Signature of {db} unchanged since last dump, skipping"
+            {skip_action}
+    fi
+    rm -f {mysql_dump_dir}/{db}.gz
+    """
+)
+
+# .sig is written via tmp + mv so a parallel dump_one or an interrupted run never leaves a torn signature
+MYSQL_SIG_WRITE_PART = 'if [[ $WAS_ERR -eq 0 ]]; then echo "$cur_sig" > {mysql_dump_dir}/{db}.sig.tmp && mv {mysql_dump_dir}/{db}.sig.tmp {mysql_dump_dir}/{db}.sig; fi'
+
+MYSQL_SCRIPT = textwrap.dedent(
+    """\
+    #!/bin/bash
+    set -e
+
+    ssh {ssh_args} -p {port} {user}@{host} bash -se <<'EOF'
+        set -x
+        set -e
+        set -o pipefail
+        GZIP_CMD="$(command -v pigz > /dev/null && echo "pigz{pigz_threads_arg} --rsyncable" || (echo | gzip --rsyncable > /dev/null 2>&1 && echo "gzip --rsyncable" || echo gzip))"
+        mkdir -p {mysql_dump_dir}
+        chmod 700 {mysql_dump_dir}
+        exec 9>{mysql_dump_dir}/dump.flock
+        flock -x 9
+        cd {mysql_dump_dir}
+        find {mysql_dump_dir} -type f -name "*.gz" -mmin +{mmin} -delete
+        {script_dump_part}
+    EOF
+    """
+)
+
+POSTGRESQL_DUMP_ALL_PART = textwrap.dedent(
+    """\
+    {pg_run} "echo SELECT datname FROM pg_database | psql {pg_user} --no-align -t template1" {grep_db_filter} | grep -v -e template0 -e template1 > {postgresql_dump_dir}/db_list.txt
+    WAS_ERR=0
+    for db in $(cat {postgresql_dump_dir}/db_list.txt); do
+            set +e
+            if [[ ! {if_exists_part} ]]; then
+                    {mkdir_chown_part}
+                    {exec_before_dump}
+                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+                    for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
+                        {pg_run} "{dump_prefix_cmd} pg_dump {pg_user} --create {postgresql_clean} {pg_dump_args} {pg_dump_format_part} --verbose $db" 2> >({pg_dump_filter}) {pg_dump_line_pipe_part}
+                        if [[ $? -ne 0 ]]; then
+                            WAS_ERR=1
+                            echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                        else
+                            echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                            break
+                        fi
+                    done
+                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+                    {exec_after_dump}
+                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            else
+                echo "NOTICE: Valid dump already exists, skipping"
+            fi
+            set -e
+    done
+    if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
+    """
+)
+
+POSTGRESQL_DUMP_ONE_PART = textwrap.dedent(
+    """\
+    WAS_ERR=0
+    set +e
+    if [[ ! {if_exists_part} ]]; then
+            {mkdir_chown_part}
+            {exec_before_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
+                {pg_run} "{dump_prefix_cmd} pg_dump {pg_user} --create {postgresql_clean} {pg_dump_args} {pg_dump_format_part} --verbose {source}" 2> >({pg_dump_filter}) {pg_dump_line_pipe_part}
+                if [[ $? -ne 0 ]]; then
+                    WAS_ERR=1
+                    echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                else
+                    echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                    break
+                fi
+            done
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            {exec_after_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+    else
+        echo "NOTICE: Valid dump already exists, skipping"
+    fi
+    set -e
+    if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
+    """
+)
+
+POSTGRESQL_SCRIPT = textwrap.dedent(
+    """\
+    #!/bin/bash
+    set -e
+
+    ssh {ssh_args} -p {port} {user}@{host} '
+        set -x
+        set -e
+        set -o pipefail
+        COMPRESS_CMD={compress_cmd}
+        mkdir -p {postgresql_dump_dir}
+        chmod 700 {postgresql_dump_dir}
+        {chown_part}
+        exec 9>{postgresql_dump_dir}/dump.flock
+        flock -x 9
+        cd {postgresql_dump_dir}
+        find {postgresql_dump_dir} {find_part} -mmin +{mmin} -exec rm -rf {{}} +
+        {exec_before_dump}
+        {pg_dumpall_part}
+        {exec_after_dump}
+        {script_dump_part}
+    '
+    """
+)
+
+POSTGRESQL_DUMPALL_PART = textwrap.dedent(
+    """\
+    rm -f {postgresql_dump_dir}/globals.*.tmp
+    find {postgresql_dump_dir} -maxdepth 1 -type f -name "globals.{dump_ext}" -mmin +{mmin} -delete
+    if [[ ! -f {postgresql_dump_dir}/globals.{dump_ext} ]]; then
+            {pg_run} "pg_dumpall {pg_user} --clean --if-exists --schema-only --verbose" 2> >({pg_dump_filter}) | $COMPRESS_CMD > {postgresql_dump_dir}/globals.{dump_ext}.tmp
+            mv {postgresql_dump_dir}/globals.{dump_ext}.tmp {postgresql_dump_dir}/globals.{dump_ext}
+    fi
+    """
+)
+
+MONGODB_SHOW_DBS_SECONDARY_OK_PART = textwrap.dedent(
+    """\
+    echo "db.getMongo().setSecondaryOk()
+    show dbs" """
+)
+
+MONGODB_TAR_ALL_PART = textwrap.dedent(
+    """\
+    tar cvf - $db | $COMPRESS_CMD > {mongodb_dump_dir}/$db.tar.{dump_ext}
+    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+    rm -rf {mongodb_dump_dir}/$db
+    """
+)
+
+MONGODB_DUMP_ALL_PART = textwrap.dedent(
+    """\
+    if command -v mongo >/dev/null 2>&1; then
+            {show_dbs_part} | mongo --quiet {mongo_args} | cut -f1 -d" " | grep -v -e local {grep_db_filter} > {mongodb_dump_dir}/db_list.txt
+    else                    
+            mongosh --quiet --eval "db.adminCommand({listDatabases}).databases.forEach(d=>print(d.name))" {mongo_args} | cut -f1 -d" " | grep -v -e local {grep_db_filter} > {mongodb_dump_dir}/db_list.txt
+    fi 
+    WAS_ERR=0
+    for db in $(cat {mongodb_dump_dir}/db_list.txt); do
+            set +e
+            if [[ ! -f {mongodb_dump_dir}/$db.{dump_file_ext} ]]; then
+                    {exec_before_dump}
+                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+                    for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
+                        {dump_prefix_cmd} mongodump --quiet {mongodump_args} {mongodump_output_part} --dumpDbUsersAndRoles --db $db
+                        if [[ $? -ne 0 ]]; then
+                            WAS_ERR=1
+                            echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                        else
+                            echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                            break
+                        fi
+                    done
+                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+                    cd {mongodb_dump_dir}
+                    {tar_part}
+                    {exec_after_dump}
+                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            else
+                echo "NOTICE: Valid dump already exists, skipping"
+            fi
+            set -e
+    done
+    if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
+    """
+)
+
+MONGODB_TAR_ONE_PART = textwrap.dedent(
+    """\
+    tar cvf - {source} | $COMPRESS_CMD > {mongodb_dump_dir}/{source}.tar.{dump_ext}
+    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+    rm -rf {mongodb_dump_dir}/{source}
+    """
+)
+
+# Archive mode publish: mongodump writes the stream to a .tmp first, an interrupted dump
+# never leaves a truncated .archive.gz that would satisfy the ! -f guard until mmin expiry
+MONGODB_ARCHIVE_PUBLISH_ALL_PART = 'if [[ $WAS_ERR -eq 0 ]]; then mv {mongodb_dump_dir}/$db.archive.gz.tmp {mongodb_dump_dir}/$db.archive.gz; else rm -f {mongodb_dump_dir}/$db.archive.gz.tmp; fi'
+
+MONGODB_ARCHIVE_PUBLISH_ONE_PART = 'if [[ $WAS_ERR -eq 0 ]]; then mv {mongodb_dump_dir}/{source}.archive.gz.tmp {mongodb_dump_dir}/{source}.archive.gz; else rm -f {mongodb_dump_dir}/{source}.archive.gz.tmp; fi'
+
+MONGODB_DUMP_ONE_PART = textwrap.dedent(
+    """\
+    WAS_ERR=0
+    set +e
+    if [[ ! -f {mongodb_dump_dir}/{source}.{dump_file_ext} ]]; then
+            {exec_before_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
+                {dump_prefix_cmd} mongodump --quiet {mongodump_args} {mongodump_output_part} --dumpDbUsersAndRoles --db {source}
+                if [[ $? -ne 0 ]]; then
+                    WAS_ERR=1
+                    echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                else
+                    echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
+                    break
+                fi
+            done
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+            cd {mongodb_dump_dir}
+            {tar_part}
+            {exec_after_dump}
+            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
+    else
+        echo "NOTICE: Valid dump already exists, skipping"
+    fi
+    set -e
+    if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
+    """
+)
+
+MONGODB_SCRIPT = textwrap.dedent(
+    """\
+    #!/bin/bash
+    set -e
+
+    ssh {ssh_args} -p {port} {user}@{host} '
+        set -x
+        set -e
+        set -o pipefail
+        COMPRESS_CMD={compress_cmd}
+        mkdir -p {mongodb_dump_dir}
+        chmod 700 {mongodb_dump_dir}
+        exec 9>{mongodb_dump_dir}/dump.flock
+        flock -x 9
+        cd {mongodb_dump_dir}
+        find {mongodb_dump_dir} -type f \( -name "*.tar.gz" -o -name "*.tar.zst" -o -name "*.archive.gz" \) -mmin +{mmin} -delete
+        find {mongodb_dump_dir} -type f -name "*.archive.gz.tmp" -delete
+        {script_dump_part}
+    '
+    """
+)
+
 DATA_EXPAND = {
     "UBUNTU": ["/etc","/home","/root","/var/spool/cron","/var/lib/dpkg","/usr/local","/opt/sysadmws","/opt/microdevops"],
     "DEBIAN": ["/etc","/home","/root","/var/spool/cron","/var/lib/dpkg","/usr/local","/opt/sysadmws","/opt/microdevops"],
@@ -38,23 +934,39 @@ DATA_EXPAND = {
 
 # Functions
 
-def log_and_print(kind, text, logger):
+def log_and_print(kind, text, logger, *text_args):
+    # Optional %-style args are passed to the logger as is so record formatting stays lazy,
+    # and are rendered once here for the stderr copy
+    # Both kinds log at INFO, so one isEnabledFor check skips record creation entirely
+    # when the logger is throttled above it
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(text, *text_args)
+    if text_args:
+        text = text % text_args
     # Replace words that trigger error detection in pipelines
     text_safe = text.replace("False", "F_alse")
-    if kind == "NOTICE":
-        logger.info(text)
-    if kind == "ERROR":
-        logger.info(text)
-    sys.stderr.write(datetime.now().strftime("%F %T"))
-    sys.stderr.write(" {kind}: ".format(kind=kind))
-    sys.stderr.write(text_safe)
-    sys.stderr.write("\n")
-
-def run_cmd(cmd):
-
-    process = subprocess.Popen(cmd, shell=True, executable="/bin/bash")
+    # Compose the line once and issue a single write to keep output atomic and syscalls down
+    sys.stderr.write("{timestamp} {kind}: {text}\n".format(timestamp=time.strftime("%Y-%m-%d %H:%M:%S"), kind=kind, text=text_safe))
+
+def run_cmd(cmd, timeout=None):
+
+    # List commands are executed directly, string commands (scripts, pipelines) still need bash
+    # With a timeout the command gets its own process group so the whole shell pipeline can be
+    # signalled, not just the shell - the job timeout(1) used to do for the 10h limit
+    if isinstance(cmd, list):
+        process = subprocess.Popen(cmd, cwd=WORK_DIR, start_new_session=timeout is not None)
+    else:
+        process = subprocess.Popen(cmd, shell=True, executable="/bin/bash", cwd=WORK_DIR, start_new_session=timeout is not None)
     try:
-        process.communicate(None)
+        process.communicate(None, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # SIGTERM the group, allow 60s to clean up, then SIGKILL - the grace timeout -k 60 gave
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(60)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
     except:
         process.kill()
         process.wait()
@@ -66,2707 +978,2216 @@ def run_cmd(cmd):
 
 def run_cmd_pipe(cmd):
 
-    process = subprocess.Popen(cmd, shell=True, executable="/bin/bash", stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    try:
-        stdout, stderr = process.communicate(None)
-    except:
-        process.kill()
-        process.wait()
-        raise
-
-    retcode = process.poll()
-    stdout = stdout.decode()
-    stderr = stderr.decode()
-
-    return retcode, stdout, stderr
+    # PIPE for both streams with encoding decodes in one pass without keeping intermediate
+    # bytes (capture_output is 3.7+, CentOS 7 ships 3.6), errors="replace" keeps weird
+    # remote output from raising mid-pipeline
+    if isinstance(cmd, list):
+        completed = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8", errors="replace", cwd=WORK_DIR)
+    else:
+        completed = subprocess.run(cmd, shell=True, executable="/bin/bash", stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8", errors="replace", cwd=WORK_DIR)
 
-# Main
+    return completed.returncode, completed.stdout, completed.stderr
 
-if __name__ == "__main__":
+def load_probe_cache():
 
-    # Set default encoding for python 2.x (no need in python 3.x)
-    if sys.version_info[0] < 3:
-        reload(sys)
-        sys.setdefaultencoding("utf-8")
+    try:
+        with open(PROBE_CACHE_FILE, "r") as probe_cache_file:
+            return json.load(probe_cache_file)
+    except (IOError, OSError, ValueError):
+        return {}
+
+def save_probe_cache_entry(probe_cache_key):
+
+    # Parallel workers update the shared cache file under a lock, published atomically
+    with PROBE_CACHE_LOCK:
+        probe_cache = load_probe_cache()
+        probe_cache[probe_cache_key] = time.time()
+        write_file_if_changed(PROBE_CACHE_FILE, json.dumps(probe_cache))
+
+@functools.lru_cache(maxsize=None)
+def rsync_compress_choice_supported():
+
+    # --compress-choice needs rsync >= 3.2, probed once per run
+    retcode, stdout, stderr = run_cmd_pipe(["rsync", "--version"])
+    if retcode == 0:
+        match = re.search(r"version\s+(\d+)\.(\d+)", stdout)
+        if match and (int(match.group(1)), int(match.group(2))) >= (3, 2):
+            return True
+    return False
+
+@functools.lru_cache(maxsize=None)
+def build_grep_db_filter(databases_to_exclude):
+
+    # Many items usually share the same exclude list, so the assembled pipe is cached
+    # -F because database names are literal strings, not regexes
+    if not databases_to_exclude:
+        return ""
+    return "| grep -v -F " + " ".join("-e {db_to_exclude}".format(db_to_exclude=db_to_exclude) for db_to_exclude in databases_to_exclude)
+
+def write_file_if_changed(file_path, content):
+
+    # Skip the write (and the resulting mtime/fsync churn) when the file already has the wanted content
+    try:
+        with open(file_path, "r") as existing_file:
+            if existing_file.read() == content:
+                return
+    except (IOError, OSError):
+        pass
+    # O_CREAT with 0600 sets the mode at create time - generated confs carry ssh options
+    # and passwd files carry rsyncd credentials, no window with wider permissions
+    # The temp file + fsync + os.replace publish means a crash mid-write or a concurrent
+    # rsnapshot read never sees a half-written file
+    tmp_file_path = "{file_path}.tmp.{pid}".format(file_path=file_path, pid=os.getpid())
+    fd = os.open(tmp_file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.write(fd, content.encode("utf-8"))
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp_file_path, file_path)
+
+def load_yaml_config(config_file_path, logger):
+
+    # YAML parsing dominates startup on large configs, so the parsed config is cached
+    # in a pickle sidecar keyed by a hash of the raw config bytes
+    with open(config_file_path, 'rb') as yaml_file:
+        config_bytes = yaml_file.read()
+    config_hash = hashlib.blake2b(config_bytes, digest_size=16).hexdigest()
+    cache_file_path = "{config_file_path}.cache.pkl".format(config_file_path=config_file_path)
+
+    # Load cache only if it was built from exactly the same config bytes
+    try:
+        with open(cache_file_path, 'rb') as cache_file:
+            cached_hash, config = pickle.load(cache_file)
+        if cached_hash == config_hash:
+            logger.info("Loaded config from cache {cache_file_path}".format(cache_file_path=cache_file_path))
+            return config
+    except (IOError, OSError, pickle.UnpicklingError, EOFError, ValueError, AttributeError):
+        pass
 
-    # Set logger
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging.DEBUG)
-    if not os.path.isdir(LOG_DIR):
-        os.mkdir(LOG_DIR, 0o755)
-    log_handler = RotatingFileHandler("{0}/{1}".format(LOG_DIR, LOG_FILE), maxBytes=10485760, backupCount=10, encoding="utf-8")
-    os.chmod("{0}/{1}".format(LOG_DIR, LOG_FILE), 0o600)
-    log_handler.setLevel(logging.DEBUG)
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.ERROR)
-    formatter = logging.Formatter(fmt='%(asctime)s %(filename)s %(name)s %(process)d/%(threadName)s %(levelname)s: %(message)s', datefmt="%Y-%m-%d %H:%M:%S %Z")
-    log_handler.setFormatter(formatter)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(log_handler)
-    logger.addHandler(console_handler)
+    config = yaml.load(config_bytes, Loader=YAML_SAFE_LOADER)
 
-    # Set parser and parse args
+    # Save cache atomically, ignore save errors - cache is optional
+    try:
+        cache_tmp_file_path = "{cache_file_path}.tmp".format(cache_file_path=cache_file_path)
+        with open(cache_tmp_file_path, 'wb') as cache_file:
+            pickle.dump((config_hash, config), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_tmp_file_path, cache_file_path)
+    except (IOError, OSError, pickle.PicklingError):
+        pass
 
-    parser = argparse.ArgumentParser(description="{LOGO} functions.".format(LOGO=LOGO))
+    return config
 
-    parser.add_argument("--debug", dest="debug", help="enable debug", action="store_true")
-    parser.add_argument("--config", dest="config", help="override config")
-    parser.add_argument("--item-number", dest="item_number", help="run only for config item NUMBER", nargs=1, metavar=("NUMBER"))
-    parser.add_argument("--host", dest="host", help="run only for items with HOST", nargs=1, metavar=("HOST"))
-    parser.add_argument("--ignore-lock", dest="ignore_lock", help="ignore locking to allow many instances of rsnapshot_backup.py in the same time (use only for testing)", action="store_true")
+def process_item(item, args, SELF_HOSTNAME, logger, paths_processed, rotate_command):
 
-    group = parser.add_mutually_exclusive_group(required=True)
-    group.add_argument("--sync", dest="sync", help="prepare rsnapshot configs and run sync, we use sync_first rsnapshot option", action="store_true")
-    group.add_argument("--rotate-hourly", dest="rotate_hourly", help="prepare rsnapshot configs and run hourly rotate", action="store_true")
-    group.add_argument("--rotate-daily", dest="rotate_daily", help="prepare rsnapshot configs and run daily rotate", action="store_true")
-    group.add_argument("--rotate-weekly", dest="rotate_weekly", help="prepare rsnapshot configs and run weekly rotate", action="store_true")
-    group.add_argument("--rotate-monthly", dest="rotate_monthly", help="prepare rsnapshot configs and run monthly rotate", action="store_true")
-    group.add_argument("--check", dest="check", help="run checks for rsnapshot backups", action="store_true")
+    # Per item error/ok counters are local to the worker and merged by the caller
+    errors = 0
+    oks = 0
 
-    if len(sys.argv) > 1:
-        args = parser.parse_args()
-    else:
-        parser.print_help()
-        sys.exit(1)
+    # The item number is interpolated into nearly every log line and template below
+    number = item["number"]
 
-    # Enable debug
-    if args.debug:
-        console_handler.setLevel(logging.DEBUG)
+    # Per item conf file so that parallel workers do not overwrite each other's conf
+    rsnapshot_conf = "{conf}.{number}".format(conf=RSNAPSHOT_CONF, number=number)
+    rsnapshot_passwd = "{passwd}.{number}".format(passwd=RSNAPSHOT_PASSWD, number=number)
 
-    # Catch exception to logger
+    # Backup items errors should not stop other items
     try:
 
-        # Load YAML config
-        if args.config:
-            # Override config
-            logger.info("Loading YAML config {config_file}".format(config_file=args.config))
-            with open("{config_file}".format(config_file=args.config), 'r') as yaml_file:
-                config = yaml.load(yaml_file, Loader=yaml.SafeLoader)
+        log_and_print("NOTICE", "Processing item number %s: %s", logger, number, item)
+
+        # Item defaults
+        # Merge config values over the defaults in one dict merge instead of a long chain of per key checks
+        item = {**ITEM_DEFAULTS, **item}
+
+        # For backward compatibility:
+        # if only mongo_args is set use it for mongo and mongodump
+        # if mongodump_args is set use them separately
+        if "mongodump_args" not in item:
+            item["mongodump_args"] = item["mongo_args"]
+
+        # rsync_args goes into the generated conf verbatim and is whitespace-split again by
+        # rsnapshot, so tokenize it once here to catch broken quoting before any SSH work is
+        # done and join the tokens back into a canonical single-spaced string
+        if item["rsync_args"]:
+            try:
+                item["rsync_args"] = " ".join(shlex.split(item["rsync_args"]))
+            except ValueError as e:
+                log_and_print("ERROR", "Invalid rsync_args quoting on item number {number}: {e}, skipping item with error".format(number=number, e=e), logger)
+                errors += 1
+                return errors, oks
+
+        if args.debug:
+            item["verbosity_level"] = 5
+            item["rsync_verbosity_args"] = "--human-readable --progress"
         else:
-            logger.info("Loading YAML config {work_dir}/{config_file}".format(work_dir=WORK_DIR, config_file=CONFIG_FILE))
-            with open("{work_dir}/{config_file}".format(work_dir=WORK_DIR, config_file=CONFIG_FILE), 'r') as yaml_file:
-                config = yaml.load(yaml_file, Loader=yaml.SafeLoader)
+            item["verbosity_level"] = 2
+            item["rsync_verbosity_args"] = ""
+
+        # Check before_backup_check and skip item if failed
+        # It is needed for both rotations and sync
+        if "before_backup_check" in item:
+            log_and_print("NOTICE", "Executing local before_backup_check on item number {number}:".format(number=number), logger)
+            log_and_print("NOTICE", "{cmd}".format(cmd=item["before_backup_check"]), logger)
+            retcode = run_cmd(item["before_backup_check"])
+            if retcode == 0:
+                log_and_print("NOTICE", "Local execution of before_backup_check succeeded on item number {number}".format(number=number), logger)
+            else:
+                log_and_print("ERROR", "Local execution of before_backup_check failed on item number {number}, skipping item with error".format(number=number), logger)
+                errors += 1
+                return errors, oks
+
+        # Rotations
+        if rotate_command is not None:
+
+            rsnapshot_command = rotate_command
+
+            # Skip calling rotate when retain = 0
+            if rsnapshot_command == "daily" and str(item["retain_daily"]) == "0":
+                log_and_print("NOTICE", "Skipping rotate daily on item number {number} because retain_daily = 0".format(number=number), logger)
+                return errors, oks
+            if rsnapshot_command == "weekly" and str(item["retain_weekly"]) == "0":
+                log_and_print("NOTICE", "Skipping rotate weekly on item number {number} because retain_weekly = 0".format(number=number), logger)
+                return errors, oks
+            if rsnapshot_command == "monthly" and str(item["retain_monthly"]) == "0":
+                log_and_print("NOTICE", "Skipping rotate monthly on item number {number} because retain_monthly = 0".format(number=number), logger)
+                return errors, oks
+
+            # Process paths from many items only once on rotations, guard the shared list as items may run in parallel
+            with PATHS_PROCESSED_LOCK:
+                if item["path"] in paths_processed:
+                    log_and_print("NOTICE", "Path {path} on item number {number} already rotated, skipping".format(path=item["path"], number=number), logger)
+                    return errors, oks
+                paths_processed.add(item["path"])
+
+            write_file_if_changed(rsnapshot_conf, CONF_ROTATE_TEMPLATE.format(
+                    number=number,
+                    snapshot_root=item["path"],
+                    retain_hourly_comment="" if "retain_hourly" in item else "#",
+                    retain__daily_comment="" if str(item["retain_daily"]) != "0" else "#",
+                    retain_weekly_comment="" if str(item["retain_weekly"]) != "0" else "#",
+                    retain_monthlycomment="" if str(item["retain_monthly"]) != "0" else "#",
+                    retain_hourly=item["retain_hourly"] if "retain_hourly" in item else "NONE",
+                    retain_daily=item["retain_daily"],
+                    retain_weekly=item["retain_weekly"],
+                    retain_monthly=item["retain_monthly"],
+                    verbosity_level=item["verbosity_level"]
+                ))
+
+            # Run rsnapshot
+            if "rsnapshot_prefix_cmd" in item:
+                rsnapshot_prefix_cmd = "{rsnapshot_prefix_cmd} ".format(rsnapshot_prefix_cmd=item["rsnapshot_prefix_cmd"])
+            else:
+                rsnapshot_prefix_cmd = ""
+            log_and_print("NOTICE", "Running {rsnapshot_prefix_cmd}rsnapshot -c {conf} {command} on item number {number}".format(
+                rsnapshot_prefix_cmd=rsnapshot_prefix_cmd,
+                conf=rsnapshot_conf,
+                command=rsnapshot_command,
+                number=number
+            ), logger)
+            retcode = run_cmd("{rsnapshot_prefix_cmd}rsnapshot -c {conf} {command}".format(
+                rsnapshot_prefix_cmd=rsnapshot_prefix_cmd,
+                conf=rsnapshot_conf,
+                command=rsnapshot_command
+            ))
+            if retcode == 0:
+                log_and_print("NOTICE", "Rsnapshot succeeded on item number {number}".format(number=number), logger)
+            else:
+                log_and_print("ERROR", "Rsnapshot failed on item number {number}".format(number=number), logger)
+                errors += 1
 
-        # Check if enabled in config
-        if config["enabled"] != True:
-            logger.info("{LOGO} not enabled in config, exiting".format(LOGO=LOGO))
-            sys.exit(0)
+        # Sync
+        if args.sync:
 
-        # Check for self hostname override in config
-        if "hostname_override" in config:
-            SELF_HOSTNAME = config["hostname_override"]
-        else:
-            SELF_HOSTNAME = socket.gethostname()
-        log_and_print("NOTICE", "Starting {LOGO} on {hostname}".format(LOGO=LOGO, hostname=SELF_HOSTNAME), logger)
+            # With retries we cannot show error word in output text, otherwise an error will be detected
+            rsnapshot_error_filter = "sed -e 's/ERROR/E.ROR/g' -e 's/Error/E.ror/g' -e 's/error/e.ror/g'"
+
+            # On a first run into an empty .sync every file is new, so the delete passes and the
+            # delta-xfer rolling checksums are pure overhead - send whole files instead
+            first_run = False
+            if item["optimize_first_run"]:
+                sync_dir = "{path}/.sync".format(path=item["path"])
+                try:
+                    with os.scandir(sync_dir) as sync_dir_entries:
+                        first_run = not any(sync_dir_entries)
+                except OSError:
+                    first_run = True
+            if first_run:
+                log_and_print("NOTICE", "Empty .sync on item number {number}, using first run rsync args".format(number=number), logger)
+                sync_mode_args = "--whole-file"
+            else:
+                sync_mode_args = "--delete --delete-excluded"
+
+            # Forcing --compress-choice is only safe when explicitly asked for - the local probe
+            # says nothing about the remote rsync/rsyncd, and an old remote aborts on a forced
+            # choice instead of negotiating, so auto stays plain -z and lets rsync negotiate
+            if item["rsync_compress"] == "none":
+                rsync_compress_args = ""
+            elif item["rsync_compress"] == "zstd" and rsync_compress_choice_supported():
+                rsync_compress_args = "--compress-choice=zstd --compress-level=1"
+            else:
+                rsync_compress_args = "-z"
 
-        # Chdir to work dir
-        os.chdir(WORK_DIR)
+            if item["type"] in SSH_TYPES:
 
-        # Lock before trying to run, exception and exit on timeout is ok
-        if not args.ignore_lock:
-            lock = lockfile.LockFile(LOCK_FILE)
-        try:
+                ssh_args = SSH_ARGS
 
-            # timeout=0 = do not wait if locked
-            if not args.ignore_lock:
-                lock.acquire(timeout=0)
+                if ":" in item["connect"]:
+                    item["connect_host"] = item["connect"].split(":")[0]
+                    item["connect_port"] = item["connect"].split(":")[1]
+                else:
+                    item["connect_host"] = item["connect"]
+                    item["connect_port"] = 22
 
-            errors = 0
-            oks = 0
-            paths_processed = []
+                # Check SSH
 
-            # Loop backup items
-            for item in config["items"]:
+                # No shell features needed for the hostname probe - exec ssh directly
+                ssh_hostname_cmd = ["ssh"] + ssh_args.split() + ["-p", str(item["connect_port"]), "{user}@{host}".format(user=item["connect_user"], host=item["connect_host"]), "hostname"]
 
-                if not item["enabled"]:
-                    continue
+                # One probe captures the remote hostname, so hostname validation below reuses
+                # its output instead of making a second ssh round trip
+                log_and_print("NOTICE", "Checking remote SSH on item number {number}:".format(number=number), logger)
+                retcode, stdout, stderr = run_cmd_pipe(ssh_hostname_cmd)
+                if retcode == 0:
+                    log_and_print("NOTICE", "SSH without password succeeded on item number {number}".format(number=number), logger)
+                else:
 
-                # Apply filters
-                if args.item_number is not None:
-                    if str(item["number"]) != str(args.item_number[0]):
-                        continue
-                if args.host is not None:
-                    if item["host"] != str(args.host[0]):
-                        continue
+                    if item["host"] == SELF_HOSTNAME:
 
-                # Backup items errors should not stop other items
-                try:
+                        log_and_print("NOTICE", "Loopback connect detected on item number {number}, trying to add server key to authorized".format(number=number), logger)
+                        script = LOOPBACK_AUTH_SCRIPT
+                        retcode = run_cmd(script)
+                        if retcode == 0:
+                            log_and_print("NOTICE", "Loopback authorization script succeeded on item number {number}".format(number=number), logger)
+                        else:
+                            log_and_print("ERROR", "Loopback authorization script failed on item number {number}, not doing sync".format(number=number), logger)
+                            errors += 1
+                            return errors, oks
+
+                        log_and_print("NOTICE", "Checking again remote SSH on item number {number}:".format(number=number), logger)
+                        retcode, stdout, stderr = run_cmd_pipe(ssh_hostname_cmd)
+                        if retcode == 0:
+                            log_and_print("NOTICE", "SSH without password succeeded on item number {number}".format(number=number), logger)
+                        else:
+                            log_and_print("ERROR", "SSH without password failed on item number {number}, not doing sync".format(number=number), logger)
+                            errors += 1
+                            return errors, oks
 
-                    log_and_print("NOTICE", "Processing item number {number}: {item}".format(number=item["number"], item=item), logger)
+                    else:
+                        log_and_print("ERROR", "SSH without password failed on item number {number}, not doing sync".format(number=number), logger)
+                        errors += 1
+                        return errors, oks
 
-                    # Item defaults
 
-                    if "retain_daily" not in item:
-                        item["retain_daily"] = 7
-                    if "retain_weekly" not in item:
-                        item["retain_weekly"] = 4
-                    if "retain_monthly" not in item:
-                        item["retain_monthly"] = 3
+                # Validate hostname against the output of the probe above
+                if item["validate_hostname"]:
+                    log_and_print("NOTICE", "Hostname validation required on item number {number}".format(number=number), logger)
+                    hostname_received = stdout.lstrip().rstrip()
+                    if hostname_received == item["host"]:
+                        log_and_print("NOTICE", "Remote hostname {hostname} received and validated on item number {number}".format(hostname=hostname_received, number=number), logger)
+                    else:
+                        log_and_print("ERROR", "Remote hostname {hostname} received, {expected} expected and validation failed on item number {number}, not doing sync".format(hostname=hostname_received, expected=item["host"], number=number), logger)
+                        errors += 1
+                        return errors, oks
+
+                # Exec exec_before_rsync
+                if "exec_before_rsync" in item:
+                    log_and_print("NOTICE", "Executing remote exec_before_rsync on item number {number}".format(number=number), logger)
+                    log_and_print("NOTICE", "{cmd}".format(cmd=item["exec_before_rsync"]), logger)
+                    retcode = run_cmd("ssh {ssh_args} -p {port} {user}@{host} '{cmd}'".format(ssh_args=ssh_args, port=item["connect_port"], user=item["connect_user"], host=item["connect_host"], cmd=item["exec_before_rsync"]))
+                    if retcode == 0:
+                        log_and_print("NOTICE", "Remote execution of exec_before_rsync succeeded on item number {number}".format(number=number), logger)
+                    else:
+                        log_and_print("ERROR", "Remote execution of exec_before_rsync failed on item number {number}, but script continues".format(number=number), logger)
+                        errors += 1
 
-                    if "connect_user" not in item:
-                        item["connect_user"] = "root"
+                # DB dumps before rsync
 
-                    if "validate_hostname" not in item:
-                        item["validate_hostname"] = True
+                # Set when a dump is streamed directly into .sync so the rsnapshot sync pass can be skipped
+                dump_streamed = False
 
-                    if "mysql_noevents" not in item:
-                        item["mysql_noevents"] = False
-                    if "postgresql_noclean" not in item:
-                        item["postgresql_noclean"] = False
-                    if "postgresql_skip_globals" not in item:
-                        item["postgresql_skip_globals"] = False
+                if item["type"] in DB_SSH_TYPES:
 
-                    if "native_txt_check" not in item:
-                        item["native_txt_check"] = False
-                    if "native_10h_limit" not in item:
-                        item["native_10h_limit"] = False
+                    # Per-item derived values used by several templates below, computed once
+                    # If hourly retains are used keep dumps only for 59 minutes
+                    dump_mmin = "59" if "retain_hourly" in item else "720"
+                    mysql_events = "" if item["mysql_noevents"] else "--events"
 
-                    if args.debug:
-                        item["verbosity_level"] = 5
-                        item["rsync_verbosity_args"] = "--human-readable --progress"
+                    # Compressor for POSTGRESQL_SSH / MONGODB_SSH dumps: multi-threaded zstd when asked for,
+                    # otherwise gzip with pigz picked up when the remote has it
+                    if item["compressor"] == "zstd":
+                        compress_cmd = '"zstd -q --rsyncable -T{threads}"'.format(threads=item["compression_threads"] if item["compression_threads"] else "0")
+                        dump_ext = "zst"
                     else:
-                        item["verbosity_level"] = 2
-                        item["rsync_verbosity_args"] = ""
-
-                    if "rsync_args" not in item:
-                        item["rsync_args"] = ""
-
-                    if "ignore_remote_dump_failed" not in item:
-                        item["ignore_remote_dump_failed"] = False
-
-                    if "dump_attempts" not in item:
-                        item["dump_attempts"] = 1
-
-                    if "mysql_dump_dir" not in item:
-                        item["mysql_dump_dir"] = "/var/backups/mysql"
-                    if "postgresql_dump_dir" not in item:
-                        item["postgresql_dump_dir"] = "/var/backups/postgresql"
-                    if "mongodb_dump_dir" not in item:
-                        item["mongodb_dump_dir"] = "/var/backups/mongodb"
-
-                    if "dump_prefix_cmd" not in item:
-                        item["dump_prefix_cmd"] = ""
-                    if "exec_before_dump" not in item:
-                        item["exec_before_dump"] = ""
-                    if "exec_after_dump" not in item:
-                        item["exec_after_dump"] = ""
-
-                    if "mysqldump_args" not in item:
-                        item["mysqldump_args"] = ""
-                    if "pg_dump_args" not in item:
-                        item["pg_dump_args"] = ""
-                    if "pg_dump_filter" not in item:
-                        item["pg_dump_filter"] = "grep -v -e \"pg_dump.*: finished item\" -e \"pg_dump.*: creating\" -e \"pg_dump.*: executing\" -e \"pg_dump.*: last built-in\" -e \"pg_dump.*: reading\" -e \"pg_dump.*: identifying\" -e \"pg_dump.*: finding\" -e \"pg_dump.*: flagging\" -e \"pg_dump.*: saving\" -e \"pg_dump.*: dropping\" -e \"pg_dump.*: dumping\" -e \"pg_dump.*: running\" -e \"pg_dump.*: processing\" >&2"
-                    if "mongo_args" not in item:
-                        item["mongo_args"] = ""
-                    # For backward compatibility:
-                    # if only mongo_args is set use it for mongo and mongodump
-                    # if mongodump_args is set use them separately
-                    if "mongodump_args" not in item:
-                        item["mongodump_args"] = item["mongo_args"]
-                    if "mongo_secondary_ok" not in item:
-                        item["mongo_secondary_ok"] = False
-                    if "mongodump_skip_tar" not in item:
-                        item["mongodump_skip_tar"] = False
-
-                    if "xtrabackup_throttle" not in item:
-                        item["xtrabackup_throttle"] = "20" # 20 MB IO limit by default https://www.percona.com/doc/percona-xtrabackup/2.3/advanced/throttling_backups.html
-                    if "xtrabackup_parallel" not in item:
-                        item["xtrabackup_parallel"] = "2"
-                    if "xtrabackup_compress_threads" not in item:
-                        item["xtrabackup_compress_threads"] = "2"
-                    if "xtrabackup_args" not in item:
-                        item["xtrabackup_args"] = ""
-
-                    # mariadb-backup is a xtrabackup fork and has the same options
-                    if "mariadb-backup_throttle" not in item:
-                        item["mariadb-backup_throttle"] = "20"
-                    if "mariadb-backup_parallel" not in item:
-                        item["mariadb-backup_parallel"] = "2"
-                    if "mariadb-backup_compress_threads" not in item:
-                        item["mariadb-backup_compress_threads"] = "2"
-                    if "mariadb-backup_args" not in item:
-                        item["mariadb-backup_args"] = ""
-
-                    if "mysqlsh_connect_args" not in item:
-                        item["mysqlsh_connect_args"] = ""
-                    if "mysqlsh_args" not in item:
-                        item["mysqlsh_args"] = ""
-                    if "mysqlsh_max_rate" not in item:
-                        item["mysqlsh_max_rate"] = "20M" # 20 MB IO limit by default
-                    if "mysqlsh_bytes_per_chunk" not in item:
-                        item["mysqlsh_bytes_per_chunk"] = "100M"
-                    if "mysqlsh_threads" not in item:
-                        item["mysqlsh_threads"] = "2"
-
-                    if "docker_mode" not in item:
-                        item["docker_mode"] = False
-                    if "docker_container" not in item:
-                        item["docker_container"] = "empty"
-                    if "db_user" not in item:
-                        item["db_user"] = None
-
-                    # Check before_backup_check and skip item if failed
-                    # It is needed for both rotations and sync
-                    if "before_backup_check" in item:
-                        log_and_print("NOTICE", "Executing local before_backup_check on item number {number}:".format(number=item["number"]), logger)
-                        log_and_print("NOTICE", "{cmd}".format(cmd=item["before_backup_check"]), logger)
-                        try:
-                            retcode = run_cmd(item["before_backup_check"])
-                            if retcode == 0:
-                                log_and_print("NOTICE", "Local execution of before_backup_check succeeded on item number {number}".format(number=item["number"]), logger)
-                            else:
-                                log_and_print("ERROR", "Local execution of before_backup_check failed on item number {number}, skipping item with error".format(number=item["number"]), logger)
-                                errors += 1
-                                continue
-                        except Exception as e:
-                            logger.exception(e)
-                            raise Exception("Caught exception on subprocess.run execution")
-
-                    # Rotations
-                    if args.rotate_hourly or args.rotate_daily or args.rotate_weekly or args.rotate_monthly:
-
-                        if args.rotate_hourly:
-                            rsnapshot_command = "hourly"
-                        if args.rotate_daily:
-                            rsnapshot_command = "daily"
-                        if args.rotate_weekly:
-                            rsnapshot_command = "weekly"
-                        if args.rotate_monthly:
-                            rsnapshot_command = "monthly"
-
-                        # Skip calling rotate when retain = 0
-                        if rsnapshot_command == "daily" and str(item["retain_daily"]) == "0":
-                            log_and_print("NOTICE", "Skipping rotate daily on item number {number} because retain_daily = 0".format(number=item["number"]), logger)
-                            continue
-                        if rsnapshot_command == "weekly" and str(item["retain_weekly"]) == "0":
-                            log_and_print("NOTICE", "Skipping rotate weekly on item number {number} because retain_weekly = 0".format(number=item["number"]), logger)
-                            continue
-                        if rsnapshot_command == "monthly" and str(item["retain_monthly"]) == "0":
-                            log_and_print("NOTICE", "Skipping rotate monthly on item number {number} because retain_monthly = 0".format(number=item["number"]), logger)
-                            continue
-
-                        # Process paths from many items only once on rotations
-                        if item["path"] in paths_processed:
-                            log_and_print("NOTICE", "Path {path} on item number {number} already rotated, skipping".format(path=item["path"], number=item["number"]), logger)
-                            continue
-                        paths_processed.append(item["path"])
-
-                        with open(RSNAPSHOT_CONF, "w") as file_to_write:
-                            file_to_write.write(textwrap.dedent(
-                                """\
-                                config_version	1.2
-                                snapshot_root	{snapshot_root}
-                                cmd_cp		/bin/cp
-                                cmd_rm		/bin/rm
-                                cmd_rsync	/usr/bin/rsync
-                                cmd_ssh		/usr/bin/ssh
-                                cmd_logger	/usr/bin/logger
-                                {retain_hourly_comment}retain		hourly	{retain_hourly}
-                                {retain__daily_comment}retain		daily	{retain_daily}
-                                {retain_weekly_comment}retain		weekly	{retain_weekly}
-                                {retain_monthlycomment}retain		monthly	{retain_monthly}
-                                verbose		{verbosity_level}
-                                loglevel	3
-                                logfile		/opt/sysadmws/rsnapshot_backup/rsnapshot.log
-                                lockfile	/opt/sysadmws/rsnapshot_backup/rsnapshot.pid
-                                sync_first	1
-                                # any backup definition enough for rotation
-                                backup		/etc/		rsnapshot/
-                                """
-                            ).format(
-                                snapshot_root=item["path"],
-                                retain_hourly_comment="" if "retain_hourly" in item else "#",
-                                retain__daily_comment="" if str(item["retain_daily"]) != "0" else "#",
-                                retain_weekly_comment="" if str(item["retain_weekly"]) != "0" else "#",
-                                retain_monthlycomment="" if str(item["retain_monthly"]) != "0" else "#",
-                                retain_hourly=item["retain_hourly"] if "retain_hourly" in item else "NONE",
-                                retain_daily=item["retain_daily"],
-                                retain_weekly=item["retain_weekly"],
-                                retain_monthly=item["retain_monthly"],
-                                verbosity_level=item["verbosity_level"]
-                            ))
-                        
-                        # Run rsnapshot
-                        if "rsnapshot_prefix_cmd" in item:
-                            rsnapshot_prefix_cmd = "{rsnapshot_prefix_cmd} ".format(rsnapshot_prefix_cmd=item["rsnapshot_prefix_cmd"])
-                        else:
-                            rsnapshot_prefix_cmd = ""
-                        log_and_print("NOTICE", "Running {rsnapshot_prefix_cmd}rsnapshot -c {conf} {command} on item number {number}".format(
-                            rsnapshot_prefix_cmd=rsnapshot_prefix_cmd,
-                            conf=RSNAPSHOT_CONF,
-                            command=rsnapshot_command,
-                            number=item["number"]
-                        ), logger)
-                        try:
-                            retcode = run_cmd("{rsnapshot_prefix_cmd}rsnapshot -c {conf} {command}".format(
-                                rsnapshot_prefix_cmd=rsnapshot_prefix_cmd,
-                                conf=RSNAPSHOT_CONF,
-                                command=rsnapshot_command
-                            ))
-                            if retcode == 0:
-                                log_and_print("NOTICE", "Rsnapshot succeeded on item number {number}".format(number=item["number"]), logger)
-                            else:
-                                log_and_print("ERROR", "Rsnapshot failed on item number {number}".format(number=item["number"]), logger)
-                                errors += 1
-                        except Exception as e:
-                            logger.exception(e)
-                            raise Exception("Caught exception on subprocess.run execution")
-                    
-                    # Sync
-                    if args.sync:
+                        compress_cmd = '"$(command -v pigz > /dev/null && echo "pigz{pigz_threads_arg} --rsyncable" || (echo | gzip --rsyncable > /dev/null 2>&1 && echo "gzip --rsyncable" || echo gzip))"'.format(pigz_threads_arg=" -p {threads}".format(threads=item["compression_threads"]) if item["compression_threads"] else "")
+                        dump_ext = "gz"
 
-                        # With retries we cannot show error word in output text, otherwise an error will be detected
-                        rsnapshot_error_filter = "sed -e 's/ERROR/E.ROR/g' -e 's/Error/E.ror/g' -e 's/error/e.ror/g'"
+                    # Generic grep filter for excludes
+                    grep_db_filter = build_grep_db_filter(tuple(item["exclude"])) if "exclude" in item else ""
 
-                        if item["type"] in ["RSYNC_SSH", "MYSQL_SSH", "POSTGRESQL_SSH", "MONGODB_SSH"]:
+                    if item["type"] == "MYSQL_SSH":
 
-                            ssh_args = "-o BatchMode=yes -o StrictHostKeyChecking=no"
+                        if "mysql_dump_type" in item and item["mysql_dump_type"] == "xtrabackup":
 
-                            if ":" in item["connect"]:
-                                item["connect_host"] = item["connect"].split(":")[0]
-                                item["connect_port"] = item["connect"].split(":")[1]
+                            if "exclude" in item:
+                                databases_exclude = "--databases-exclude=\"{databases}\"".format(databases=" ".join(item["exclude"]))
                             else:
-                                item["connect_host"] = item["connect"]
-                                item["connect_port"] = 22
-                            
-                            # Check SSH
-
-                            log_and_print("NOTICE", "Checking remote SSH on item number {number}:".format(number=item["number"]), logger)
-                            try:
-                                retcode = run_cmd("ssh {ssh_args} -p {port} {user}@{host} 'hostname'".format(ssh_args=ssh_args, port=item["connect_port"], user=item["connect_user"], host=item["connect_host"]))
-                                if retcode == 0:
-                                    log_and_print("NOTICE", "SSH without password succeeded on item number {number}".format(number=item["number"]), logger)
-                                else:
+                                databases_exclude = ""
 
-                                    if item["host"] == SELF_HOSTNAME:
-
-                                        log_and_print("NOTICE", "Loopback connect detected on item number {number}, trying to add server key to authorized".format(number=item["number"]), logger)
-                                        script = textwrap.dedent(
-                                            """\
-                                            #!/bin/bash
-                                            set -e
-                                            
-                                            if [[ ! -e /root/.ssh/id_rsa.pub ]]; then
-                                                    ssh-keygen -b 4096 -f /root/.ssh/id_rsa -q -N ''
-                                            fi
-                                            
-                                            if [[ ! -e /root/.ssh/authorized_keys ]]; then
-                                                    cat /root/.ssh/id_rsa.pub >> /root/.ssh/authorized_keys
-                                                    chmod 600 /root/.ssh/authorized_keys
-                                            fi
-                                            
-                                            if ! grep -q "$(cat /root/.ssh/id_rsa.pub)" /root/.ssh/authorized_keys; then
-                                                    cat /root/.ssh/id_rsa.pub >> /root/.ssh/authorized_keys
-                                                    chmod 600 /root/.ssh/authorized_keys
-                                            fi
-                                            """
-                                        )
-                                        try:
-                                            retcode = run_cmd(script)
-                                            if retcode == 0:
-                                                log_and_print("NOTICE", "Loopback authorization script succeeded on item number {number}".format(number=item["number"]), logger)
-                                            else:
-                                                log_and_print("ERROR", "Loopback authorization script failed on item number {number}, not doing sync".format(number=item["number"]), logger)
-                                                errors += 1
-                                                continue
-                                        except Exception as e:
-                                            logger.exception(e)
-                                            raise Exception("Caught exception on subprocess.run execution")
-                                        
-                                        log_and_print("NOTICE", "Checking again remote SSH on item number {number}:".format(number=item["number"]), logger)
-                                        try:
-                                            retcode = run_cmd("ssh {ssh_args} -p {port} {user}@{host} 'hostname'".format(ssh_args=ssh_args, port=item["connect_port"], user=item["connect_user"], host=item["connect_host"]))
-                                            if retcode == 0:
-                                                log_and_print("NOTICE", "SSH without password succeeded on item number {number}".format(number=item["number"]), logger)
-                                            else:
-                                                log_and_print("ERROR", "SSH without password failed on item number {number}, not doing sync".format(number=item["number"]), logger)
-                                                errors += 1
-                                                continue
-                                        except Exception as e:
-                                            logger.exception(e)
-                                            raise Exception("Caught exception on subprocess.run execution")
+                            xtrabackup_output_filter = 'grep -v -e "log scanned up to" -e "Skipping" -e "Compressing" -e "...done"'
 
-                                    else:
-                                        log_and_print("ERROR", "SSH without password failed on item number {number}, not doing sync".format(number=item["number"]), logger)
-                                        errors += 1
-                                        continue
-                            
-                            except Exception as e:
-                                logger.exception(e)
-                                raise Exception("Caught exception on subprocess.run execution")
-
-                            # Validate hostname
-                            if item["validate_hostname"]:
-                                log_and_print("NOTICE", "Hostname validation required on item number {number}".format(number=item["number"]), logger)
-                                try:
-                                    retcode, stdout, stderr = run_cmd_pipe("ssh {ssh_args} -p {port} {user}@{host} 'hostname'".format(ssh_args=ssh_args, port=item["connect_port"], user=item["connect_user"], host=item["connect_host"]))
-                                    if retcode == 0:
-                                        hostname_received = stdout.lstrip().rstrip()
-                                        if hostname_received == item["host"]:
-                                            log_and_print("NOTICE", "Remote hostname {hostname} received and validated on item number {number}".format(hostname=hostname_received, number=item["number"]), logger)
-                                        else:
-                                            log_and_print("ERROR", "Remote hostname {hostname} received, {expected} expected and validation failed on item number {number}, not doing sync".format(hostname=hostname_received, expected=item["host"], number=item["number"]), logger)
-                                            errors += 1
-                                            continue
-                                    else:
-                                        log_and_print("ERROR", "Remote hostname validation failed on item number {number}, not doing sync".format(number=item["number"]), logger)
-                                        errors += 1
-                                        continue
-                                except Exception as e:
-                                    logger.exception(e)
-                                    raise Exception("Caught exception on subprocess.run execution")
-
-                            # Exec exec_before_rsync
-                            if "exec_before_rsync" in item:
-                                log_and_print("NOTICE", "Executing remote exec_before_rsync on item number {number}".format(number=item["number"]), logger)
-                                log_and_print("NOTICE", "{cmd}".format(cmd=item["exec_before_rsync"]), logger)
-                                try:
-                                    retcode = run_cmd("ssh {ssh_args} -p {port} {user}@{host} '{cmd}'".format(ssh_args=ssh_args, port=item["connect_port"], user=item["connect_user"], host=item["connect_host"], cmd=item["exec_before_rsync"]))
-                                    if retcode == 0:
-                                        log_and_print("NOTICE", "Remote execution of exec_before_rsync succeeded on item number {number}".format(number=item["number"]), logger)
-                                    else:
-                                        log_and_print("ERROR", "Remote execution of exec_before_rsync failed on item number {number}, but script continues".format(number=item["number"]), logger)
-                                        errors += 1
-                                except Exception as e:
-                                    logger.exception(e)
-                                    raise Exception("Caught exception on subprocess.run execution")
+                            if item["xtrabackup_stream"]:
 
-                            # DB dumps before rsync
+                                # Stream the compressed backup over ssh straight into .sync - the dump
+                                # is written once on the backup host instead of being written to the
+                                # remote dump dir and rsynced over afterwards
+                                dump_streamed = True
+                                if item["source"] == "ALL":
+                                    stream_file = "all.xbstream"
+                                    stream_databases_arg = databases_exclude
+                                else:
+                                    stream_file = "{source}.xbstream".format(source=item["source"])
+                                    stream_databases_arg = "--databases={source}".format(source=item["source"])
+                                script = MYSQL_XTRABACKUP_STREAM_SCRIPT.format(
+                                    snapshot_root=item["path"],
+                                    mysql_dump_dir=item["mysql_dump_dir"],
+                                    mmin=dump_mmin,
+                                    ssh_args=ssh_args,
+                                    port=item["connect_port"],
+                                    user=item["connect_user"],
+                                    host=item["connect_host"],
+                                    dump_prefix_cmd=item["dump_prefix_cmd"],
+                                    xtrabackup_compress_arg="={alg}".format(alg=item["xtrabackup_compress"]) if item["xtrabackup_compress"] else "",
+                                    xtrabackup_throttle=item["xtrabackup_throttle"],
+                                    xtrabackup_parallel=item["xtrabackup_parallel"],
+                                    xtrabackup_compress_threads=item["xtrabackup_compress_threads"],
+                                    stream_file=stream_file,
+                                    stream_databases_arg=stream_databases_arg,
+                                    xtrabackup_args=item["xtrabackup_args"]
+                                )
+
+                            else:
 
-                            if item["type"] in ["MYSQL_SSH", "POSTGRESQL_SSH", "MONGODB_SSH"]:
 
-                                # Generic grep filter for excludes
-                                if "exclude" in item:
-                                    grep_db_filter = "| grep -v"
-                                    for db_to_exclude in item["exclude"]:
-                                        grep_db_filter += " -e {db_to_exclude}".format(db_to_exclude=db_to_exclude)
+                                if item["source"] == "ALL":
+                                    script_dump_part = MYSQL_XTRABACKUP_DUMP_ALL_PART.format(
+                                        xtrabackup_compress_arg="={alg}".format(alg=item["xtrabackup_compress"]) if item["xtrabackup_compress"] else "",
+                                    xtrabackup_throttle=item["xtrabackup_throttle"],
+                                        xtrabackup_parallel=item["xtrabackup_parallel"],
+                                        xtrabackup_compress_threads=item["xtrabackup_compress_threads"],
+                                        mysql_dump_dir=item["mysql_dump_dir"],
+                                        databases_exclude=databases_exclude,
+                                        dump_prefix_cmd=item["dump_prefix_cmd"],
+                                        exec_before_dump=item["exec_before_dump"],
+                                        exec_after_dump=item["exec_after_dump"],
+                                        xtrabackup_args=item["xtrabackup_args"],
+                                        xtrabackup_output_filter=xtrabackup_output_filter,
+                                        dump_attempts=item["dump_attempts"]
+                                    )
                                 else:
-                                    grep_db_filter = ""
+                                    script_dump_part = MYSQL_XTRABACKUP_DUMP_ONE_PART.format(
+                                        xtrabackup_compress_arg="={alg}".format(alg=item["xtrabackup_compress"]) if item["xtrabackup_compress"] else "",
+                                    xtrabackup_throttle=item["xtrabackup_throttle"],
+                                        xtrabackup_parallel=item["xtrabackup_parallel"],
+                                        xtrabackup_compress_threads=item["xtrabackup_compress_threads"],
+                                        mysql_dump_dir=item["mysql_dump_dir"],
+                                        source=item["source"],
+                                        dump_prefix_cmd=item["dump_prefix_cmd"],
+                                        exec_before_dump=item["exec_before_dump"],
+                                        exec_after_dump=item["exec_after_dump"],
+                                        xtrabackup_args=item["xtrabackup_args"],
+                                        xtrabackup_output_filter=xtrabackup_output_filter,
+                                        dump_attempts=item["dump_attempts"]
+                                    )
 
-                                if item["type"] == "MYSQL_SSH":
+                                # If hourly retains are used keep dumps only for 59 minutes
+                                script = MYSQL_XTRABACKUP_SCRIPT.format(
+                                    ssh_args=ssh_args,
+                                    port=item["connect_port"],
+                                    user=item["connect_user"],
+                                    host=item["connect_host"],
+                                    mysql_dump_dir=item["mysql_dump_dir"],
+                                    mmin=dump_mmin,
+                                    script_dump_part=script_dump_part
+                                )
 
-                                    if "mysql_dump_type" in item and item["mysql_dump_type"] == "xtrabackup":
+                        elif "mysql_dump_type" in item and item["mysql_dump_type"] == "mariadb-backup":
 
-                                        if "exclude" in item:
-                                            databases_exclude = "--databases-exclude=\""
-                                            databases_exclude += " ".join(item["exclude"])
-                                            databases_exclude += "\""
-                                        else:
-                                            databases_exclude = ""
-
-                                        xtrabackup_output_filter = 'grep -v -e "log scanned up to" -e "Skipping" -e "Compressing" -e "...done"'
-
-                                        if item["source"] == "ALL":
-                                            script_dump_part = textwrap.dedent(
-                                                """\
-                                                WAS_ERR=0
-                                                set +e
-                                                if [[ ! -d {mysql_dump_dir}/all.xtrabackup ]]; then
-                                                        {exec_before_dump}
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
-                                                            {dump_prefix_cmd} xtrabackup --backup --compress --throttle={xtrabackup_throttle} --parallel={xtrabackup_parallel} --compress-threads={xtrabackup_compress_threads} --target-dir={mysql_dump_dir}/all.xtrabackup {databases_exclude} {xtrabackup_args} 2>&1 | {xtrabackup_output_filter}
-                                                            if [[ $? -ne 0 ]]; then
-                                                                WAS_ERR=1
-                                                                echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                            else
-                                                                echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                                break
-                                                            fi
-                                                        done
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        {exec_after_dump}
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                else
-                                                    echo "NOTICE: Valid dump already exists, skipping"
-                                                fi
-                                                set -e
-                                                if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
-                                                """
-                                            ).format(
-                                                xtrabackup_throttle=item["xtrabackup_throttle"],
-                                                xtrabackup_parallel=item["xtrabackup_parallel"],
-                                                xtrabackup_compress_threads=item["xtrabackup_compress_threads"],
-                                                mysql_dump_dir=item["mysql_dump_dir"],
-                                                databases_exclude=databases_exclude,
-                                                dump_prefix_cmd=item["dump_prefix_cmd"],
-                                                exec_before_dump=item["exec_before_dump"],
-                                                exec_after_dump=item["exec_after_dump"],
-                                                xtrabackup_args=item["xtrabackup_args"],
-                                                xtrabackup_output_filter=xtrabackup_output_filter,
-                                                dump_attempts=item["dump_attempts"]
-                                            )
-                                        else:
-                                            script_dump_part = textwrap.dedent(
-                                                """\
-                                                WAS_ERR=0
-                                                set +e
-                                                if [[ ! -d {mysql_dump_dir}/{source}.xtrabackup ]]; then
-                                                        {exec_before_dump}
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
-                                                            {dump_prefix_cmd} xtrabackup --backup --compress --throttle={xtrabackup_throttle} --parallel={xtrabackup_parallel} --compress-threads={xtrabackup_compress_threads} --target-dir={mysql_dump_dir}/{source}.xtrabackup --databases={source} {xtrabackup_args} 2>&1 | {xtrabackup_output_filter}
-                                                            if [[ $? -ne 0 ]]; then
-                                                                WAS_ERR=1
-                                                                echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                            else
-                                                                echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                                break
-                                                            fi
-                                                        done
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        {exec_after_dump}
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                else
-                                                    echo "NOTICE: Valid dump already exists, skipping"
-                                                fi
-                                                set -e
-                                                if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
-                                                """
-                                            ).format(
-                                                xtrabackup_throttle=item["xtrabackup_throttle"],
-                                                xtrabackup_parallel=item["xtrabackup_parallel"],
-                                                xtrabackup_compress_threads=item["xtrabackup_compress_threads"],
-                                                mysql_dump_dir=item["mysql_dump_dir"],
-                                                source=item["source"],
-                                                dump_prefix_cmd=item["dump_prefix_cmd"],
-                                                exec_before_dump=item["exec_before_dump"],
-                                                exec_after_dump=item["exec_after_dump"],
-                                                xtrabackup_args=item["xtrabackup_args"],
-                                                xtrabackup_output_filter=xtrabackup_output_filter,
-                                                dump_attempts=item["dump_attempts"]
-                                            )
-
-                                        # If hourly retains are used keep dumps only for 59 minutes
-                                        script = textwrap.dedent(
-                                            """\
-                                            #!/bin/bash
-                                            set -e
-
-                                            ssh {ssh_args} -p {port} {user}@{host} '
-                                                set -x
-                                                set -e
-                                                set -o pipefail
-                                                mkdir -p {mysql_dump_dir}
-                                                chmod 700 {mysql_dump_dir}
-                                                while [[ -d {mysql_dump_dir}/dump.lock ]]; do
-                                                        sleep 5
-                                                done
-                                                mkdir {mysql_dump_dir}/dump.lock
-                                                trap "rm -rf {mysql_dump_dir}/dump.lock" 0
-                                                cd {mysql_dump_dir}
-                                                find {mysql_dump_dir} -type d -name "*.xtrabackup" -mmin +{mmin} -exec rm -rf {{}} +
-                                                {script_dump_part}
-                                            '
-                                            """
-                                        ).format(
-                                            ssh_args=ssh_args,
-                                            port=item["connect_port"],
-                                            user=item["connect_user"],
-                                            host=item["connect_host"],
-                                            mysql_dump_dir=item["mysql_dump_dir"],
-                                            mmin="59" if "retain_hourly" in item else "720",
-                                            script_dump_part=script_dump_part
-                                        )
-
-                                    elif "mysql_dump_type" in item and item["mysql_dump_type"] == "mariadb-backup":
-
-                                        if "exclude" in item:
-                                            databases_exclude = "--databases-exclude=\""
-                                            databases_exclude += " ".join(item["exclude"])
-                                            databases_exclude += "\""
-                                        else:
-                                            databases_exclude = ""
-
-                                        mariadb_backup_output_filter = 'grep -v -e "log scanned up to" -e "Skipping" -e "Compressing" -e "...done"'
-
-                                        if item["source"] == "ALL":
-                                            script_dump_part = textwrap.dedent(
-                                                """\
-                                                WAS_ERR=0
-                                                set +e
-                                                if [[ ! -d {mysql_dump_dir}/all.mariadb-backup ]]; then
-                                                        {exec_before_dump}
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
-                                                            {dump_prefix_cmd} mariadb-backup --backup --compress --throttle={mariadb_backup_throttle} --parallel={mariadb_backup_parallel} --compress-threads={mariadb_backup_compress_threads} --target-dir={mysql_dump_dir}/all.mariadb-backup {databases_exclude} {mariadb_backup_args} 2>&1 | {mariadb_backup_output_filter}
-                                                            if [[ $? -ne 0 ]]; then
-                                                                WAS_ERR=1
-                                                                echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                            else
-                                                                echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                                break
-                                                            fi
-                                                        done
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        {exec_after_dump}
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                else
-                                                    echo "NOTICE: Valid dump already exists, skipping"
-                                                fi
-                                                set -e
-                                                if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
-                                                """
-                                            ).format(
-                                                mariadb_backup_throttle=item["mariadb-backup_throttle"],
-                                                mariadb_backup_parallel=item["mariadb-backup_parallel"],
-                                                mariadb_backup_compress_threads=item["mariadb-backup_compress_threads"],
-                                                mysql_dump_dir=item["mysql_dump_dir"],
-                                                databases_exclude=databases_exclude,
-                                                dump_prefix_cmd=item["dump_prefix_cmd"],
-                                                exec_before_dump=item["exec_before_dump"],
-                                                exec_after_dump=item["exec_after_dump"],
-                                                mariadb_backup_args=item["mariadb-backup_args"],
-                                                mariadb_backup_output_filter=mariadb_backup_output_filter,
-                                                dump_attempts=item["dump_attempts"]
-                                            )
-                                        else:
-                                            script_dump_part = textwrap.dedent(
-                                                """\
-                                                WAS_ERR=0
-                                                set +e
-                                                if [[ ! -d {mysql_dump_dir}/{source}.mariadb-backup ]]; then
-                                                        {exec_before_dump}
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
-                                                            {dump_prefix_cmd} mariadb-backup --backup --compress --throttle={mariadb_backup_throttle} --parallel={mariadb_backup_parallel} --compress-threads={mariadb_backup_compress_threads} --target-dir={mysql_dump_dir}/{source}.mariadb-backup --databases={source} {mariadb_backup_args} 2>&1 | {mariadb_backup_output_filter}
-                                                            if [[ $? -ne 0 ]]; then
-                                                                WAS_ERR=1
-                                                                echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                            else
-                                                                echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                                break
-                                                            fi
-                                                        done
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        {exec_after_dump}
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                else
-                                                    echo "NOTICE: Valid dump already exists, skipping"
-                                                fi
-                                                set -e
-                                                if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
-                                                """
-                                            ).format(
-                                                mariadb_backup_throttle=item["mariadb-backup_throttle"],
-                                                mariadb_backup_parallel=item["mariadb-backup_parallel"],
-                                                mariadb_backup_compress_threads=item["mariadb-backup_compress_threads"],
-                                                mysql_dump_dir=item["mysql_dump_dir"],
-                                                source=item["source"],
-                                                dump_prefix_cmd=item["dump_prefix_cmd"],
-                                                exec_before_dump=item["exec_before_dump"],
-                                                exec_after_dump=item["exec_after_dump"],
-                                                mariadb_backup_args=item["mariadb-backup_args"],
-                                                mariadb_backup_output_filter=mariadb_backup_output_filter,
-                                                dump_attempts=item["dump_attempts"]
-                                            )
-
-                                        # If hourly retains are used keep dumps only for 59 minutes
-                                        script = textwrap.dedent(
-                                            """\
-                                            #!/bin/bash
-                                            set -e
-
-                                            ssh {ssh_args} -p {port} {user}@{host} '
-                                                set -x
-                                                set -e
-                                                set -o pipefail
-                                                mkdir -p {mysql_dump_dir}
-                                                chmod 700 {mysql_dump_dir}
-                                                while [[ -d {mysql_dump_dir}/dump.lock ]]; do
-                                                        sleep 5
-                                                done
-                                                mkdir {mysql_dump_dir}/dump.lock
-                                                trap "rm -rf {mysql_dump_dir}/dump.lock" 0
-                                                cd {mysql_dump_dir}
-                                                find {mysql_dump_dir} -type d -name "*.mariadb-backup" -mmin +{mmin} -exec rm -rf {{}} +
-                                                {script_dump_part}
-                                            '
-                                            """
-                                        ).format(
-                                            ssh_args=ssh_args,
-                                            port=item["connect_port"],
-                                            user=item["connect_user"],
-                                            host=item["connect_host"],
-                                            mysql_dump_dir=item["mysql_dump_dir"],
-                                            mmin="59" if "retain_hourly" in item else "720",
-                                            script_dump_part=script_dump_part
-                                        )
-
-                                    elif "mysql_dump_type" in item and item["mysql_dump_type"] == "mysqlsh":
-
-                                        if "exclude" in item:
-                                            databases_exclude = "--excludeSchemas="
-                                            databases_exclude += ",".join(item["exclude"])
-                                        else:
-                                            databases_exclude = ""
-
-                                        # Regex dots are to hide words that produce false positive
-                                        mysqlsh_output_filter = 'grep -v -e "dump may f..l with an e...r" -e "Writing DDL" -e "Data dump for" -e "Found e...rs loading plugins" -e "Preparing data dump for" -e "Could not select a column to be used as an index"'
-
-                                        if item["source"] == "ALL":
-                                            script_dump_part = textwrap.dedent(
-                                                """\
-                                                WAS_ERR=0
-                                                set +e
-                                                if [[ ! -d {mysql_dump_dir}/all.mysqlsh ]]; then
-                                                        {exec_before_dump}
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
-                                                            {dump_prefix_cmd} mysqlsh {mysqlsh_connect_args} -- util dump-instance {mysql_dump_dir}/all.mysqlsh --maxRate={mysqlsh_max_rate} --bytesPerChunk={mysqlsh_bytes_per_chunk} --threads={mysqlsh_threads} {databases_exclude} {mysqlsh_args} 2>&1 | {mysqlsh_output_filter}
-                                                            if [[ $? -ne 0 ]]; then
-                                                                WAS_ERR=1
-                                                                echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                            else
-                                                                echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                                break
-                                                            fi
-                                                        done
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        {exec_after_dump}
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                else
-                                                    echo "NOTICE: Valid dump already exists, skipping"
-                                                fi
-                                                set -e
-                                                if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
-                                                """
-                                            ).format(
-                                                mysql_dump_dir=item["mysql_dump_dir"],
-                                                dump_prefix_cmd=item["dump_prefix_cmd"],
-                                                exec_before_dump=item["exec_before_dump"],
-                                                exec_after_dump=item["exec_after_dump"],
-                                                mysqlsh_connect_args=item["mysqlsh_connect_args"],
-                                                mysqlsh_max_rate=item["mysqlsh_max_rate"],
-                                                mysqlsh_bytes_per_chunk=item["mysqlsh_bytes_per_chunk"],
-                                                mysqlsh_threads=item["mysqlsh_threads"],
-                                                databases_exclude=databases_exclude,
-                                                mysqlsh_args=item["mysqlsh_args"],
-                                                mysqlsh_output_filter=mysqlsh_output_filter,
-                                                dump_attempts=item["dump_attempts"]
-                                            )
-                                        else:
-                                            script_dump_part = textwrap.dedent(
-                                                """\
-                                                WAS_ERR=0
-                                                set +e
-                                                if [[ ! -d {mysql_dump_dir}/{source}.mysqlsh ]]; then
-                                                        {exec_before_dump}
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
-                                                            {dump_prefix_cmd} mysqlsh {mysqlsh_connect_args} -- util dump-schemas {source} --outputUrl={mysql_dump_dir}/{source}.mysqlsh --maxRate={mysqlsh_max_rate} --bytesPerChunk={mysqlsh_bytes_per_chunk} --threads={mysqlsh_threads} {mysqlsh_args} 2>&1 | {mysqlsh_output_filter}
-                                                            if [[ $? -ne 0 ]]; then
-                                                                WAS_ERR=1
-                                                                echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                            else
-                                                                echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                                break
-                                                            fi
-                                                        done
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        {exec_after_dump}
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                else
-                                                    echo "NOTICE: Valid dump already exists, skipping"
-                                                fi
-                                                set -e
-                                                if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
-                                                """
-                                            ).format(
-                                                mysql_dump_dir=item["mysql_dump_dir"],
-                                                source=item["source"],
-                                                dump_prefix_cmd=item["dump_prefix_cmd"],
-                                                exec_before_dump=item["exec_before_dump"],
-                                                exec_after_dump=item["exec_after_dump"],
-                                                mysqlsh_connect_args=item["mysqlsh_connect_args"],
-                                                mysqlsh_max_rate=item["mysqlsh_max_rate"],
-                                                mysqlsh_bytes_per_chunk=item["mysqlsh_bytes_per_chunk"],
-                                                mysqlsh_threads=item["mysqlsh_threads"],
-                                                mysqlsh_args=item["mysqlsh_args"],
-                                                mysqlsh_output_filter=mysqlsh_output_filter,
-                                                dump_attempts=item["dump_attempts"]
-                                            )
-
-                                        # If hourly retains are used keep dumps only for 59 minutes
-                                        script = textwrap.dedent(
-                                            """\
-                                            #!/bin/bash
-                                            set -e
-
-                                            ssh {ssh_args} -p {port} {user}@{host} '
-                                                set -x
-                                                set -e
-                                                set -o pipefail
-                                                mkdir -p {mysql_dump_dir}
-                                                chmod 700 {mysql_dump_dir}
-                                                while [[ -d {mysql_dump_dir}/dump.lock ]]; do
-                                                        sleep 5
-                                                done
-                                                mkdir {mysql_dump_dir}/dump.lock
-                                                trap "rm -rf {mysql_dump_dir}/dump.lock" 0
-                                                cd {mysql_dump_dir}
-                                                find {mysql_dump_dir} -type d -name "*.mysqlsh" -mmin +{mmin} -exec rm -rf {{}} +
-                                                {script_dump_part}
-                                            '
-                                            """
-                                        ).format(
-                                            ssh_args=ssh_args,
-                                            port=item["connect_port"],
-                                            user=item["connect_user"],
-                                            host=item["connect_host"],
-                                            mysql_dump_dir=item["mysql_dump_dir"],
-                                            mmin="59" if "retain_hourly" in item else "720",
-                                            script_dump_part=script_dump_part
-                                        )
-
-                                    elif "docker_mode" in item and item["docker_mode"]:
-
-                                        if item["source"] == "ALL":
-                                            script_dump_part = textwrap.dedent(
-                                                """\
-                                                docker exec {container} sh -lc 'mysql -u"$MYSQL_USER" -p"$MYSQL_PASSWORD" --skip-column-names --batch -e "SHOW DATABASES;"' | grep -v -e information_schema -e performance_schema {grep_db_filter} > {mysql_dump_dir}/db_list.txt
-                                                WAS_ERR=0
-                                                for db in $(cat {mysql_dump_dir}/db_list.txt); do
-                                                        set +e
-                                                        if [[ ! -f {mysql_dump_dir}/$db.gz ]]; then
-                                                                {exec_before_dump}
-                                                                if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                                for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
-                                                                    docker exec {container} sh -lc '{dump_prefix_cmd} mysqldump -u"$MYSQL_USER" -p"$MYSQL_PASSWORD" --force --opt --single-transaction --quick --skip-lock-tables {mysql_events} --databases $1 --max_allowed_packet=1G {mysqldump_args}' -- $db | gzip > {mysql_dump_dir}/$db.gz
-                                                                    if [[ $? -ne 0 ]]; then
-                                                                        WAS_ERR=1
-                                                                        echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                                    else
-                                                                        echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                                        break
-                                                                    fi
-                                                                done
-                                                                if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                                {exec_after_dump}
-                                                                if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        else
-                                                            echo "NOTICE: Valid dump already exists, skipping"
-                                                        fi
-                                                        set -e
-                                                done
-                                                if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
-                                                """
-                                            ).format(
-                                                mysql_dump_dir=item["mysql_dump_dir"],
-                                                mysql_events="" if item["mysql_noevents"] else "--events",
-                                                dump_prefix_cmd=item["dump_prefix_cmd"],
-                                                exec_before_dump=item["exec_before_dump"],
-                                                exec_after_dump=item["exec_after_dump"],
-                                                mysqldump_args=item["mysqldump_args"],
-                                                grep_db_filter=grep_db_filter,
-                                                dump_attempts=item["dump_attempts"],
-                                                container=item["docker_container"]
-                                            )
-                                        else:
-                                            script_dump_part = textwrap.dedent(
-                                                """\
-                                                WAS_ERR=0
-                                                set +e
-                                                if [[ ! -f {mysql_dump_dir}/{source}.gz ]]; then
-                                                        {exec_before_dump}
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
-                                                            docker exec {container} sh -lc '{dump_prefix_cmd} mysqldump -u"$MYSQL_USER" -p"$MYSQL_PASSWORD" --force --opt --single-transaction --quick --skip-lock-tables {mysql_events} --databases {source} --max_allowed_packet=1G {mysqldump_args}' | gzip > {mysql_dump_dir}/{source}.gz
-                                                            if [[ $? -ne 0 ]]; then
-                                                                WAS_ERR=1
-                                                                echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                            else
-                                                                echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                                break
-                                                            fi
-                                                        done
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        {exec_after_dump}
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                else
-                                                    echo "NOTICE: Valid dump already exists, skipping"
-                                                fi
-                                                set -e
-                                                if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
-                                                """
-                                            ).format(
-                                                mysql_dump_dir=item["mysql_dump_dir"],
-                                                mysql_events="" if item["mysql_noevents"] else "--events",
-                                                dump_prefix_cmd=item["dump_prefix_cmd"],
-                                                exec_before_dump=item["exec_before_dump"],
-                                                exec_after_dump=item["exec_after_dump"],
-                                                mysqldump_args=item["mysqldump_args"],
-                                                grep_db_filter=grep_db_filter,
-                                                source=item["source"],
-                                                dump_attempts=item["dump_attempts"],
-                                                container=item["docker_container"]
-                                            )
-
-                                        # If hourly retains are used keep dumps only for 59 minutes
-                                        script = textwrap.dedent(
-                                            """\
-                                            #!/bin/bash
-                                            set -e
-
-                                            ssh {ssh_args} -p {port} {user}@{host} bash -se <<'EOF'
-                                                set -x
-                                                set -e
-                                                set -o pipefail
-                                                mkdir -p {mysql_dump_dir}
-                                                chmod 700 {mysql_dump_dir}
-                                                while [[ -d {mysql_dump_dir}/dump.lock ]]; do
-                                                        sleep 5
-                                                done
-                                                mkdir {mysql_dump_dir}/dump.lock
-                                                trap "rm -rf {mysql_dump_dir}/dump.lock" 0
-                                                cd {mysql_dump_dir}
-                                                find {mysql_dump_dir} -type f -name "*.gz" -mmin +{mmin} -delete
-                                                {script_dump_part}
-                                            EOF
-                                            """
-                                        ).format(
-                                            ssh_args=ssh_args,
-                                            port=item["connect_port"],
-                                            user=item["connect_user"],
-                                            host=item["connect_host"],
-                                            mysql_dump_dir=item["mysql_dump_dir"],
-                                            mmin="59" if "retain_hourly" in item else "720",
-                                            script_dump_part=script_dump_part
-                                        )
-
-                                    # Mysqldump default
-                                    else:
+                            if "exclude" in item:
+                                databases_exclude = "--databases-exclude=\"{databases}\"".format(databases=" ".join(item["exclude"]))
+                            else:
+                                databases_exclude = ""
+
+                            mariadb_backup_output_filter = 'grep -v -e "log scanned up to" -e "Skipping" -e "Compressing" -e "...done"'
+
+                            if item["source"] == "ALL":
+                                script_dump_part = MARIADB_BACKUP_DUMP_ALL_PART.format(
+                                    mariadb_backup_throttle=item["mariadb-backup_throttle"],
+                                    mariadb_backup_parallel=item["mariadb-backup_parallel"],
+                                    mariadb_backup_compress_threads=item["mariadb-backup_compress_threads"],
+                                    mysql_dump_dir=item["mysql_dump_dir"],
+                                    databases_exclude=databases_exclude,
+                                    dump_prefix_cmd=item["dump_prefix_cmd"],
+                                    exec_before_dump=item["exec_before_dump"],
+                                    exec_after_dump=item["exec_after_dump"],
+                                    mariadb_backup_args=item["mariadb-backup_args"],
+                                    mariadb_backup_output_filter=mariadb_backup_output_filter,
+                                    dump_attempts=item["dump_attempts"]
+                                )
+                            else:
+                                script_dump_part = MARIADB_BACKUP_DUMP_ONE_PART.format(
+                                    mariadb_backup_throttle=item["mariadb-backup_throttle"],
+                                    mariadb_backup_parallel=item["mariadb-backup_parallel"],
+                                    mariadb_backup_compress_threads=item["mariadb-backup_compress_threads"],
+                                    mysql_dump_dir=item["mysql_dump_dir"],
+                                    source=item["source"],
+                                    dump_prefix_cmd=item["dump_prefix_cmd"],
+                                    exec_before_dump=item["exec_before_dump"],
+                                    exec_after_dump=item["exec_after_dump"],
+                                    mariadb_backup_args=item["mariadb-backup_args"],
+                                    mariadb_backup_output_filter=mariadb_backup_output_filter,
+                                    dump_attempts=item["dump_attempts"]
+                                )
+
+                            script = MARIADB_BACKUP_SCRIPT.format(
+                                ssh_args=ssh_args,
+                                port=item["connect_port"],
+                                user=item["connect_user"],
+                                host=item["connect_host"],
+                                mysql_dump_dir=item["mysql_dump_dir"],
+                                mmin=dump_mmin,
+                                script_dump_part=script_dump_part
+                            )
 
-                                        if item["source"] == "ALL":
-                                            script_dump_part = textwrap.dedent(
-                                                """\
-                                                mysql --defaults-file=/etc/mysql/debian.cnf --skip-column-names --batch -e "SHOW DATABASES;" | grep -v -e information_schema -e performance_schema {grep_db_filter} > {mysql_dump_dir}/db_list.txt
-                                                WAS_ERR=0
-                                                for db in $(cat {mysql_dump_dir}/db_list.txt); do
-                                                        set +e
-                                                        if [[ ! -f {mysql_dump_dir}/$db.gz ]]; then
-                                                                {exec_before_dump}
-                                                                if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                                for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
-                                                                    {dump_prefix_cmd} mysqldump --defaults-file=/etc/mysql/debian.cnf --force --opt --single-transaction --quick --skip-lock-tables {mysql_events} --databases $db --max_allowed_packet=1G {mysqldump_args} | gzip > {mysql_dump_dir}/$db.gz
-                                                                    if [[ $? -ne 0 ]]; then
-                                                                        WAS_ERR=1
-                                                                        echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                                    else
-                                                                        echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                                        break
-                                                                    fi
-                                                                done
-                                                                if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                                {exec_after_dump}
-                                                                if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        else
-                                                            echo "NOTICE: Valid dump already exists, skipping"
-                                                        fi
-                                                        set -e
-                                                done
-                                                if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
-                                                """
-                                            ).format(
-                                                mysql_dump_dir=item["mysql_dump_dir"],
-                                                mysql_events="" if item["mysql_noevents"] else "--events",
-                                                dump_prefix_cmd=item["dump_prefix_cmd"],
-                                                exec_before_dump=item["exec_before_dump"],
-                                                exec_after_dump=item["exec_after_dump"],
-                                                mysqldump_args=item["mysqldump_args"],
-                                                grep_db_filter=grep_db_filter,
-                                                dump_attempts=item["dump_attempts"]
-                                            )
-                                        else:
-                                            script_dump_part = textwrap.dedent(
-                                                """\
-                                                WAS_ERR=0
-                                                set +e
-                                                if [[ ! -f {mysql_dump_dir}/{source}.gz ]]; then
-                                                        {exec_before_dump}
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
-                                                            {dump_prefix_cmd} mysqldump --defaults-file=/etc/mysql/debian.cnf --force --opt --single-transaction --quick --skip-lock-tables {mysql_events} --databases {source} --max_allowed_packet=1G {mysqldump_args} | gzip > {mysql_dump_dir}/{source}.gz
-                                                            if [[ $? -ne 0 ]]; then
-                                                                WAS_ERR=1
-                                                                echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                            else
-                                                                echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                                break
-                                                            fi
-                                                        done
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                        {exec_after_dump}
-                                                        if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                else
-                                                    echo "NOTICE: Valid dump already exists, skipping"
-                                                fi
-                                                set -e
-                                                if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
-                                                """
-                                            ).format(
-                                                mysql_dump_dir=item["mysql_dump_dir"],
-                                                mysql_events="" if item["mysql_noevents"] else "--events",
-                                                dump_prefix_cmd=item["dump_prefix_cmd"],
-                                                exec_before_dump=item["exec_before_dump"],
-                                                exec_after_dump=item["exec_after_dump"],
-                                                mysqldump_args=item["mysqldump_args"],
-                                                grep_db_filter=grep_db_filter,
-                                                source=item["source"],
-                                                dump_attempts=item["dump_attempts"]
-                                            )
-
-                                        # If hourly retains are used keep dumps only for 59 minutes
-                                        script = textwrap.dedent(
-                                            """\
-                                            #!/bin/bash
-                                            set -e
-
-                                            ssh {ssh_args} -p {port} {user}@{host} '
-                                                set -x
-                                                set -e
-                                                set -o pipefail
-                                                mkdir -p {mysql_dump_dir}
-                                                chmod 700 {mysql_dump_dir}
-                                                while [[ -d {mysql_dump_dir}/dump.lock ]]; do
-                                                        sleep 5
-                                                done
-                                                mkdir {mysql_dump_dir}/dump.lock
-                                                trap "rm -rf {mysql_dump_dir}/dump.lock" 0
-                                                cd {mysql_dump_dir}
-                                                find {mysql_dump_dir} -type f -name "*.gz" -mmin +{mmin} -delete
-                                                {script_dump_part}
-                                            '
-                                            """
-                                        ).format(
-                                            ssh_args=ssh_args,
-                                            port=item["connect_port"],
-                                            user=item["connect_user"],
-                                            host=item["connect_host"],
-                                            mysql_dump_dir=item["mysql_dump_dir"],
-                                            mmin="59" if "retain_hourly" in item else "720",
-                                            script_dump_part=script_dump_part
-                                        )
-
-                                if item["type"] == "POSTGRESQL_SSH":
-
-                                    # --verbose is needed for Completed on signature in dumps, and sdterr shouldn't be redirected to /dev/null
-                                    # and it produces a lot of noise, we need to filter it
-                                    # 2>&1 cannot be used before | gzip
-                                    # grep output should be put into stderr again
-                                    # https://unix.stackexchange.com/questions/3514/how-to-grep-standard-error-stream-stderr
-                                    # allow pg_dump.*: connecting just to see what it does
-                                    if item["source"] == "ALL":
-
-                                        if "postgresql_dump_type" in item and item["postgresql_dump_type"] == "directory":
-                                            pg_dump_line_pipe_part = ""
-                                            pg_dump_format_part = "--format=directory --file={postgresql_dump_dir}/$db".format(postgresql_dump_dir=item["postgresql_dump_dir"])
-                                            if_exists_part = "-d {postgresql_dump_dir}/$db".format(postgresql_dump_dir=item["postgresql_dump_dir"])
-                                            mkdir_chown_part = "mkdir -p {postgresql_dump_dir}/$db && chown postgres:postgres {postgresql_dump_dir}/$db".format(postgresql_dump_dir=item["postgresql_dump_dir"])
-                                        else:
-                                            pg_dump_line_pipe_part = "| gzip > {postgresql_dump_dir}/$db.gz".format(postgresql_dump_dir=item["postgresql_dump_dir"])
-                                            pg_dump_format_part = "--format=plain"
-                                            if_exists_part = "-f {postgresql_dump_dir}/$db.gz".format(postgresql_dump_dir=item["postgresql_dump_dir"])
-                                            mkdir_chown_part = ""
-
-                                        script_dump_part = textwrap.dedent(
-                                            """\
-                                            {pg_run} "echo SELECT datname FROM pg_database | psql {pg_user} --no-align -t template1" {grep_db_filter} | grep -v -e template0 -e template1 > {postgresql_dump_dir}/db_list.txt
-                                            WAS_ERR=0
-                                            for db in $(cat {postgresql_dump_dir}/db_list.txt); do
-                                                    set +e
-                                                    if [[ ! {if_exists_part} ]]; then
-                                                            {mkdir_chown_part}
-                                                            {exec_before_dump}
-                                                            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                            for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
-                                                                {pg_run} "{dump_prefix_cmd} pg_dump {pg_user} --create {postgresql_clean} {pg_dump_args} {pg_dump_format_part} --verbose $db" 2> >({pg_dump_filter}) {pg_dump_line_pipe_part}
-                                                                if [[ $? -ne 0 ]]; then
-                                                                    WAS_ERR=1
-                                                                    echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                                else
-                                                                    echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                                    break
-                                                                fi
-                                                            done
-                                                            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                            {exec_after_dump}
-                                                            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                    else
-                                                        echo "NOTICE: Valid dump already exists, skipping"
-                                                    fi
-                                                    set -e
-                                            done
-                                            if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
-                                            """
-                                        ).format(
-                                            postgresql_dump_dir=item["postgresql_dump_dir"],
-                                            postgresql_clean="" if item["postgresql_noclean"] else "--clean --if-exists",
-                                            dump_prefix_cmd=item["dump_prefix_cmd"],
-                                            exec_before_dump=item["exec_before_dump"],
-                                            exec_after_dump=item["exec_after_dump"],
-                                            pg_dump_args=item["pg_dump_args"],
-                                            grep_db_filter=grep_db_filter,
-                                            pg_dump_filter=item["pg_dump_filter"],
-                                            dump_attempts=item["dump_attempts"],
-                                            pg_dump_line_pipe_part=pg_dump_line_pipe_part,
-                                            pg_dump_format_part=pg_dump_format_part,
-                                            if_exists_part=if_exists_part,
-                                            mkdir_chown_part=mkdir_chown_part,
-                                            pg_run="docker exec -u postgres {container} sh -lc".format(container=item["docker_container"]) if item["docker_mode"] else "su - postgres -c",
-                                            pg_user="-U {db_user}".format(db_user=item["db_user"]) if item["db_user"] else ""
-                                        )
-                                    else:
+                        elif "mysql_dump_type" in item and item["mysql_dump_type"] == "mysqlsh":
 
-                                        if "postgresql_dump_type" in item and item["postgresql_dump_type"] == "directory":
-                                            pg_dump_line_pipe_part = ""
-                                            pg_dump_format_part = "--format=directory --file={postgresql_dump_dir}/{source}".format(postgresql_dump_dir=item["postgresql_dump_dir"], source=item["source"])
-                                            if_exists_part = "-d {postgresql_dump_dir}/{source}".format(postgresql_dump_dir=item["postgresql_dump_dir"], source=item["source"])
-                                            mkdir_chown_part = "mkdir -p {postgresql_dump_dir}/{source} && chown postgres:postgres {postgresql_dump_dir}/{source}".format(postgresql_dump_dir=item["postgresql_dump_dir"], source=item["source"])
-                                        else:
-                                            pg_dump_line_pipe_part = "| gzip > {postgresql_dump_dir}/{source}.gz".format(postgresql_dump_dir=item["postgresql_dump_dir"], source=item["source"])
-                                            pg_dump_format_part = "--format=plain"
-                                            if_exists_part = "-f {postgresql_dump_dir}/{source}.gz".format(postgresql_dump_dir=item["postgresql_dump_dir"], source=item["source"])
-                                            mkdir_chown_part = ""
-
-                                        script_dump_part = textwrap.dedent(
-                                            """\
-                                            WAS_ERR=0
-                                            set +e
-                                            if [[ ! {if_exists_part} ]]; then
-                                                    {mkdir_chown_part}
-                                                    {exec_before_dump}
-                                                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                    for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
-                                                        {pg_run} "{dump_prefix_cmd} pg_dump {pg_user} --create {postgresql_clean} {pg_dump_args} {pg_dump_format_part} --verbose {source}" 2> >({pg_dump_filter}) {pg_dump_line_pipe_part}
-                                                        if [[ $? -ne 0 ]]; then
-                                                            WAS_ERR=1
-                                                            echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                        else
-                                                            echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                            break
-                                                        fi
-                                                    done
-                                                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                    {exec_after_dump}
-                                                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                            else
-                                                echo "NOTICE: Valid dump already exists, skipping"
-                                            fi
-                                            set -e
-                                            if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
-                                            """
-                                        ).format(
-                                            postgresql_dump_dir=item["postgresql_dump_dir"],
-                                            postgresql_clean="" if item["postgresql_noclean"] else "--clean --if-exists",
-                                            dump_prefix_cmd=item["dump_prefix_cmd"],
-                                            exec_before_dump=item["exec_before_dump"],
-                                            exec_after_dump=item["exec_after_dump"],
-                                            pg_dump_args=item["pg_dump_args"],
-                                            grep_db_filter=grep_db_filter,
-                                            source=item["source"],
-                                            pg_dump_filter=item["pg_dump_filter"],
-                                            dump_attempts=item["dump_attempts"],
-                                            pg_dump_line_pipe_part=pg_dump_line_pipe_part,
-                                            pg_dump_format_part=pg_dump_format_part,
-                                            if_exists_part=if_exists_part,
-                                            mkdir_chown_part=mkdir_chown_part,
-                                            pg_run="docker exec -u postgres {container} sh -lc".format(container=item["docker_container"]) if item["docker_mode"] else "su - postgres -c",
-                                            pg_user="-U {db_user}".format(db_user=item["db_user"]) if item["db_user"] else ""
-                                        )
-
-                                    if "postgresql_dump_type" in item and item["postgresql_dump_type"] == "directory":
-                                        # Name mask is not needed for directory dumps, as directories are used as db dump folders only
-                                        find_part = '-type d'
-                                        # With directory format pg_dump writes by itself to the directory, chown needed for pg_dump to be able to traverse to dump directory
-                                        chown_part = "chown postgres:postgres {postgresql_dump_dir}".format(postgresql_dump_dir=item["postgresql_dump_dir"])
-                                    else:
-                                        find_part = '-type f -name "*.gz"'
-                                        chown_part = ""
-
-                                    # If hourly retains are used keep dumps only for 59 minutes
-                                    script = textwrap.dedent(
-                                        """\
-                                        #!/bin/bash
-                                        set -e
-
-                                        ssh {ssh_args} -p {port} {user}@{host} '
-                                            set -x
-                                            set -e
-                                            set -o pipefail
-                                            mkdir -p {postgresql_dump_dir}
-                                            chmod 700 {postgresql_dump_dir}
-                                            {chown_part}
-                                            while [[ -d {postgresql_dump_dir}/dump.lock ]]; do
-                                                    sleep 5
-                                            done
-                                            mkdir {postgresql_dump_dir}/dump.lock
-                                            trap "rm -rf {postgresql_dump_dir}/dump.lock" 0
-                                            cd {postgresql_dump_dir}
-                                            find {postgresql_dump_dir} {find_part} -mmin +{mmin} -exec rm -rf {{}} +
-                                            {exec_before_dump}
-                                            {comment_out_pg_dumpall}{pg_run} "pg_dumpall {pg_user} --clean --if-exists --schema-only --verbose" 2> >({pg_dump_filter}) | gzip > {postgresql_dump_dir}/globals.gz
-                                            {exec_after_dump}
-                                            {script_dump_part}
-                                        '
-                                        """
-                                    ).format(
-                                        ssh_args=ssh_args,
-                                        port=item["connect_port"],
-                                        user=item["connect_user"],
-                                        host=item["connect_host"],
-                                        postgresql_dump_dir=item["postgresql_dump_dir"],
-                                        mmin="59" if "retain_hourly" in item else "720",
-                                        script_dump_part=script_dump_part,
-                                        pg_dump_filter=item["pg_dump_filter"],
-                                        exec_before_dump=item["exec_before_dump"],
-                                        exec_after_dump=item["exec_after_dump"],
-                                        find_part=find_part,
-                                        chown_part=chown_part,
-                                        comment_out_pg_dumpall="#" if item["postgresql_skip_globals"] else "",
-                                        pg_run="docker exec -u postgres {container} sh -lc".format(container=item["docker_container"]) if item["docker_mode"] else "su - postgres -c",
-                                        pg_user="-U {db_user}".format(db_user=item["db_user"]) if item["db_user"] else ""
-                                    )
+                            if "exclude" in item:
+                                databases_exclude = "--excludeSchemas={databases}".format(databases=",".join(item["exclude"]))
+                            else:
+                                databases_exclude = ""
+
+                            # Regex dots are to hide words that produce false positive
+                            mysqlsh_output_filter = 'grep -v -e "dump may f..l with an e...r" -e "Writing DDL" -e "Data dump for" -e "Found e...rs loading plugins" -e "Preparing data dump for" -e "Could not select a column to be used as an index"'
+
+                            if item["source"] == "ALL":
+                                script_dump_part = MYSQLSH_DUMP_ALL_PART.format(
+                                    mysql_dump_dir=item["mysql_dump_dir"],
+                                    dump_prefix_cmd=item["dump_prefix_cmd"],
+                                    exec_before_dump=item["exec_before_dump"],
+                                    exec_after_dump=item["exec_after_dump"],
+                                    mysqlsh_connect_args=item["mysqlsh_connect_args"],
+                                    mysqlsh_max_rate=item["mysqlsh_max_rate"],
+                                    mysqlsh_bytes_per_chunk=item["mysqlsh_bytes_per_chunk"],
+                                    mysqlsh_threads=item["mysqlsh_threads"],
+                                    databases_exclude=databases_exclude,
+                                    mysqlsh_args=item["mysqlsh_args"],
+                                    mysqlsh_output_filter=mysqlsh_output_filter,
+                                    dump_attempts=item["dump_attempts"]
+                                )
+                            else:
+                                script_dump_part = MYSQLSH_DUMP_ONE_PART.format(
+                                    mysql_dump_dir=item["mysql_dump_dir"],
+                                    source=item["source"],
+                                    dump_prefix_cmd=item["dump_prefix_cmd"],
+                                    exec_before_dump=item["exec_before_dump"],
+                                    exec_after_dump=item["exec_after_dump"],
+                                    mysqlsh_connect_args=item["mysqlsh_connect_args"],
+                                    mysqlsh_max_rate=item["mysqlsh_max_rate"],
+                                    mysqlsh_bytes_per_chunk=item["mysqlsh_bytes_per_chunk"],
+                                    mysqlsh_threads=item["mysqlsh_threads"],
+                                    mysqlsh_args=item["mysqlsh_args"],
+                                    mysqlsh_output_filter=mysqlsh_output_filter,
+                                    dump_attempts=item["dump_attempts"]
+                                )
+
+                            script = MYSQLSH_SCRIPT.format(
+                                ssh_args=ssh_args,
+                                port=item["connect_port"],
+                                user=item["connect_user"],
+                                host=item["connect_host"],
+                                mysql_dump_dir=item["mysql_dump_dir"],
+                                mmin=dump_mmin,
+                                script_dump_part=script_dump_part
+                            )
 
-                                if item["type"] == "MONGODB_SSH":
+                        elif "docker_mode" in item and item["docker_mode"]:
+
+                            if item["source"] == "ALL":
+                                script_dump_part = MYSQL_DOCKER_DUMP_ALL_PART.format(
+                                    mysql_dump_dir=item["mysql_dump_dir"],
+                                    mysql_events=mysql_events,
+                                    dump_prefix_cmd=item["dump_prefix_cmd"],
+                                    exec_before_dump=item["exec_before_dump"],
+                                    exec_after_dump=item["exec_after_dump"],
+                                    mysqldump_args=item["mysqldump_args"],
+                                    grep_db_filter=grep_db_filter,
+                                    dump_attempts=item["dump_attempts"],
+                                    container=item["docker_container"]
+                                )
+                            else:
+                                script_dump_part = MYSQL_DOCKER_DUMP_ONE_PART.format(
+                                    mysql_dump_dir=item["mysql_dump_dir"],
+                                    mysql_events=mysql_events,
+                                    dump_prefix_cmd=item["dump_prefix_cmd"],
+                                    exec_before_dump=item["exec_before_dump"],
+                                    exec_after_dump=item["exec_after_dump"],
+                                    mysqldump_args=item["mysqldump_args"],
+                                    grep_db_filter=grep_db_filter,
+                                    source=item["source"],
+                                    dump_attempts=item["dump_attempts"],
+                                    container=item["docker_container"]
+                                )
+
+                            script = MYSQL_DOCKER_SCRIPT.format(
+                                pigz_threads_arg=" -p {threads}".format(threads=item["compression_threads"]) if item["compression_threads"] else "",
+                                ssh_args=ssh_args,
+                                port=item["connect_port"],
+                                user=item["connect_user"],
+                                host=item["connect_host"],
+                                mysql_dump_dir=item["mysql_dump_dir"],
+                                mmin=dump_mmin,
+                                script_dump_part=script_dump_part
+                            )
 
-                                    if item["source"] == "ALL":
-                                        if item["mongo_secondary_ok"]:
-                                            show_dbs_part = textwrap.dedent(
-                                                """\
-                                                echo "db.getMongo().setSecondaryOk()
-                                                show dbs" """
-                                            )
-                                        else:
-                                            show_dbs_part = "echo show dbs"
-                                        if item["mongodump_skip_tar"]:
-                                            tar_part = ""
-                                        else:
-                                            tar_part = textwrap.dedent(
-                                                """\
-                                                tar zcvf {mongodb_dump_dir}/$db.tar.gz $db
-                                                if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                rm -rf {mongodb_dump_dir}/$db
-                                                """
-                                            ).format(
-                                                mongodb_dump_dir=item["mongodb_dump_dir"]
-                                            )
-                                        script_dump_part = textwrap.dedent(
-                                            """\
-                                            if command -v mongo >/dev/null 2>&1; then
-                                                    {show_dbs_part} | mongo --quiet {mongo_args} | cut -f1 -d" " | grep -v -e local {grep_db_filter} > {mongodb_dump_dir}/db_list.txt
-                                            else                    
-                                                    mongosh --quiet --eval "db.adminCommand({listDatabases}).databases.forEach(d=>print(d.name))" {mongo_args} | cut -f1 -d" " | grep -v -e local {grep_db_filter} > {mongodb_dump_dir}/db_list.txt
-                                            fi 
-                                            WAS_ERR=0
-                                            for db in $(cat {mongodb_dump_dir}/db_list.txt); do
-                                                    set +e
-                                                    if [[ ! -f {mongodb_dump_dir}/$db.tar.gz ]]; then
-                                                            {exec_before_dump}
-                                                            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                            for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
-                                                                {dump_prefix_cmd} mongodump --quiet {mongodump_args} --out {mongodb_dump_dir} --dumpDbUsersAndRoles --db $db
-                                                                if [[ $? -ne 0 ]]; then
-                                                                    WAS_ERR=1
-                                                                    echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                                else
-                                                                    echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                                    break
-                                                                fi
-                                                            done
-                                                            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                            cd {mongodb_dump_dir}
-                                                            {tar_part}
-                                                            {exec_after_dump}
-                                                            if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                    else
-                                                        echo "NOTICE: Valid dump already exists, skipping"
-                                                    fi
-                                                    set -e
-                                            done
-                                            if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
-                                            """
-                                        ).format(
-                                            show_dbs_part=show_dbs_part,
-                                            mongodb_dump_dir=item["mongodb_dump_dir"],
-                                            dump_prefix_cmd=item["dump_prefix_cmd"],
-                                            exec_before_dump=item["exec_before_dump"],
-                                            tar_part=tar_part,
-                                            exec_after_dump=item["exec_after_dump"],
-                                            mongo_args=item["mongo_args"],
-                                            mongodump_args=item["mongodump_args"],
-                                            grep_db_filter=grep_db_filter,
-                                            dump_attempts=item["dump_attempts"],
-                                            listDatabases="{listDatabases:1}"
-                                        )
-                                    else:
-                                        if item["mongodump_skip_tar"]:
-                                            tar_part = ""
-                                        else:
-                                            tar_part = textwrap.dedent(
-                                                """\
-                                                tar zcvf {mongodb_dump_dir}/{source}.tar.gz {source}
-                                                if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                rm -rf {mongodb_dump_dir}/{source}
-                                                """
-                                            ).format(
-                                                mongodb_dump_dir=item["mongodb_dump_dir"],
-                                                source=item["source"]
-                                            )
-                                        script_dump_part = textwrap.dedent(
-                                            """\
-                                            WAS_ERR=0
-                                            set +e
-                                            if [[ ! -f {mongodb_dump_dir}/{source}.tar.gz ]]; then
-                                                    {exec_before_dump}
-                                                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                    for DUMP_ATTEMPT in $(seq 1 {dump_attempts}); do
-                                                        {dump_prefix_cmd} mongodump --quiet {mongodump_args} --out {mongodb_dump_dir} --dumpDbUsersAndRoles --db {source}
-                                                        if [[ $? -ne 0 ]]; then
-                                                            WAS_ERR=1
-                                                            echo "ERROR: Dump failed, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                        else
-                                                            echo "NOTICE: Dump succeeded, attempt $DUMP_ATTEMPT of {dump_attempts}"
-                                                            break
-                                                        fi
-                                                    done
-                                                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                                    cd {mongodb_dump_dir}
-                                                    {tar_part}
-                                                    {exec_after_dump}
-                                                    if [[ $? -ne 0 ]]; then WAS_ERR=1; fi
-                                            else
-                                                echo "NOTICE: Valid dump already exists, skipping"
-                                            fi
-                                            set -e
-                                            if [[ $WAS_ERR -ne 0 ]]; then false; else true; fi
-                                            """
-                                        ).format(
-                                            mongodb_dump_dir=item["mongodb_dump_dir"],
-                                            dump_prefix_cmd=item["dump_prefix_cmd"],
-                                            exec_before_dump=item["exec_before_dump"],
-                                            tar_part=tar_part,
-                                            exec_after_dump=item["exec_after_dump"],
-                                            mongo_args=item["mongo_args"],
-                                            mongodump_args=item["mongodump_args"],
-                                            grep_db_filter=grep_db_filter,
-                                            source=item["source"],
-                                            dump_attempts=item["dump_attempts"]
-                                        )
-
-                                    # If hourly retains are used keep dumps only for 59 minutes
-                                    script = textwrap.dedent(
-                                        """\
-                                        #!/bin/bash
-                                        set -e
-
-                                        ssh {ssh_args} -p {port} {user}@{host} '
-                                            set -x
-                                            set -e
-                                            set -o pipefail
-                                            mkdir -p {mongodb_dump_dir}
-                                            chmod 700 {mongodb_dump_dir}
-                                            while [[ -d {mongodb_dump_dir}/dump.lock ]]; do
-                                                    sleep 5
-                                            done
-                                            mkdir {mongodb_dump_dir}/dump.lock
-                                            trap "rm -rf {mongodb_dump_dir}/dump.lock" 0
-                                            cd {mongodb_dump_dir}
-                                            find {mongodb_dump_dir} -type f -name "*.tar.gz" -mmin +{mmin} -delete
-                                            {script_dump_part}
-                                        '
-                                        """
-                                    ).format(
-                                        ssh_args=ssh_args,
-                                        port=item["connect_port"],
-                                        user=item["connect_user"],
-                                        host=item["connect_host"],
-                                        mongodb_dump_dir=item["mongodb_dump_dir"],
-                                        mmin="59" if "retain_hourly" in item else "720",
-                                        script_dump_part=script_dump_part
-                                    )
+                        # Mysqldump streamed over ssh
+                        elif item["mysqldump_stream"]:
 
-                                log_and_print("NOTICE", "Running remote dump on item number {number}:".format(number=item["number"]), logger)
-                                try:
-                                    retcode = run_cmd(script)
-                                    if retcode == 0:
-                                        log_and_print("NOTICE", "Remote dump succeeded on item number {number}".format(number=item["number"]), logger)
-                                    else:
-                                        if not item["ignore_remote_dump_failed"]:
-                                            log_and_print("ERROR", "Remote dump failed on item number {number}, not doing sync".format(number=item["number"]), logger)
-                                            errors += 1
-                                            continue
-                                        else:
-                                            log_and_print("ERROR", "Remote dump failed on item number {number}, but doing sync due to ignore_remote_dump_failed".format(number=item["number"]), logger)
-                                            errors += 1
-                                except Exception as e:
-                                    logger.exception(e)
-                                    raise Exception("Caught exception on subprocess.run execution")
-
-                                # Remove partially downloaded dumps
-                                log_and_print("NOTICE", "Removing partially downloaded dumps if any on item number {number}:".format(number=item["number"]), logger)
-                                if item["type"] == "MYSQL_SSH":
-                                    if "mysql_dump_type" in item and item["mysql_dump_type"] == "xtrabackup":
-                                        script = textwrap.dedent(
-                                            """\
-                                            #!/bin/bash
-                                            set -e
-                                            if [[ -d {snapshot_root}/.sync/rsnapshot{mysql_dump_dir} ]]; then
-                                                find {snapshot_root}/.sync/rsnapshot{mysql_dump_dir} -type f -name "*.qp.*" -or -name "*.zst.*" -delete
-                                            fi
-                                            """
-                                        ).format(
-                                            snapshot_root=item["path"],
-                                            mysql_dump_dir=item["mysql_dump_dir"]
-                                        )
-                                    if "mysql_dump_type" in item and item["mysql_dump_type"] == "mariadb-backup":
-                                        script = textwrap.dedent(
-                                            """\
-                                            #!/bin/bash
-                                            set -e
-                                            if [[ -d {snapshot_root}/.sync/rsnapshot{mysql_dump_dir} ]]; then
-                                                find {snapshot_root}/.sync/rsnapshot{mysql_dump_dir} -type f -name "*.qp.*" -or -name "*.zst.*" -delete
-                                            fi
-                                            """
-                                        ).format(
-                                            snapshot_root=item["path"],
-                                            mysql_dump_dir=item["mysql_dump_dir"]
-                                        )
-                                    elif "mysql_dump_type" in item and item["mysql_dump_type"] == "mysqlsh":
-                                        script = textwrap.dedent(
-                                            """\
-                                            #!/bin/bash
-                                            set -e
-                                            if [[ -d {snapshot_root}/.sync/rsnapshot{mysql_dump_dir} ]]; then
-                                                find {snapshot_root}/.sync/rsnapshot{mysql_dump_dir} -type f -name "*.zst.*" -delete
-                                            fi
-                                            """
-                                        ).format(
-                                            snapshot_root=item["path"],
-                                            mysql_dump_dir=item["mysql_dump_dir"]
-                                        )
-                                    else:
-                                        script = textwrap.dedent(
-                                            """\
-                                            #!/bin/bash
-                                            set -e
-                                            rm -f {snapshot_root}/.sync/rsnapshot{mysql_dump_dir}/.*.gz.*
-                                            """
-                                        ).format(
-                                            snapshot_root=item["path"],
-                                            mysql_dump_dir=item["mysql_dump_dir"]
-                                        )
-                                if item["type"] == "POSTGRESQL_SSH":
-                                    if "postgresql_dump_type" in item and item["postgresql_dump_type"] == "directory":
-                                        script = textwrap.dedent(
-                                            """\
-                                            #!/bin/bash
-                                            set -e
-                                            if [[ -d {snapshot_root}/.sync/rsnapshot{postgresql_dump_dir} ]]; then
-                                                find {snapshot_root}/.sync/rsnapshot{postgresql_dump_dir} -type f -name "*.zst.*" -or -name "*.gz.*" -delete
-                                            fi
-                                            """
-                                        ).format(
-                                            snapshot_root=item["path"],
-                                            postgresql_dump_dir=item["postgresql_dump_dir"]
-                                        )
-                                    else:
-                                        script = textwrap.dedent(
-                                            """\
-                                            #!/bin/bash
-                                            set -e
-                                            rm -f {snapshot_root}/.sync/rsnapshot{postgresql_dump_dir}/.*.gz.*
-                                            """
-                                        ).format(
-                                            snapshot_root=item["path"],
-                                            postgresql_dump_dir=item["postgresql_dump_dir"]
-                                        )
-                                if item["type"] == "MONGODB_SSH":
-                                    script = textwrap.dedent(
-                                        """\
-                                        #!/bin/bash
-                                        set -e
-                                        rm -f {snapshot_root}/.sync/rsnapshot{mongodb_dump_dir}/.*.tar.gz.*
-                                        """
-                                    ).format(
-                                        snapshot_root=item["path"],
-                                        mongodb_dump_dir=item["mongodb_dump_dir"]
-                                    )
-                                try:
-                                    retcode = run_cmd(script)
-                                    if retcode == 0:
-                                        log_and_print("NOTICE", "Removing partially downloaded dumps command succeeded on item number {number}".format(number=item["number"]), logger)
-                                    else:
-                                        log_and_print("ERROR", "Removing partially downloaded dumps command failed on item number {number}, but script continues".format(number=item["number"]), logger)
-                                        errors += 1
-                                except Exception as e:
-                                    logger.exception(e)
-                                    raise Exception("Caught exception on subprocess.run execution")
+                            # Stream each mysqldump over ssh straight into .sync - the dump is
+                            # written once on the backup host instead of hitting the remote disk
+                            # and being rsynced back afterwards
+                            dump_streamed = True
+                            if item["source"] == "ALL":
+                                stream_dump_part = MYSQL_STREAM_DUMP_ALL_PART.format(
+                                    snapshot_root=item["path"],
+                                    mysql_dump_dir=item["mysql_dump_dir"],
+                                    ssh_args=ssh_args,
+                                    port=item["connect_port"],
+                                    user=item["connect_user"],
+                                    host=item["connect_host"],
+                                    mysql_events=mysql_events,
+                                    dump_prefix_cmd=item["dump_prefix_cmd"],
+                                    mysqldump_args=item["mysqldump_args"],
+                                    grep_db_filter=grep_db_filter
+                                )
+                            else:
+                                stream_dump_part = MYSQL_STREAM_DUMP_ONE_PART.format(
+                                    snapshot_root=item["path"],
+                                    mysql_dump_dir=item["mysql_dump_dir"],
+                                    ssh_args=ssh_args,
+                                    port=item["connect_port"],
+                                    user=item["connect_user"],
+                                    host=item["connect_host"],
+                                    mysql_events=mysql_events,
+                                    dump_prefix_cmd=item["dump_prefix_cmd"],
+                                    mysqldump_args=item["mysqldump_args"],
+                                    source=item["source"]
+                                )
+                            script = MYSQL_STREAM_SCRIPT.format(
+                                snapshot_root=item["path"],
+                                mysql_dump_dir=item["mysql_dump_dir"],
+                                mmin=dump_mmin,
+                                ssh_args=ssh_args,
+                                port=item["connect_port"],
+                                user=item["connect_user"],
+                                host=item["connect_host"],
+                                stream_dump_part=stream_dump_part
+                            )
 
-                            # Populate backup lines in config
+                        # Mysqldump default
+                        else:
 
-                            conf_backup_line_template_self = textwrap.dedent(
-                                """\
-                                backup		{source}/	rsnapshot/{tab_before_rsync_long_args}{rsync_long_args}
-                                """
+                            if item["source"] == "ALL":
+                                sig_db = "$db"
+                            else:
+                                sig_db = item["source"]
+                            if item["mysql_dump_skip_unchanged"]:
+                                skip_unchanged_part = MYSQL_SKIP_UNCHANGED_PART.format(
+                                    mysql_dump_dir=item["mysql_dump_dir"],
+                                    db=sig_db,
+                                    skip_action="return 0" if item["source"] == "ALL" else "exit 0"
+                                )
+                                sig_write_part = MYSQL_SIG_WRITE_PART.format(
+                                    mysql_dump_dir=item["mysql_dump_dir"],
+                                    db=sig_db
+                                )
+                            else:
+                                skip_unchanged_part = ""
+                                sig_write_part = ""
+
+                            if item["source"] == "ALL":
+                                script_dump_part = MYSQL_DUMP_ALL_PART.format(
+                                    mysql_dump_dir=item["mysql_dump_dir"],
+                                    mysql_events=mysql_events,
+                                    dump_prefix_cmd=item["dump_prefix_cmd"],
+                                    exec_before_dump=item["exec_before_dump"],
+                                    exec_after_dump=item["exec_after_dump"],
+                                    mysqldump_args=item["mysqldump_args"],
+                                    grep_db_filter=grep_db_filter,
+                                    dump_attempts=item["dump_attempts"],
+                                    parallel_dbs=item["parallel_dbs"],
+                                    skip_unchanged_part=skip_unchanged_part,
+                                    sig_write_part=sig_write_part
+                                )
+                            else:
+                                script_dump_part = MYSQL_DUMP_ONE_PART.format(
+                                    mysql_dump_dir=item["mysql_dump_dir"],
+                                    mysql_events=mysql_events,
+                                    dump_prefix_cmd=item["dump_prefix_cmd"],
+                                    exec_before_dump=item["exec_before_dump"],
+                                    exec_after_dump=item["exec_after_dump"],
+                                    mysqldump_args=item["mysqldump_args"],
+                                    grep_db_filter=grep_db_filter,
+                                    source=item["source"],
+                                    dump_attempts=item["dump_attempts"],
+                                    skip_unchanged_part=skip_unchanged_part,
+                                    sig_write_part=sig_write_part
+                                )
+
+                            script = MYSQL_SCRIPT.format(
+                                pigz_threads_arg=" -p {threads}".format(threads=item["compression_threads"]) if item["compression_threads"] else "",
+                                ssh_args=ssh_args,
+                                port=item["connect_port"],
+                                user=item["connect_user"],
+                                host=item["connect_host"],
+                                mysql_dump_dir=item["mysql_dump_dir"],
+                                # With signature skipping dumps are refreshed on change, keep a 7 day safety net only
+                                mmin="10080" if item["mysql_dump_skip_unchanged"] else dump_mmin,
+                                script_dump_part=script_dump_part
                             )
-                            conf_backup_line_template_ssh = textwrap.dedent(
-                                """\
-                                backup		{user}@{host}:{source}/	rsnapshot/{tab_before_rsync_long_args}{rsync_long_args}
-                                """
+
+                    if item["type"] == "POSTGRESQL_SSH":
+
+                        # --verbose is needed for Completed on signature in dumps, and sdterr shouldn't be redirected to /dev/null
+                        # and it produces a lot of noise, we need to filter it
+                        # 2>&1 cannot be used before | gzip
+                        # grep output should be put into stderr again
+                        # https://unix.stackexchange.com/questions/3514/how-to-grep-standard-error-stream-stderr
+                        # allow pg_dump.*: connecting just to see what it does
+                        if item["source"] == "ALL":
+
+                            if "postgresql_dump_type" in item and item["postgresql_dump_type"] == "directory":
+                                pg_dump_line_pipe_part = ""
+                                pg_dump_format_part = "--format=directory --file={postgresql_dump_dir}/$db".format(postgresql_dump_dir=item["postgresql_dump_dir"])
+                                if_exists_part = "-d {postgresql_dump_dir}/$db".format(postgresql_dump_dir=item["postgresql_dump_dir"])
+                                mkdir_chown_part = "mkdir -p {postgresql_dump_dir}/$db && chown postgres:postgres {postgresql_dump_dir}/$db".format(postgresql_dump_dir=item["postgresql_dump_dir"])
+                            else:
+                                pg_dump_line_pipe_part = "| $COMPRESS_CMD > {postgresql_dump_dir}/$db.{dump_ext}".format(postgresql_dump_dir=item["postgresql_dump_dir"], dump_ext=dump_ext)
+                                pg_dump_format_part = "--format=plain"
+                                if_exists_part = "-f {postgresql_dump_dir}/$db.{dump_ext}".format(postgresql_dump_dir=item["postgresql_dump_dir"], dump_ext=dump_ext)
+                                mkdir_chown_part = ""
+
+                            script_dump_part = POSTGRESQL_DUMP_ALL_PART.format(
+                                postgresql_dump_dir=item["postgresql_dump_dir"],
+                                postgresql_clean="" if item["postgresql_noclean"] else "--clean --if-exists",
+                                dump_prefix_cmd=item["dump_prefix_cmd"],
+                                exec_before_dump=item["exec_before_dump"],
+                                exec_after_dump=item["exec_after_dump"],
+                                pg_dump_args=item["pg_dump_args"],
+                                grep_db_filter=grep_db_filter,
+                                pg_dump_filter=item["pg_dump_filter"],
+                                dump_attempts=item["dump_attempts"],
+                                pg_dump_line_pipe_part=pg_dump_line_pipe_part,
+                                pg_dump_format_part=pg_dump_format_part,
+                                if_exists_part=if_exists_part,
+                                mkdir_chown_part=mkdir_chown_part,
+                                pg_run="docker exec -u postgres {container} sh -lc".format(container=item["docker_container"]) if item["docker_mode"] else "su - postgres -c",
+                                pg_user="-U {db_user}".format(db_user=item["db_user"]) if item["db_user"] else ""
                             )
-                            conf_backup_lines = ""
-
-                            if item["type"] == "RSYNC_SSH":
-
-                                if item["source"] in DATA_EXPAND:
-                                    for source in DATA_EXPAND[item["source"]]:
-                                        if not ("exclude" in item and source in item["exclude"]):
-                                            if item["host"] == SELF_HOSTNAME:
-                                                conf_backup_lines += conf_backup_line_template_self.format(
-                                                    source=source,
-                                                    tab_before_rsync_long_args="\t" if source == "/opt/sysadmws" else "",
-                                                    rsync_long_args="+rsync_long_args=--exclude=/opt/sysadmws/bulk_log --exclude=log" if source == "/opt/sysadmws" else ""
-                                                )
-                                            else:
-                                                conf_backup_lines += conf_backup_line_template_ssh.format(
-                                                    user=item["connect_user"],
-                                                    host=item["connect_host"],
-                                                    source=source,
-                                                    tab_before_rsync_long_args="\t" if source == "/opt/sysadmws" else "",
-                                                    rsync_long_args="+rsync_long_args=--exclude=/opt/sysadmws/bulk_log --exclude=log" if source == "/opt/sysadmws" else ""
-                                                )
-                                else:
-                                    if item["host"] == SELF_HOSTNAME:
-                                        conf_backup_lines += conf_backup_line_template_self.format(
-                                            source=item["source"],
-                                            tab_before_rsync_long_args="",
-                                            rsync_long_args=""
-                                        )
-                                    else:
-                                        conf_backup_lines += conf_backup_line_template_ssh.format(
-                                            user=item["connect_user"],
-                                            host=item["connect_host"],
-                                            source=item["source"],
-                                            tab_before_rsync_long_args="",
-                                            rsync_long_args=""
-                                        )
-
-                            if item["type"] == "MYSQL_SSH":
-                                # We do not need rsync compression as xtrabackup or mariadb-backup or mysqlsh dumps are already compressed
-                                # With compress it takes 10-12 times longer
-                                if item["host"] == SELF_HOSTNAME:
-                                    conf_backup_lines += conf_backup_line_template_self.format(
-                                        source=item["mysql_dump_dir"],
-                                        tab_before_rsync_long_args="\t" if "mysql_dump_type" in item and (item["mysql_dump_type"] == "xtrabackup" or item["mysql_dump_type"] == "mariadb-backup" or item["mysql_dump_type"] == "mysqlsh") else "",
-                                        rsync_long_args="+rsync_long_args=--no-compress" if "mysql_dump_type" in item and (item["mysql_dump_type"] == "xtrabackup" or item["mysql_dump_type"] == "mariadb-backup" or item["mysql_dump_type"] == "mysqlsh") else ""
-                                    )
-                                else:
-                                    conf_backup_lines += conf_backup_line_template_ssh.format(
-                                        user=item["connect_user"],
-                                        host=item["connect_host"],
-                                        source=item["mysql_dump_dir"],
-                                        tab_before_rsync_long_args="\t" if "mysql_dump_type" in item and (item["mysql_dump_type"] == "xtrabackup" or item["mysql_dump_type"] == "mariadb-backup" or item["mysql_dump_type"] == "mysqlsh") else "",
-                                        rsync_long_args="+rsync_long_args=--no-compress" if "mysql_dump_type" in item and (item["mysql_dump_type"] == "xtrabackup" or item["mysql_dump_type"] == "mariadb-backup" or item["mysql_dump_type"] == "mysqlsh") else ""
-                                    )
-                            if item["type"] == "POSTGRESQL_SSH":
-                                if item["host"] == SELF_HOSTNAME:
-                                    conf_backup_lines += conf_backup_line_template_self.format(
-                                        source=item["postgresql_dump_dir"],
-                                        tab_before_rsync_long_args="",
-                                        rsync_long_args=""
-                                    )
-                                else:
-                                    conf_backup_lines += conf_backup_line_template_ssh.format(
-                                        user=item["connect_user"],
-                                        host=item["connect_host"],
-                                        source=item["postgresql_dump_dir"],
-                                        tab_before_rsync_long_args="",
-                                        rsync_long_args=""
-                                    )
-                            if item["type"] == "MONGODB_SSH":
+                        else:
+
+                            if "postgresql_dump_type" in item and item["postgresql_dump_type"] == "directory":
+                                pg_dump_line_pipe_part = ""
+                                pg_dump_format_part = "--format=directory --file={postgresql_dump_dir}/{source}".format(postgresql_dump_dir=item["postgresql_dump_dir"], source=item["source"])
+                                if_exists_part = "-d {postgresql_dump_dir}/{source}".format(postgresql_dump_dir=item["postgresql_dump_dir"], source=item["source"])
+                                mkdir_chown_part = "mkdir -p {postgresql_dump_dir}/{source} && chown postgres:postgres {postgresql_dump_dir}/{source}".format(postgresql_dump_dir=item["postgresql_dump_dir"], source=item["source"])
+                            else:
+                                pg_dump_line_pipe_part = "| $COMPRESS_CMD > {postgresql_dump_dir}/{source}.{dump_ext}".format(postgresql_dump_dir=item["postgresql_dump_dir"], source=item["source"], dump_ext=dump_ext)
+                                pg_dump_format_part = "--format=plain"
+                                if_exists_part = "-f {postgresql_dump_dir}/{source}.{dump_ext}".format(postgresql_dump_dir=item["postgresql_dump_dir"], source=item["source"], dump_ext=dump_ext)
+                                mkdir_chown_part = ""
+
+                            script_dump_part = POSTGRESQL_DUMP_ONE_PART.format(
+                                postgresql_dump_dir=item["postgresql_dump_dir"],
+                                postgresql_clean="" if item["postgresql_noclean"] else "--clean --if-exists",
+                                dump_prefix_cmd=item["dump_prefix_cmd"],
+                                exec_before_dump=item["exec_before_dump"],
+                                exec_after_dump=item["exec_after_dump"],
+                                pg_dump_args=item["pg_dump_args"],
+                                grep_db_filter=grep_db_filter,
+                                source=item["source"],
+                                pg_dump_filter=item["pg_dump_filter"],
+                                dump_attempts=item["dump_attempts"],
+                                pg_dump_line_pipe_part=pg_dump_line_pipe_part,
+                                pg_dump_format_part=pg_dump_format_part,
+                                if_exists_part=if_exists_part,
+                                mkdir_chown_part=mkdir_chown_part,
+                                pg_run="docker exec -u postgres {container} sh -lc".format(container=item["docker_container"]) if item["docker_mode"] else "su - postgres -c",
+                                pg_user="-U {db_user}".format(db_user=item["db_user"]) if item["db_user"] else ""
+                            )
+
+                        if "postgresql_dump_type" in item and item["postgresql_dump_type"] == "directory":
+                            # Name mask is not needed for directory dumps, as directories are used as db dump folders only
+                            find_part = '-type d'
+                            # With directory format pg_dump writes by itself to the directory, chown needed for pg_dump to be able to traverse to dump directory
+                            chown_part = "chown postgres:postgres {postgresql_dump_dir}".format(postgresql_dump_dir=item["postgresql_dump_dir"])
+                        else:
+                            find_part = '-type f \\( -name "*.gz" -o -name "*.zst" \\)'
+                            chown_part = ""
+
+                        script = POSTGRESQL_SCRIPT.format(
+                            compress_cmd=compress_cmd,
+                            dump_ext=dump_ext,
+                            ssh_args=ssh_args,
+                            port=item["connect_port"],
+                            user=item["connect_user"],
+                            host=item["connect_host"],
+                            postgresql_dump_dir=item["postgresql_dump_dir"],
+                            mmin=dump_mmin,
+                            script_dump_part=script_dump_part,
+                            pg_dump_filter=item["pg_dump_filter"],
+                            exec_before_dump=item["exec_before_dump"],
+                            exec_after_dump=item["exec_after_dump"],
+                            find_part=find_part,
+                            chown_part=chown_part,
+                            pg_dumpall_part="" if item["postgresql_skip_globals"] else POSTGRESQL_DUMPALL_PART.format(
+                                postgresql_dump_dir=item["postgresql_dump_dir"],
+                                dump_ext=dump_ext,
+                                mmin=dump_mmin,
+                                pg_dump_filter=item["pg_dump_filter"],
+                                pg_run="docker exec -u postgres {container} sh -lc".format(container=item["docker_container"]) if item["docker_mode"] else "su - postgres -c",
+                                pg_user="-U {db_user}".format(db_user=item["db_user"]) if item["db_user"] else ""
+                            ),
+                            pg_run="docker exec -u postgres {container} sh -lc".format(container=item["docker_container"]) if item["docker_mode"] else "su - postgres -c",
+                            pg_user="-U {db_user}".format(db_user=item["db_user"]) if item["db_user"] else ""
+                        )
+
+                    if item["type"] == "MONGODB_SSH":
+
+                        # mongodump --archive --gzip writes one compressed stream per db in a single
+                        # pass, no intermediate bson dir and no tar/compress re-read
+                        if item["mongodump_archive"]:
+                            dump_file_ext = "archive.gz"
+                        else:
+                            dump_file_ext = "tar.{dump_ext}".format(dump_ext=dump_ext)
+
+                        if item["source"] == "ALL":
+                            if item["mongo_secondary_ok"]:
+                                show_dbs_part = MONGODB_SHOW_DBS_SECONDARY_OK_PART
+                            else:
+                                show_dbs_part = "echo show dbs"
+                            if item["mongodump_archive"]:
+                                tar_part = MONGODB_ARCHIVE_PUBLISH_ALL_PART.format(
+                                    mongodb_dump_dir=item["mongodb_dump_dir"]
+                                )
+                            elif item["mongodump_skip_tar"]:
+                                tar_part = ""
+                            else:
+                                tar_part = MONGODB_TAR_ALL_PART.format(
+                                    dump_ext=dump_ext,
+                                    mongodb_dump_dir=item["mongodb_dump_dir"]
+                                )
+                            script_dump_part = MONGODB_DUMP_ALL_PART.format(
+                                dump_file_ext=dump_file_ext,
+                                mongodump_output_part="--gzip --archive={mongodb_dump_dir}/$db.archive.gz.tmp".format(mongodb_dump_dir=item["mongodb_dump_dir"]) if item["mongodump_archive"] else "--out {mongodb_dump_dir}".format(mongodb_dump_dir=item["mongodb_dump_dir"]),
+                                show_dbs_part=show_dbs_part,
+                                mongodb_dump_dir=item["mongodb_dump_dir"],
+                                dump_prefix_cmd=item["dump_prefix_cmd"],
+                                exec_before_dump=item["exec_before_dump"],
+                                tar_part=tar_part,
+                                exec_after_dump=item["exec_after_dump"],
+                                mongo_args=item["mongo_args"],
+                                mongodump_args=item["mongodump_args"],
+                                grep_db_filter=grep_db_filter,
+                                dump_attempts=item["dump_attempts"],
+                                listDatabases="{listDatabases:1}"
+                            )
+                        else:
+                            if item["mongodump_archive"]:
+                                tar_part = MONGODB_ARCHIVE_PUBLISH_ONE_PART.format(
+                                    mongodb_dump_dir=item["mongodb_dump_dir"],
+                                    source=item["source"]
+                                )
+                            elif item["mongodump_skip_tar"]:
+                                tar_part = ""
+                            else:
+                                tar_part = MONGODB_TAR_ONE_PART.format(
+                                    dump_ext=dump_ext,
+                                    mongodb_dump_dir=item["mongodb_dump_dir"],
+                                    source=item["source"]
+                                )
+                            script_dump_part = MONGODB_DUMP_ONE_PART.format(
+                                dump_file_ext=dump_file_ext,
+                                mongodump_output_part="--gzip --archive={mongodb_dump_dir}/{source}.archive.gz.tmp".format(mongodb_dump_dir=item["mongodb_dump_dir"], source=item["source"]) if item["mongodump_archive"] else "--out {mongodb_dump_dir}".format(mongodb_dump_dir=item["mongodb_dump_dir"]),
+                                mongodb_dump_dir=item["mongodb_dump_dir"],
+                                dump_prefix_cmd=item["dump_prefix_cmd"],
+                                exec_before_dump=item["exec_before_dump"],
+                                tar_part=tar_part,
+                                exec_after_dump=item["exec_after_dump"],
+                                mongo_args=item["mongo_args"],
+                                mongodump_args=item["mongodump_args"],
+                                grep_db_filter=grep_db_filter,
+                                source=item["source"],
+                                dump_attempts=item["dump_attempts"]
+                            )
+
+                        script = MONGODB_SCRIPT.format(
+                            compress_cmd=compress_cmd,
+                            ssh_args=ssh_args,
+                            port=item["connect_port"],
+                            user=item["connect_user"],
+                            host=item["connect_host"],
+                            mongodb_dump_dir=item["mongodb_dump_dir"],
+                            mmin=dump_mmin,
+                            script_dump_part=script_dump_part
+                        )
+
+                    log_and_print("NOTICE", "Running remote dump on item number {number}:".format(number=number), logger)
+                    retcode = run_cmd(script)
+                    if retcode == 0:
+                        log_and_print("NOTICE", "Remote dump succeeded on item number {number}".format(number=number), logger)
+                    else:
+                        if not item["ignore_remote_dump_failed"]:
+                            log_and_print("ERROR", "Remote dump failed on item number {number}, not doing sync".format(number=number), logger)
+                            errors += 1
+                            return errors, oks
+                        else:
+                            log_and_print("ERROR", "Remote dump failed on item number {number}, but doing sync due to ignore_remote_dump_failed".format(number=number), logger)
+                            errors += 1
+
+                    # Remove partially downloaded dumps
+                    # The .sync dir is local to the backup server, so no need to shell out for this
+                    log_and_print("NOTICE", "Removing partially downloaded dumps if any on item number {number}:".format(number=number), logger)
+                    if item["type"] == "MYSQL_SSH":
+                        partial_dump_dir = item["mysql_dump_dir"]
+                        if "mysql_dump_type" in item and item["mysql_dump_type"] in ["xtrabackup", "mariadb-backup"]:
+                            partial_dump_patterns = ["**/.*.qp.*", "**/.*.zst.*"]
+                        elif "mysql_dump_type" in item and item["mysql_dump_type"] == "mysqlsh":
+                            partial_dump_patterns = ["**/.*.zst.*"]
+                        else:
+                            partial_dump_patterns = [".*.gz.*"]
+                    if item["type"] == "POSTGRESQL_SSH":
+                        partial_dump_dir = item["postgresql_dump_dir"]
+                        if "postgresql_dump_type" in item and item["postgresql_dump_type"] == "directory":
+                            partial_dump_patterns = ["**/.*.zst.*", "**/.*.gz.*"]
+                        else:
+                            partial_dump_patterns = [".*.gz.*", ".*.zst.*"]
+                    if item["type"] == "MONGODB_SSH":
+                        partial_dump_dir = item["mongodb_dump_dir"]
+                        partial_dump_patterns = [".*.tar.gz.*", ".*.tar.zst.*", ".*.archive.gz.*"]
+                    try:
+                        for partial_dump_pattern in partial_dump_patterns:
+                            for partial_dump_file in glob.glob("{snapshot_root}/.sync/rsnapshot{dump_dir}/{pattern}".format(snapshot_root=item["path"], dump_dir=partial_dump_dir, pattern=partial_dump_pattern), recursive=True):
+                                os.remove(partial_dump_file)
+                                log_and_print("NOTICE", "Removed partial dump {file} on item number {number}".format(file=partial_dump_file, number=number), logger)
+                    except OSError as e:
+                        logger.exception(e)
+                        log_and_print("ERROR", "Removing partially downloaded dumps failed on item number {number}, but script continues".format(number=number), logger)
+                        errors += 1
+
+                # Populate backup lines in config
+
+                conf_backup_lines = ""
+
+                if item["type"] == "RSYNC_SSH":
+
+                    if item["source"] in DATA_EXPAND:
+                        for source in DATA_EXPAND[item["source"]]:
+                            if not ("exclude" in item and source in item["exclude"]):
                                 if item["host"] == SELF_HOSTNAME:
-                                    conf_backup_lines += conf_backup_line_template_self.format(
-                                        source=item["mongodb_dump_dir"],
-                                        tab_before_rsync_long_args="",
-                                        rsync_long_args=""
+                                    conf_backup_lines += CONF_BACKUP_LINE_TEMPLATE_SELF.format(
+                                        source=source,
+                                        tab_before_rsync_long_args="\t" if source == "/opt/sysadmws" else "",
+                                        rsync_long_args="+rsync_long_args=--exclude=/opt/sysadmws/bulk_log --exclude=log" if source == "/opt/sysadmws" else ""
                                     )
                                 else:
-                                    conf_backup_lines += conf_backup_line_template_ssh.format(
+                                    conf_backup_lines += CONF_BACKUP_LINE_TEMPLATE_SSH.format(
                                         user=item["connect_user"],
                                         host=item["connect_host"],
-                                        source=item["mongodb_dump_dir"],
-                                        tab_before_rsync_long_args="",
-                                        rsync_long_args=""
+                                        source=source,
+                                        tab_before_rsync_long_args="\t" if source == "/opt/sysadmws" else "",
+                                        rsync_long_args="+rsync_long_args=--exclude=/opt/sysadmws/bulk_log --exclude=log" if source == "/opt/sysadmws" else ""
                                     )
+                    else:
+                        if item["host"] == SELF_HOSTNAME:
+                            conf_backup_lines += CONF_BACKUP_LINE_TEMPLATE_SELF.format(
+                                source=item["source"],
+                                tab_before_rsync_long_args="",
+                                rsync_long_args=""
+                            )
+                        else:
+                            conf_backup_lines += CONF_BACKUP_LINE_TEMPLATE_SSH.format(
+                                user=item["connect_user"],
+                                host=item["connect_host"],
+                                source=item["source"],
+                                tab_before_rsync_long_args="",
+                                rsync_long_args=""
+                            )
+
+                if item["type"] == "MYSQL_SSH":
+                    # We do not need rsync compression as xtrabackup or mariadb-backup or mysqlsh dumps are already compressed
+                    # With compress it takes 10-12 times longer
+                    if item["host"] == SELF_HOSTNAME:
+                        conf_backup_lines += CONF_BACKUP_LINE_TEMPLATE_SELF.format(
+                            source=item["mysql_dump_dir"],
+                            tab_before_rsync_long_args="\t" if "mysql_dump_type" in item and (item["mysql_dump_type"] == "xtrabackup" or item["mysql_dump_type"] == "mariadb-backup" or item["mysql_dump_type"] == "mysqlsh") else "",
+                            rsync_long_args="+rsync_long_args=--no-compress" if "mysql_dump_type" in item and (item["mysql_dump_type"] == "xtrabackup" or item["mysql_dump_type"] == "mariadb-backup" or item["mysql_dump_type"] == "mysqlsh") else ""
+                        )
+                    else:
+                        conf_backup_lines += CONF_BACKUP_LINE_TEMPLATE_SSH.format(
+                            user=item["connect_user"],
+                            host=item["connect_host"],
+                            source=item["mysql_dump_dir"],
+                            tab_before_rsync_long_args="\t" if "mysql_dump_type" in item and (item["mysql_dump_type"] == "xtrabackup" or item["mysql_dump_type"] == "mariadb-backup" or item["mysql_dump_type"] == "mysqlsh") else "",
+                            rsync_long_args="+rsync_long_args=--no-compress" if "mysql_dump_type" in item and (item["mysql_dump_type"] == "xtrabackup" or item["mysql_dump_type"] == "mariadb-backup" or item["mysql_dump_type"] == "mysqlsh") else ""
+                        )
+                if item["type"] == "POSTGRESQL_SSH":
+                    if item["host"] == SELF_HOSTNAME:
+                        conf_backup_lines += CONF_BACKUP_LINE_TEMPLATE_SELF.format(
+                            source=item["postgresql_dump_dir"],
+                            tab_before_rsync_long_args="",
+                            rsync_long_args=""
+                        )
+                    else:
+                        conf_backup_lines += CONF_BACKUP_LINE_TEMPLATE_SSH.format(
+                            user=item["connect_user"],
+                            host=item["connect_host"],
+                            source=item["postgresql_dump_dir"],
+                            tab_before_rsync_long_args="",
+                            rsync_long_args=""
+                        )
+                if item["type"] == "MONGODB_SSH":
+                    if item["host"] == SELF_HOSTNAME:
+                        conf_backup_lines += CONF_BACKUP_LINE_TEMPLATE_SELF.format(
+                            source=item["mongodb_dump_dir"],
+                            tab_before_rsync_long_args="",
+                            rsync_long_args=""
+                        )
+                    else:
+                        conf_backup_lines += CONF_BACKUP_LINE_TEMPLATE_SSH.format(
+                            user=item["connect_user"],
+                            host=item["connect_host"],
+                            source=item["mongodb_dump_dir"],
+                            tab_before_rsync_long_args="",
+                            rsync_long_args=""
+                        )
+
+                # Save config
+                write_file_if_changed(rsnapshot_conf, CONF_SYNC_TEMPLATE.format(
+                        number=number,
+                        rsync_compress_args=rsync_compress_args,
+                        sync_mode_args=sync_mode_args,
+                        snapshot_root=item["path"],
+                        retain_hourly_comment="" if "retain_hourly" in item else "#",
+                        retain__daily_comment="" if str(item["retain_daily"]) != "0" else "#",
+                        retain_weekly_comment="" if str(item["retain_weekly"]) != "0" else "#",
+                        retain_monthlycomment="" if str(item["retain_monthly"]) != "0" else "#",
+                        retain_hourly=item["retain_hourly"] if "retain_hourly" in item else "NONE",
+                        retain_daily=item["retain_daily"],
+                        retain_weekly=item["retain_weekly"],
+                        retain_monthly=item["retain_monthly"],
+                        verbosity_level=item["verbosity_level"],
+                        port=item["connect_port"],
+                        ssh_args=ssh_args,
+                        rsync_verbosity_args=item["rsync_verbosity_args"],
+                        rsync_args=item["rsync_args"],
+                        conf_backup_lines=conf_backup_lines
+                    ))
+
+                # Do not execute rsnapshot if the dump was already streamed into .sync
+                if dump_streamed:
+                    log_and_print("NOTICE", "Dump was streamed directly into .sync on item number {number}, not running rsnapshot sync".format(number=number), logger)
+                # Do not execute rsnapshot if retain_daily is 0
+                # Used to initiate db dumps in advance which are then picked up by remote backup servers
+                elif str(item["retain_daily"]) == "0":
+                    log_and_print("NOTICE", "retain_daily is 0, not running rsnapshot sync on item number {number}".format(number=number), logger)
+                else:
+
+                    # Run rsnapshot
+                    if "rsnapshot_prefix_cmd" in item:
+                        rsnapshot_prefix_cmd = "{rsnapshot_prefix_cmd} ".format(rsnapshot_prefix_cmd=item["rsnapshot_prefix_cmd"])
+                    else:
+                        rsnapshot_prefix_cmd = ""
+                    log_and_print("NOTICE", "Running {rsnapshot_prefix_cmd}rsnapshot -c {conf} sync on item number {number}".format(
+                        rsnapshot_prefix_cmd=rsnapshot_prefix_cmd,
+                        conf=rsnapshot_conf,
+                        number=number
+                    ), logger)
+
+                    if "retries" in item:
+                        times_to_run_max = 1 + item["retries"]
+                    else:
+                        times_to_run_max = 1
+
+                    rsnapshot_run_times = 0
+
+                    while True:
+
+                        retcode = run_cmd("{rsnapshot_prefix_cmd}rsnapshot -c {conf} sync 2> >({rsnapshot_error_filter})".format(
+                            rsnapshot_prefix_cmd=rsnapshot_prefix_cmd,
+                            conf=rsnapshot_conf,
+                            rsnapshot_error_filter=rsnapshot_error_filter
+                        ))
+                        rsnapshot_run_times += 1
+
+                        if retcode == 0 or retcode == 2:
+                            break
+
+                        if rsnapshot_run_times >= times_to_run_max:
+                            break
+
+                        log_and_print("NOTICE", "Rsnapshot retry {retry} on item number {number}".format(retry=rsnapshot_run_times, number=number), logger)
+
+                    if retcode == 2:
+                        log_and_print("NOTICE", "Rsnapshot succeeded with WARNINGs on item number {number}, but we consider it is OK".format(number=number), logger)
+                    elif retcode == 0:
+                        log_and_print("NOTICE", "Rsnapshot succeeded on item number {number}".format(number=number), logger)
+                    else:
+                        log_and_print("ERROR", "Rsnapshot failed on item number {number}".format(number=number), logger)
+                        errors += 1
+
+                # Exec exec_after_rsync
+                if "exec_after_rsync" in item:
+                    log_and_print("NOTICE", "Executing remote exec_after_rsync on item number {number}".format(number=number), logger)
+                    log_and_print("NOTICE", "{cmd}".format(cmd=item["exec_after_rsync"]), logger)
+                    retcode = run_cmd("ssh {ssh_args} -p {port} {user}@{host} '{cmd}'".format(ssh_args=ssh_args, port=item["connect_port"], user=item["connect_user"], host=item["connect_host"], cmd=item["exec_after_rsync"]))
+                    if retcode == 0:
+                        log_and_print("NOTICE", "Remote execution of exec_after_rsync succeeded on item number {number}".format(number=number), logger)
+                    else:
+                        log_and_print("ERROR", "Remote execution of exec_after_rsync failed on item number {number}, but script continues".format(number=number), logger)
+                        errors += 1
+
+            elif item["type"] == "RSYNC_NATIVE":
+
+                if ":" in item["connect"]:
+                    item["connect_host"] = item["connect"].split(":")[0]
+                    item["connect_port"] = item["connect"].split(":")[1]
+                else:
+                    item["connect_host"] = item["connect"]
+                    item["connect_port"] = 873
+
+                # Check connect password
+                if "connect_password" not in item:
+                    log_and_print("ERROR", "No Rsync password provided for native rsync on item number {number}, not doing sync".format(number=number), logger)
+                    errors += 1
+                    return errors, oks
+
+                # Keep the rsyncd password out of the filesystem where the kernel supports it:
+                # a memfd lives only in RAM, is gone with the process even after SIGKILL, and
+                # rsync reads it through /proc like a regular file
+                try:
+                    passwd_fd = os.memfd_create("rsnapshot_passwd.{number}".format(number=number))
+                except (AttributeError, OSError):
+                    passwd_fd = None
+                if passwd_fd is not None:
+                    # memfds are created 0777 and rsync refuses other-accessible password files
+                    os.fchmod(passwd_fd, 0o600)
+                    os.write(passwd_fd, item["connect_password"].encode("utf-8"))
+                    rsnapshot_passwd = "/proc/{pid}/fd/{fd}".format(pid=os.getpid(), fd=passwd_fd)
+                else:
+                    # Save connect password to file
+                    write_file_if_changed(rsnapshot_passwd, item["connect_password"])
+
+                # Check remote .backup existance, if no file - skip to next. Remote windows rsync server can give empty set in some cases, which can lead to backup to be erased.
+                # --timeout=900 - if no IO for 15 minutes, rsync will exit
+                if item["native_txt_check"]:
+                    probe_cache_key = "rsync://{user}@{host}:{port}{source}".format(
+                        user=item["connect_user"],
+                        host=item["connect_host"],
+                        port=item["connect_port"],
+                        source=item["source"]
+                    )
+                    if item["probe_ttl"] and time.time() - load_probe_cache().get(probe_cache_key, 0) < item["probe_ttl"]:
+                        log_and_print("NOTICE", "Remote .backup existance check still fresh in probe cache on item number {number}, skipping probe".format(number=number), logger)
+                    else:
+                        log_and_print("NOTICE", "Remote .backup existance check required on item number {number}".format(number=number), logger)
+                        retcode = run_cmd("rsync --timeout=900 --password-file={passwd} rsync://{user}@{host}:{port}{source}/ | grep .backup".format(
+                            passwd=rsnapshot_passwd,
+                            user=item["connect_user"],
+                            host=item["connect_host"],
+                            port=item["connect_port"],
+                            source=item["source"]
+                        ))
+                        if retcode == 0:
+                            log_and_print("NOTICE", "Remote .backup existance check succeeded on item number {number}".format(number=number), logger)
+                            if item["probe_ttl"]:
+                                save_probe_cache_entry(probe_cache_key)
+                        else:
+                            log_and_print("ERROR", "Remote .backup existance check failed on item number {number}, not doing sync".format(number=number), logger)
+                            errors += 1
+                            return errors, oks
+
+                # Save config
+                write_file_if_changed(rsnapshot_conf, CONF_NATIVE_TEMPLATE.format(
+                        number=number,
+                        rsync_compress_args=rsync_compress_args,
+                        sync_mode_args=sync_mode_args,
+                        snapshot_root=item["path"],
+                        retain_hourly_comment="" if "retain_hourly" in item else "#",
+                        retain__daily_comment="" if str(item["retain_daily"]) != "0" else "#",
+                        retain_weekly_comment="" if str(item["retain_weekly"]) != "0" else "#",
+                        retain_monthlycomment="" if str(item["retain_monthly"]) != "0" else "#",
+                        retain_hourly=item["retain_hourly"] if "retain_hourly" in item else "NONE",
+                        retain_daily=item["retain_daily"],
+                        retain_weekly=item["retain_weekly"],
+                        retain_monthly=item["retain_monthly"],
+                        verbosity_level=item["verbosity_level"],
+                        passwd=rsnapshot_passwd,
+                        rsync_verbosity_args=item["rsync_verbosity_args"],
+                        rsync_args=item["rsync_args"],
+                        user=item["connect_user"],
+                        host=item["connect_host"],
+                        port=item["connect_port"],
+                        source=item["source"]
+                    ))
+
+                # When asked to, probe for changes with a capped dry run first - an unchanged
+                # source lets us skip the whole rsnapshot run including its hardlink shuffle
+                sync_needed = True
+                if item["skip_if_unchanged"] and os.path.isdir("{path}/.sync/rsnapshot".format(path=item["path"])):
+                    dry_run_retcode, dry_run_stdout, dry_run_stderr = run_cmd_pipe("rsync --dry-run --itemize-changes --no-motd --timeout=900 -a {sync_mode_args} --no-owner --no-group --numeric-ids --relative --password-file={passwd} {rsync_args} rsync://{user}@{host}:{port}{source}/ {path}/.sync/rsnapshot/".format(
+                        sync_mode_args=sync_mode_args,
+                        passwd=rsnapshot_passwd,
+                        rsync_args=item["rsync_args"],
+                        user=item["connect_user"],
+                        host=item["connect_host"],
+                        port=item["connect_port"],
+                        source=item["source"],
+                        path=item["path"]
+                    ))
+                    if dry_run_retcode == 0 and not dry_run_stdout.strip():
+                        sync_needed = False
+                        log_and_print("NOTICE", "Source unchanged on item number {number}, skipping rsnapshot sync".format(number=number), logger)
+                        oks += 1
+
+                if sync_needed:
+                    # Run rsnapshot
+                    if "rsnapshot_prefix_cmd" in item:
+                        rsnapshot_prefix_cmd = "{rsnapshot_prefix_cmd} ".format(rsnapshot_prefix_cmd=item["rsnapshot_prefix_cmd"])
+                    else:
+                        rsnapshot_prefix_cmd = ""
+                    # 10h limit enforced in python instead of a timeout(1) shell wrapper
+                    rsnapshot_timeout = 36000 if item["native_10h_limit"] else None
+                    log_and_print("NOTICE", "Running {rsnapshot_prefix_cmd}rsnapshot -c {conf} sync on item number {number}".format(
+                        rsnapshot_prefix_cmd=rsnapshot_prefix_cmd,
+                        conf=rsnapshot_conf,
+                        number=number
+                    ), logger)
+
+                    if "retries" in item:
+                        times_to_run_max = 1 + item["retries"]
+                    else:
+                        times_to_run_max = 1
+
+                    rsnapshot_run_times = 0
+
+                    while True:
+
+                        retcode = run_cmd("{rsnapshot_prefix_cmd}rsnapshot -c {conf} sync 2> >({rsnapshot_error_filter})".format(
+                            rsnapshot_prefix_cmd=rsnapshot_prefix_cmd,
+                            conf=rsnapshot_conf,
+                            rsnapshot_error_filter=rsnapshot_error_filter
+                        ), timeout=rsnapshot_timeout)
+                        rsnapshot_run_times += 1
+
+                        if retcode == 0 or retcode == 2:
+                            break
+
+                        if rsnapshot_run_times >= times_to_run_max:
+                            break
+
+                        log_and_print("NOTICE", "Rsnapshot retry {retry} on item number {number}".format(retry=rsnapshot_run_times, number=number), logger)
+
+                    if retcode == 2:
+                        log_and_print("NOTICE", "Rsnapshot succeeded with WARNINGs on item number {number}, but we consider it is OK".format(number=number), logger)
+                    elif retcode == 0:
+                        log_and_print("NOTICE", "Rsnapshot succeeded on item number {number}".format(number=number), logger)
+                    else:
+                        log_and_print("ERROR", "Rsnapshot failed on item number {number}".format(number=number), logger)
+                        errors += 1
+
+                # Delete password file or close the backing memfd
+                if passwd_fd is not None:
+                    os.close(passwd_fd)
+                else:
+                    os.remove(rsnapshot_passwd)
+
+            else:
+                log_and_print("ERROR", "Unknown item type {type} on item number {number}".format(type=item["type"], number=number), logger)
+                errors += 1
+
+        # Check
+        if args.check and "checks" in item:
+
+            # If retain_daily is 0, nothing to check, just increase oks
+            if str(item["retain_daily"]) == "0":
+                log_and_print("NOTICE", "retain_daily is 0, not running checks on item number {number}".format(number=number), logger)
+                oks += 1
+                return errors, oks
+
+            for check in item["checks"]:
+
+                # xtrabackup stream - a single .xbstream file instead of a dump dir, the compressed
+                # stream cannot be inspected in place, so check its size and age
+                if item["type"] == "MYSQL_SSH" and check["type"] == "MYSQL" and "mysql_dump_type" in item and item["mysql_dump_type"] == "xtrabackup" and item["xtrabackup_stream"]:
+
+                    if item["source"] == "ALL":
+                        dump_file = "{path}/.sync/rsnapshot{db_dump_dir}/all.xbstream".format(path=item["path"], db_dump_dir=item["mysql_dump_dir"])
+                    else:
+                        dump_file = "{path}/.sync/rsnapshot{db_dump_dir}/{source}.xbstream".format(path=item["path"], db_dump_dir=item["mysql_dump_dir"], source=item["source"])
+
+                    # Check dump file exists
+                    if os.path.exists(dump_file):
+
+                        log_and_print("NOTICE", "{dump_file} dump file exists on item number {number}".format(dump_file=dump_file, number=number), logger)
+                        oks += 1
+
+                        # Should be at least 100 Kb
+                        if os.stat(dump_file).st_size > 100000:
+                            log_and_print("NOTICE", "Dump file {dump_file} is larger than 100 Kb on item number {number}".format(dump_file=dump_file, number=number), logger)
+                            oks += 1
+                        else:
+                            log_and_print("ERROR", "Dump file {dump_file} is smaller than 100 Kb on item number {number}".format(dump_file=dump_file, number=number), logger)
+                            errors += 1
+
+                        # Check dump file age, it shouldn't be older than 1 day
+                        seconds_between_mtime_and_now = (datetime.now() - datetime.fromtimestamp(os.stat(dump_file).st_mtime)).total_seconds()
+                        if seconds_between_mtime_and_now < 60*60*24:
+                            log_and_print("NOTICE", "Dump file age {seconds} secs is less than 1d for the dump file {dump_file} on item number {number}".format(seconds=int(seconds_between_mtime_and_now), dump_file=dump_file, number=number), logger)
+                            oks += 1
+                        else:
+                            log_and_print("ERROR", "Dump file age {seconds} secs is more than 1d for the dump file {dump_file} on item number {number}".format(seconds=int(seconds_between_mtime_and_now), dump_file=dump_file, number=number), logger)
+                            errors += 1
+
+                    else:
+                        log_and_print("ERROR", "{dump_file} dump file is missing on item number {number}".format(dump_file=dump_file, number=number), logger)
+                        errors += 1
+
+                # xtrabackup
+                if item["type"] == "MYSQL_SSH" and check["type"] == "MYSQL" and "mysql_dump_type" in item and item["mysql_dump_type"] == "xtrabackup" and not item["xtrabackup_stream"]:
+
+                    if item["source"] == "ALL":
+                        dump_dir = "{path}/.sync/rsnapshot{db_dump_dir}/all.xtrabackup".format(path=item["path"], db_dump_dir=item["mysql_dump_dir"])
+                    else:
+                        dump_dir = "{path}/.sync/rsnapshot{db_dump_dir}/{source}.xtrabackup".format(path=item["path"], db_dump_dir=item["mysql_dump_dir"], source=item["source"])
+
+                    # Check dump dir exists
+                    if os.path.isdir(dump_dir):
+
+                        log_and_print("NOTICE", "{dump_dir} dump dir exists on item number {number}".format(dump_dir=dump_dir, number=number), logger)
+                        oks += 1
+
+                        # Check if ibdata1.qp or ibdata1.zst exist
+                        if os.path.exists("{dump_dir}/ibdata1.qp".format(dump_dir=dump_dir)):
+                            # Should be at least 100 Kb
+                            if os.stat("{dump_dir}/ibdata1.qp".format(dump_dir=dump_dir)).st_size > 100000:
+                                log_and_print("NOTICE", "Found ibdata1.qp file larger than 100 Kb in dump dir on item number {number}".format(number=number), logger)
+                                oks += 1
+                        elif os.path.exists("{dump_dir}/ibdata1.zst".format(dump_dir=dump_dir)):
+                            # Should be at least 100 Kb
+                            if os.stat("{dump_dir}/ibdata1.zst".format(dump_dir=dump_dir)).st_size > 100000:
+                                log_and_print("NOTICE", "Found ibdata1.zst file larger than 100 Kb in dump dir on item number {number}".format(number=number), logger)
+                                oks += 1
+                        else:
+                            log_and_print("ERROR", "Found no ibdata1.qp or ibdata1.zst file larger than 100 Kb in dump dir on item number {number}".format(number=number), logger)
+                            errors += 1
+
+                        # Read xtrabackup_info.qp or xtrabackup_info.zst
+                        if os.path.exists("{dump_dir}/xtrabackup_info.qp".format(dump_dir=dump_dir)):
+                            xtrabackup_info_file = "{dump_dir}/xtrabackup_info.qp".format(dump_dir=dump_dir)
+                            qpress_cmd = "qpress -do {xtrabackup_info_file}".format(xtrabackup_info_file=xtrabackup_info_file)
+                            xtrabackup_end_time = None
+                            log_and_print("NOTICE", "Found {xtrabackup_info_file} file in dump dir on item number {number}".format(xtrabackup_info_file=xtrabackup_info_file, number=number), logger)
+                            oks += 1
+
+
+                            retcode, stdout, stderr = run_cmd_pipe(qpress_cmd)
+                            if retcode == 0:
+
+                                for xtrabackup_info_line in stdout.split("\n"):
+                                    if xtrabackup_info_line.lstrip().rstrip().split(" = ")[0] == "end_time":
+                                        xtrabackup_end_time = xtrabackup_info_line.lstrip().rstrip().split(" = ")[1]
 
-                            # Save config
-                            with open(RSNAPSHOT_CONF, "w") as file_to_write:
-                                file_to_write.write(textwrap.dedent(
-                                    """\
-                                    config_version	1.2
-                                    snapshot_root	{snapshot_root}
-                                    cmd_cp		/bin/cp
-                                    cmd_rm		/bin/rm
-                                    cmd_rsync	/usr/bin/rsync
-                                    cmd_ssh		/usr/bin/ssh
-                                    cmd_logger	/usr/bin/logger
-                                    {retain_hourly_comment}retain		hourly	{retain_hourly}
-                                    {retain__daily_comment}retain		daily	{retain_daily}
-                                    {retain_weekly_comment}retain		weekly	{retain_weekly}
-                                    {retain_monthlycomment}retain		monthly	{retain_monthly}
-                                    verbose		{verbosity_level}
-                                    loglevel	3
-                                    logfile		/opt/sysadmws/rsnapshot_backup/rsnapshot.log
-                                    lockfile	/opt/sysadmws/rsnapshot_backup/rsnapshot.pid
-                                    ssh_args	{ssh_args} -p {port}
-                                    rsync_long_args	-az --delete --delete-excluded --numeric-ids --relative {rsync_verbosity_args} {rsync_args}
-                                    sync_first	1
-                                    {conf_backup_lines}
-                                    """
-                                ).format(
-                                    snapshot_root=item["path"],
-                                    retain_hourly_comment="" if "retain_hourly" in item else "#",
-                                    retain__daily_comment="" if str(item["retain_daily"]) != "0" else "#",
-                                    retain_weekly_comment="" if str(item["retain_weekly"]) != "0" else "#",
-                                    retain_monthlycomment="" if str(item["retain_monthly"]) != "0" else "#",
-                                    retain_hourly=item["retain_hourly"] if "retain_hourly" in item else "NONE",
-                                    retain_daily=item["retain_daily"],
-                                    retain_weekly=item["retain_weekly"],
-                                    retain_monthly=item["retain_monthly"],
-                                    verbosity_level=item["verbosity_level"],
-                                    port=item["connect_port"],
-                                    ssh_args=ssh_args,
-                                    rsync_verbosity_args=item["rsync_verbosity_args"],
-                                    rsync_args=item["rsync_args"],
-                                    conf_backup_lines=conf_backup_lines
-                                ))
-                        
-                            # Do not execute rsnapshot if retain_daily is 0
-                            # Used to initiate db dumps in advance which are then picked up by remote backup servers
-                            if str(item["retain_daily"]) == "0":
-                                log_and_print("NOTICE", "retain_daily is 0, not running rsnapshot sync on item number {number}".format(number=item["number"]), logger)
                             else:
+                                log_and_print("ERROR", "qpress cmd failed on item number {number}".format(number=number), logger)
+                                errors += 1
 
-                                # Run rsnapshot
-                                if "rsnapshot_prefix_cmd" in item:
-                                    rsnapshot_prefix_cmd = "{rsnapshot_prefix_cmd} ".format(rsnapshot_prefix_cmd=item["rsnapshot_prefix_cmd"])
-                                else:
-                                    rsnapshot_prefix_cmd = ""
-                                log_and_print("NOTICE", "Running {rsnapshot_prefix_cmd}rsnapshot -c {conf} sync on item number {number}".format(
-                                    rsnapshot_prefix_cmd=rsnapshot_prefix_cmd,
-                                    conf=RSNAPSHOT_CONF,
-                                    number=item["number"]
-                                ), logger)
-                                try:
-
-                                    if "retries" in item:
-                                        times_to_run_max = 1 + item["retries"]
-                                    else:
-                                        times_to_run_max = 1
 
-                                    rsnapshot_run_times = 0
+                        elif os.path.exists("{dump_dir}/xtrabackup_info.zst".format(dump_dir=dump_dir)):
+                            xtrabackup_info_file = "{dump_dir}/xtrabackup_info.zst".format(dump_dir=dump_dir)
+                            zstd_cmd = "zstd -d -c {xtrabackup_info_file}".format(xtrabackup_info_file=xtrabackup_info_file)
+                            xtrabackup_end_time = None
+                            log_and_print("NOTICE", "Found {xtrabackup_info_file} file in dump dir on item number {number}".format(xtrabackup_info_file=xtrabackup_info_file, number=number), logger)
+                            oks += 1
 
-                                    while True:
 
-                                        retcode = run_cmd("{rsnapshot_prefix_cmd}rsnapshot -c {conf} sync 2> >({rsnapshot_error_filter})".format(
-                                            rsnapshot_prefix_cmd=rsnapshot_prefix_cmd,
-                                            conf=RSNAPSHOT_CONF,
-                                            rsnapshot_error_filter=rsnapshot_error_filter
-                                        ))
-                                        rsnapshot_run_times += 1
+                            retcode, stdout, stderr = run_cmd_pipe(zstd_cmd)
+                            if retcode == 0:
 
-                                        if retcode == 0 or retcode == 2:
-                                            break
+                                for xtrabackup_info_line in stdout.split("\n"):
+                                    if xtrabackup_info_line.lstrip().rstrip().split(" = ")[0] == "end_time":
+                                        xtrabackup_end_time = xtrabackup_info_line.lstrip().rstrip().split(" = ")[1]
 
-                                        if rsnapshot_run_times >= times_to_run_max:
-                                            break
+                            else:
+                                log_and_print("ERROR", "zstd cmd failed on item number {number}".format(number=number), logger)
+                                errors += 1
 
-                                        log_and_print("NOTICE", "Rsnapshot retry {retry} on item number {number}".format(retry=rsnapshot_run_times, number=item["number"]), logger)
 
-                                    if retcode == 2:
-                                        log_and_print("NOTICE", "Rsnapshot succeeded with WARNINGs on item number {number}, but we consider it is OK".format(number=item["number"]), logger)
-                                    elif retcode == 0:
-                                        log_and_print("NOTICE", "Rsnapshot succeeded on item number {number}".format(number=item["number"]), logger)
-                                    else:
-                                        log_and_print("ERROR", "Rsnapshot failed on item number {number}".format(number=item["number"]), logger)
-                                        errors += 1
-                                except Exception as e:
-                                    logger.exception(e)
-                                    raise Exception("Caught exception on subprocess.run execution")
-
-                            # Exec exec_after_rsync
-                            if "exec_after_rsync" in item:
-                                log_and_print("NOTICE", "Executing remote exec_after_rsync on item number {number}".format(number=item["number"]), logger)
-                                log_and_print("NOTICE", "{cmd}".format(cmd=item["exec_after_rsync"]), logger)
-                                try:
-                                    retcode = run_cmd("ssh {ssh_args} -p {port} {user}@{host} '{cmd}'".format(ssh_args=ssh_args, port=item["connect_port"], user=item["connect_user"], host=item["connect_host"], cmd=item["exec_after_rsync"]))
-                                    if retcode == 0:
-                                        log_and_print("NOTICE", "Remote execution of exec_after_rsync succeeded on item number {number}".format(number=item["number"]), logger)
-                                    else:
-                                        log_and_print("ERROR", "Remote execution of exec_after_rsync failed on item number {number}, but script continues".format(number=item["number"]), logger)
-                                        errors += 1
-                                except Exception as e:
-                                    logger.exception(e)
-                                    raise Exception("Caught exception on subprocess.run execution")
+                        else:
+                            log_and_print("ERROR", "Found no xtrabackup_info.qp or xtrabackup_info.zst file in dump dir on item number {number}".format(number=number), logger)
+                            errors += 1
+
+                        # Check xtrabackup end_time
+                        if xtrabackup_end_time is not None:
+                            seconds_between_end_time_and_now = (datetime.now() - datetime.strptime(xtrabackup_end_time, "%Y-%m-%d %H:%M:%S")).total_seconds()
+                            # Dump files shouldn't be older than 1 day
+                            if seconds_between_end_time_and_now < 60*60*24:
+                                log_and_print("NOTICE", "Dump xtrabackup end_time signature age {seconds} secs is less than 1d for the dump dir {dump_dir} on item number {number}".format(seconds=int(seconds_between_end_time_and_now), dump_dir=dump_dir, number=number), logger)
+                                oks += 1
+                            else:
+                                log_and_print("ERROR", "Dump xtrabackup end_time signature age {seconds} secs is more than 1d for the dump dir {dump_dir} on item number {number}".format(seconds=int(seconds_between_end_time_and_now), dump_dir=dump_dir, number=number), logger)
+                                errors += 1
+                        else:
+                            log_and_print("ERROR", "There is no xtrabackup end_time signature in file {xtrabackup_info_file} on item number {number}".format(xtrabackup_info_file=xtrabackup_info_file, number=number), logger)
+                            errors += 1
+
+                    else:
+                        log_and_print("ERROR", "{dump_dir} dump dir is missing on item number {number}".format(dump_dir=dump_dir, number=number), logger)
+                        errors += 1
+
+                # mariadb-backup
+                if item["type"] == "MYSQL_SSH" and check["type"] == "MYSQL" and "mysql_dump_type" in item and item["mysql_dump_type"] == "mariadb-backup":
+
+                    if item["source"] == "ALL":
+                        dump_dir = "{path}/.sync/rsnapshot{db_dump_dir}/all.mariadb-backup".format(path=item["path"], db_dump_dir=item["mysql_dump_dir"])
+                    else:
+                        dump_dir = "{path}/.sync/rsnapshot{db_dump_dir}/{source}.mariadb-backup".format(path=item["path"], db_dump_dir=item["mysql_dump_dir"], source=item["source"])
+
+                    # Check dump dir exists
+                    if os.path.isdir(dump_dir):
+
+                        log_and_print("NOTICE", "{dump_dir} dump dir exists on item number {number}".format(dump_dir=dump_dir, number=number), logger)
+                        oks += 1
+
+                        # Check if ibdata1.qp or ibdata1.zst exist
+                        if os.path.exists("{dump_dir}/ibdata1.qp".format(dump_dir=dump_dir)):
+                            # Should be at least 100 Kb
+                            if os.stat("{dump_dir}/ibdata1.qp".format(dump_dir=dump_dir)).st_size > 100000:
+                                log_and_print("NOTICE", "Found ibdata1.qp file larger than 100 Kb in dump dir on item number {number}".format(number=number), logger)
+                                oks += 1
+                        elif os.path.exists("{dump_dir}/ibdata1.zst".format(dump_dir=dump_dir)):
+                            # Should be at least 100 Kb
+                            if os.stat("{dump_dir}/ibdata1.zst".format(dump_dir=dump_dir)).st_size > 100000:
+                                log_and_print("NOTICE", "Found ibdata1.zst file larger than 100 Kb in dump dir on item number {number}".format(number=number), logger)
+                                oks += 1
+                        else:
+                            log_and_print("ERROR", "Found no ibdata1.qp or ibdata1.zst file larger than 100 Kb in dump dir on item number {number}".format(number=number), logger)
+                            errors += 1
+
+                        # Read xtrabackup_info.qp or xtrabackup_info.zst - mariadb-backup is a xtrabackup fork, so the file name is xtrabackup_info
+                        if os.path.exists("{dump_dir}/xtrabackup_info.qp".format(dump_dir=dump_dir)):
+                            xtrabackup_info_file = "{dump_dir}/xtrabackup_info.qp".format(dump_dir=dump_dir)
+                            qpress_cmd = "qpress -do {xtrabackup_info_file}".format(xtrabackup_info_file=xtrabackup_info_file)
+                            xtrabackup_end_time = None
+                            log_and_print("NOTICE", "Found {xtrabackup_info_file} file in dump dir on item number {number}".format(xtrabackup_info_file=xtrabackup_info_file, number=number), logger)
+                            oks += 1
+
+
+                            retcode, stdout, stderr = run_cmd_pipe(qpress_cmd)
+                            if retcode == 0:
+
+                                for xtrabackup_info_line in stdout.split("\n"):
+                                    if xtrabackup_info_line.lstrip().rstrip().split(" = ")[0] == "end_time":
+                                        xtrabackup_end_time = xtrabackup_info_line.lstrip().rstrip().split(" = ")[1]
+
+                            else:
+                                log_and_print("ERROR", "qpress cmd failed on item number {number}".format(number=number), logger)
+                                errors += 1
+
+
+                        elif os.path.exists("{dump_dir}/xtrabackup_info.zst".format(dump_dir=dump_dir)):
+                            xtrabackup_info_file = "{dump_dir}/xtrabackup_info.zst".format(dump_dir=dump_dir)
+                            zstd_cmd = "zstd -d -c {xtrabackup_info_file}".format(xtrabackup_info_file=xtrabackup_info_file)
+                            xtrabackup_end_time = None
+                            log_and_print("NOTICE", "Found {xtrabackup_info_file} file in dump dir on item number {number}".format(xtrabackup_info_file=xtrabackup_info_file, number=number), logger)
+                            oks += 1
+
+
+                            retcode, stdout, stderr = run_cmd_pipe(zstd_cmd)
+                            if retcode == 0:
 
-                        elif item["type"] in ["RSYNC_NATIVE"]:
+                                for xtrabackup_info_line in stdout.split("\n"):
+                                    if xtrabackup_info_line.lstrip().rstrip().split(" = ")[0] == "end_time":
+                                        xtrabackup_end_time = xtrabackup_info_line.lstrip().rstrip().split(" = ")[1]
 
-                            if ":" in item["connect"]:
-                                item["connect_host"] = item["connect"].split(":")[0]
-                                item["connect_port"] = item["connect"].split(":")[1]
                             else:
-                                item["connect_host"] = item["connect"]
-                                item["connect_port"] = 873
+                                log_and_print("ERROR", "zstd cmd failed on item number {number}".format(number=number), logger)
+                                errors += 1
 
-                            # Check connect password
-                            if "connect_password" not in item:
-                                log_and_print("ERROR", "No Rsync password provided for native rsync on item number {number}, not doing sync".format(number=item["number"]), logger)
+
+                        else:
+                            log_and_print("ERROR", "Found no xtrabackup_info.qp or xtrabackup_info.zst file in dump dir on item number {number}".format(number=number), logger)
+                            errors += 1
+
+                        # Check xtrabackup end_time
+                        if xtrabackup_end_time is not None:
+                            seconds_between_end_time_and_now = (datetime.now() - datetime.strptime(xtrabackup_end_time, "%Y-%m-%d %H:%M:%S")).total_seconds()
+                            # Dump files shouldn't be older than 1 day
+                            if seconds_between_end_time_and_now < 60*60*24:
+                                log_and_print("NOTICE", "Dump mariadb-backup end_time signature age {seconds} secs is less than 1d for the dump dir {dump_dir} on item number {number}".format(seconds=int(seconds_between_end_time_and_now), dump_dir=dump_dir, number=number), logger)
+                                oks += 1
+                            else:
+                                log_and_print("ERROR", "Dump mariadb-backup end_time signature age {seconds} secs is more than 1d for the dump dir {dump_dir} on item number {number}".format(seconds=int(seconds_between_end_time_and_now), dump_dir=dump_dir, number=number), logger)
                                 errors += 1
-                                continue
-
-                            # Save connect password to file
-                            with open(RSNAPSHOT_PASSWD, "w") as file_to_write:
-                                file_to_write.write(item["connect_password"])
-                            os.chmod(RSNAPSHOT_PASSWD, 0o600)
-                            
-                            # Check remote .backup existance, if no file - skip to next. Remote windows rsync server can give empty set in some cases, which can lead to backup to be erased.
-                            # --timeout=900 - if no IO for 15 minutes, rsync will exit
-                            if item["native_txt_check"]:
-                                log_and_print("NOTICE", "Remote .backup existance check required on item number {number}".format(number=item["number"]), logger)
-                                try:
-                                    retcode = run_cmd("rsync --timeout=900 --password-file={passwd} rsync://{user}@{host}:{port}{source}/ | grep .backup".format(
-                                        passwd=RSNAPSHOT_PASSWD,
-                                        user=item["connect_user"],
-                                        host=item["connect_host"],
-                                        port=item["connect_port"],
-                                        source=item["source"]
-                                    ))
-                                    if retcode == 0:
-                                        log_and_print("NOTICE", "Remote .backup existance check succeeded on item number {number}".format(number=item["number"]), logger)
-                                    else:
-                                        log_and_print("ERROR", "Remote .backup existance check failed on item number {number}, not doing sync".format(number=item["number"]), logger)
-                                        errors += 1
-                                        continue
-                                except Exception as e:
-                                    logger.exception(e)
-                                    raise Exception("Caught exception on subprocess.run execution")
-
-                            # Save config
-                            with open(RSNAPSHOT_CONF, "w") as file_to_write:
-                                file_to_write.write(textwrap.dedent(
-                                    """\
-                                    config_version	1.2
-                                    snapshot_root	{snapshot_root}
-                                    cmd_cp		/bin/cp
-                                    cmd_rm		/bin/rm
-                                    cmd_rsync	/usr/bin/rsync
-                                    cmd_ssh		/usr/bin/ssh
-                                    cmd_logger	/usr/bin/logger
-                                    {retain_hourly_comment}retain		hourly	{retain_hourly}
-                                    {retain__daily_comment}retain		daily	{retain_daily}
-                                    {retain_weekly_comment}retain		weekly	{retain_weekly}
-                                    {retain_monthlycomment}retain		monthly	{retain_monthly}
-                                    verbose		{verbosity_level}
-                                    loglevel	3
-                                    logfile		/opt/sysadmws/rsnapshot_backup/rsnapshot.log
-                                    lockfile	/opt/sysadmws/rsnapshot_backup/rsnapshot.pid
-                                    rsync_long_args	-az --delete --delete-excluded --no-owner --no-group --numeric-ids --relative --timeout=900 --password-file={passwd} {rsync_verbosity_args} {rsync_args}
-                                    sync_first	1
-                                    backup		rsync://{user}@{host}:{port}{source}/		rsnapshot/
-                                    """
-                                ).format(
-                                    snapshot_root=item["path"],
-                                    retain_hourly_comment="" if "retain_hourly" in item else "#",
-                                    retain__daily_comment="" if str(item["retain_daily"]) != "0" else "#",
-                                    retain_weekly_comment="" if str(item["retain_weekly"]) != "0" else "#",
-                                    retain_monthlycomment="" if str(item["retain_monthly"]) != "0" else "#",
-                                    retain_hourly=item["retain_hourly"] if "retain_hourly" in item else "NONE",
-                                    retain_daily=item["retain_daily"],
-                                    retain_weekly=item["retain_weekly"],
-                                    retain_monthly=item["retain_monthly"],
-                                    verbosity_level=item["verbosity_level"],
-                                    passwd=RSNAPSHOT_PASSWD,
-                                    rsync_verbosity_args=item["rsync_verbosity_args"],
-                                    rsync_args=item["rsync_args"],
-                                    user=item["connect_user"],
-                                    host=item["connect_host"],
-                                    port=item["connect_port"],
-                                    source=item["source"]
-                                ))
+                        else:
+                            log_and_print("ERROR", "There is no mariadb-backup end_time signature in file {xtrabackup_info_file} on item number {number}".format(xtrabackup_info_file=xtrabackup_info_file, number=number), logger)
+                            errors += 1
+
+                    else:
+                        log_and_print("ERROR", "{dump_dir} dump dir is missing on item number {number}".format(dump_dir=dump_dir, number=number), logger)
+                        errors += 1
+
+                # mysqlsh
+                if item["type"] == "MYSQL_SSH" and check["type"] == "MYSQL" and "mysql_dump_type" in item and item["mysql_dump_type"] == "mysqlsh":
+
+                    if item["source"] == "ALL":
+                        dump_dir = "{path}/.sync/rsnapshot{db_dump_dir}/all.mysqlsh".format(path=item["path"], db_dump_dir=item["mysql_dump_dir"])
+                    else:
+                        dump_dir = "{path}/.sync/rsnapshot{db_dump_dir}/{source}.mysqlsh".format(path=item["path"], db_dump_dir=item["mysql_dump_dir"], source=item["source"])
+
+                    # Check dump dir exists
+                    if os.path.isdir(dump_dir):
 
-                            # Run rsnapshot
-                            if "rsnapshot_prefix_cmd" in item:
-                                rsnapshot_prefix_cmd = "{rsnapshot_prefix_cmd} ".format(rsnapshot_prefix_cmd=item["rsnapshot_prefix_cmd"])
-                            else:
-                                rsnapshot_prefix_cmd = ""
-                            if item["native_10h_limit"]:
-                                timeout_cmd = "timeout --preserve-status -k 60 10h "
-                            else:
-                                timeout_cmd = ""
-                            log_and_print("NOTICE", "Running {timeout_cmd}{rsnapshot_prefix_cmd}rsnapshot -c {conf} sync on item number {number}".format(
-                                timeout_cmd=timeout_cmd,
-                                rsnapshot_prefix_cmd=rsnapshot_prefix_cmd,
-                                conf=RSNAPSHOT_CONF,
-                                number=item["number"]
-                            ), logger)
-                            try:
-
-                                if "retries" in item:
-                                    times_to_run_max = 1 + item["retries"]
-                                else:
-                                    times_to_run_max = 1
+                            log_and_print("NOTICE", "{dump_dir} dump dir exists on item number {number}".format(dump_dir=dump_dir, number=number), logger)
+                            oks += 1
 
-                                rsnapshot_run_times = 0
+                            # Read @.done.json
+                            mysqlsh_info_file = "{dump_dir}/@.done.json".format(dump_dir=dump_dir)
+                            cat_json_cmd = "cat {mysqlsh_info_file} | grep -e '.end.:'".format(mysqlsh_info_file=mysqlsh_info_file)
+                            mysqlsh_end_time = None
+                            if os.path.exists(mysqlsh_info_file):
 
-                                while True:
+                                log_and_print("NOTICE", "Found {mysqlsh_info_file} file in dump dir on item number {number}".format(mysqlsh_info_file=mysqlsh_info_file, number=number), logger)
+                                oks += 1
 
-                                    retcode = run_cmd("{timeout_cmd}{rsnapshot_prefix_cmd}rsnapshot -c {conf} sync 2> >({rsnapshot_error_filter})".format(
-                                        timeout_cmd=timeout_cmd,
-                                        rsnapshot_prefix_cmd=rsnapshot_prefix_cmd,
-                                        conf=RSNAPSHOT_CONF,
-                                        rsnapshot_error_filter=rsnapshot_error_filter
-                                    ))
-                                    rsnapshot_run_times += 1
 
-                                    if retcode == 0 or retcode == 2:
-                                        break
+                                retcode, stdout, stderr = run_cmd_pipe(cat_json_cmd)
+                                if retcode == 0:
 
-                                    if rsnapshot_run_times >= times_to_run_max:
-                                        break
-                                    
-                                    log_and_print("NOTICE", "Rsnapshot retry {retry} on item number {number}".format(retry=rsnapshot_run_times, number=item["number"]), logger)
+                                    for mysqlsh_info_line in stdout.split("\n"):
+                                        if '"end":' in mysqlsh_info_line.lstrip().rstrip():
+                                            mysqlsh_end_time = mysqlsh_info_line.lstrip().rstrip().replace('"end": "', "").replace('",', "")
 
-                                if retcode == 2:
-                                    log_and_print("NOTICE", "Rsnapshot succeeded with WARNINGs on item number {number}, but we consider it is OK".format(number=item["number"]), logger)
-                                elif retcode == 0:
-                                    log_and_print("NOTICE", "Rsnapshot succeeded on item number {number}".format(number=item["number"]), logger)
                                 else:
-                                    log_and_print("ERROR", "Rsnapshot failed on item number {number}".format(number=item["number"]), logger)
+                                    log_and_print("ERROR", "cat cmd failed on item number {number}".format(number=number), logger)
                                     errors += 1
-                            except Exception as e:
-                                logger.exception(e)
-                                raise Exception("Caught exception on subprocess.run execution")
-                            
-                            # Delete password file
-                            os.remove(RSNAPSHOT_PASSWD)
-                        
-                        else:
-                            log_and_print("ERROR", "Unknown item type {type} on item number {number}".format(type=item["type"], number=item["number"]), logger)
-                            errors += 1
 
-                    # Check
-                    if args.check and "checks" in item:
 
-                        # If retain_daily is 0, nothing to check, just increase oks
-                        if str(item["retain_daily"]) == "0":
-                            log_and_print("NOTICE", "retain_daily is 0, not running checks on item number {number}".format(number=item["number"]), logger)
-                            oks += 1
-                            continue
+                            else:
+                                log_and_print("ERROR", "Found no {mysqlsh_info_file} file in dump dir on item number {number}".format(mysqlsh_info_file=mysqlsh_info_file, number=number), logger)
+                                errors += 1
 
-                        for check in item["checks"]:
+                            # Check mysqlsh end time
+                            if mysqlsh_end_time is not None:
+                                seconds_between_end_time_and_now = (datetime.now() - datetime.strptime(mysqlsh_end_time, "%Y-%m-%d %H:%M:%S")).total_seconds()
+                                # Dump files shouldn't be older than 1 day
+                                if seconds_between_end_time_and_now < 60*60*24:
+                                    log_and_print("NOTICE", "Dump @.done.json end time signature age {seconds} secs is less than 1d for the dump dir {dump_dir} on item number {number}".format(seconds=int(seconds_between_end_time_and_now), dump_dir=dump_dir, number=number), logger)
+                                    oks += 1
+                                else:
+                                    log_and_print("ERROR", "Dump @.done.json end time signature age {seconds} secs is more than 1d for the dump dir {dump_dir} on item number {number}".format(seconds=int(seconds_between_end_time_and_now), dump_dir=dump_dir, number=number), logger)
+                                    errors += 1
+                            else:
+                                log_and_print("ERROR", "There is no @.done.json end time signature in file {mysqlsh_info_file} on item number {number}".format(mysqlsh_info_file=mysqlsh_info_file, number=number), logger)
+                                errors += 1
 
-                            # xtrabackup
-                            if item["type"] == "MYSQL_SSH" and check["type"] == "MYSQL" and "mysql_dump_type" in item and item["mysql_dump_type"] == "xtrabackup":
+                    else:
+                        log_and_print("ERROR", "{dump_dir} dump dir is missing on item number {number}".format(dump_dir=dump_dir, number=number), logger)
+                        errors += 1
 
-                                if item["source"] == "ALL":
-                                    dump_dir = "{path}/.sync/rsnapshot{db_dump_dir}/all.xtrabackup".format(path=item["path"], db_dump_dir=item["mysql_dump_dir"])
-                                else:
-                                    dump_dir = "{path}/.sync/rsnapshot{db_dump_dir}/{source}.xtrabackup".format(path=item["path"], db_dump_dir=item["mysql_dump_dir"], source=item["source"])
+                # pg_dump directory
+                if item["type"] == "POSTGRESQL_SSH" and check["type"] == "POSTGRESQL" and "postgresql_dump_type" in item and item["postgresql_dump_type"] == "directory":
 
-                                # Check dump dir exists
-                                if os.path.isdir(dump_dir):
+                    sources_to_check = []
 
-                                    log_and_print("NOTICE", "{dump_dir} dump dir exists on item number {number}".format(dump_dir=dump_dir, number=item["number"]), logger)
-                                    oks += 1
+                    if item["source"] == "ALL":
 
-                                    # Check if ibdata1.qp or ibdata1.zst exist
-                                    if os.path.exists("{dump_dir}/ibdata1.qp".format(dump_dir=dump_dir)):
-                                        # Should be at least 100 Kb
-                                        if os.stat("{dump_dir}/ibdata1.qp".format(dump_dir=dump_dir)).st_size > 100000:
-                                            log_and_print("NOTICE", "Found ibdata1.qp file larger than 100 Kb in dump dir on item number {number}".format(number=item["number"]), logger)
-                                            oks += 1
-                                    elif os.path.exists("{dump_dir}/ibdata1.zst".format(dump_dir=dump_dir)):
-                                        # Should be at least 100 Kb
-                                        if os.stat("{dump_dir}/ibdata1.zst".format(dump_dir=dump_dir)).st_size > 100000:
-                                            log_and_print("NOTICE", "Found ibdata1.zst file larger than 100 Kb in dump dir on item number {number}".format(number=item["number"]), logger)
-                                            oks += 1
-                                    else:
-                                        log_and_print("ERROR", "Found no ibdata1.qp or ibdata1.zst file larger than 100 Kb in dump dir on item number {number}".format(number=item["number"]), logger)
-                                        errors += 1
+                        db_list_file_path = "{path}/.sync/rsnapshot{postgresql_dump_dir}/db_list.txt".format(path=item["path"], postgresql_dump_dir=item["postgresql_dump_dir"])
 
-                                    # Read xtrabackup_info.qp or xtrabackup_info.zst
-                                    if os.path.exists("{dump_dir}/xtrabackup_info.qp".format(dump_dir=dump_dir)):
-                                        xtrabackup_info_file = "{dump_dir}/xtrabackup_info.qp".format(dump_dir=dump_dir)
-                                        qpress_cmd = "qpress -do {xtrabackup_info_file}".format(xtrabackup_info_file=xtrabackup_info_file)
-                                        xtrabackup_end_time = None
-                                        log_and_print("NOTICE", "Found {xtrabackup_info_file} file in dump dir on item number {number}".format(xtrabackup_info_file=xtrabackup_info_file, number=item["number"]), logger)
-                                        oks += 1
+                        if os.path.exists(db_list_file_path):
+                            with open(db_list_file_path, "r") as db_list_file:
+                                while True:
+                                    db_list_file_line = db_list_file.readline().rstrip()
+                                    if not db_list_file_line:
+                                        break
+                                    sources_to_check.append(db_list_file_line)
+                        else:
+                            log_and_print("ERROR", "{db_list_file_path} file is missing on item number {number}".format(db_list_file_path=db_list_file_path, number=number), logger)
+                            errors += 1
 
-                                        try:
+                    else:
+                        sources_to_check.append(item["source"])
 
-                                            retcode, stdout, stderr = run_cmd_pipe(qpress_cmd)
-                                            if retcode == 0:
+                    # Check sources
+                    for source in sources_to_check:
 
-                                                for xtrabackup_info_line in stdout.split("\n"):
-                                                    if xtrabackup_info_line.lstrip().rstrip().split(" = ")[0] == "end_time":
-                                                        xtrabackup_end_time = xtrabackup_info_line.lstrip().rstrip().split(" = ")[1]
+                        dump_dir = "{path}/.sync/rsnapshot{postgresql_dump_dir}/{source}".format(path=item["path"], postgresql_dump_dir=item["postgresql_dump_dir"], source=source)
 
-                                            else:
-                                                log_and_print("ERROR", "qpress cmd failed on item number {number}".format(number=item["number"]), logger)
-                                                errors += 1
+                        # Check dump dir exists
+                        if os.path.isdir(dump_dir):
 
-                                        except Exception as e:
-                                            logger.exception(e)
-                                            raise Exception("Caught exception on subprocess.run execution")
+                                log_and_print("NOTICE", "{dump_dir} dump dir exists on item number {number}".format(dump_dir=dump_dir, number=number), logger)
+                                oks += 1
 
-                                    elif os.path.exists("{dump_dir}/xtrabackup_info.zst".format(dump_dir=dump_dir)):
-                                        xtrabackup_info_file = "{dump_dir}/xtrabackup_info.zst".format(dump_dir=dump_dir)
-                                        zstd_cmd = "zstd -d -c {xtrabackup_info_file}".format(xtrabackup_info_file=xtrabackup_info_file)
-                                        xtrabackup_end_time = None
-                                        log_and_print("NOTICE", "Found {xtrabackup_info_file} file in dump dir on item number {number}".format(xtrabackup_info_file=xtrabackup_info_file, number=item["number"]), logger)
-                                        oks += 1
+                                # Check toc.dat at least 10 Kb
+                                # Skip this check for databases in empty_db
+                                empty_db = check.get("empty_db")
+                                if not isinstance(empty_db, list):
+                                    empty_db = []
+                                toc_dat_file = "{dump_dir}/toc.dat".format(dump_dir=dump_dir)
+                                if os.path.exists(toc_dat_file) and os.stat(toc_dat_file).st_size > 10000:
+                                    log_and_print("NOTICE", "Found {toc_dat_file} file larger than 10 Kb in dump dir on item number {number}".format(toc_dat_file=toc_dat_file, number=number), logger)
+                                    oks += 1
+                                elif "empty_db" in check and (source in empty_db or "ALL" in empty_db):
+                                    log_and_print("NOTICE", "Skipping toc.dat size check for empty_db source {source} in dump dir {dump_dir} on item number {number}".format(source=source, dump_dir=dump_dir, number=number), logger)
+                                else:
+                                    log_and_print("ERROR", "Found no {toc_dat_file} file larger than 10 Kb in dump dir on item number {number}".format(toc_dat_file=toc_dat_file, number=number), logger)
+                                    errors += 1
 
-                                        try:
+                                # Read dump_dir stats using pg_restore
+                                toc_dat_file = "{dump_dir}/toc.dat".format(dump_dir=dump_dir)
+                                pg_restore_cmd = "pg_restore --list {dump_dir}".format(dump_dir=dump_dir)
+                                toc_archive_created = None
+                                toc_dbname = None
+                                toc_entries = None
+                                toc_table_data_count = 0
+                                if os.path.exists(toc_dat_file):
 
-                                            retcode, stdout, stderr = run_cmd_pipe(zstd_cmd)
-                                            if retcode == 0:
+                                    log_and_print("NOTICE", "Found {toc_dat_file} file in dump dir on item number {number}".format(toc_dat_file=toc_dat_file, number=number), logger)
+                                    oks += 1
 
-                                                for xtrabackup_info_line in stdout.split("\n"):
-                                                    if xtrabackup_info_line.lstrip().rstrip().split(" = ")[0] == "end_time":
-                                                        xtrabackup_end_time = xtrabackup_info_line.lstrip().rstrip().split(" = ")[1]
 
-                                            else:
-                                                log_and_print("ERROR", "zstd cmd failed on item number {number}".format(number=item["number"]), logger)
-                                                errors += 1
+                                    retcode, stdout, stderr = run_cmd_pipe(pg_restore_cmd)
+                                    if retcode == 0:
 
-                                        except Exception as e:
-                                            logger.exception(e)
-                                            raise Exception("Caught exception on subprocess.run execution")
+                                        for pg_restore_line in stdout.split("\n"):
+                                            # Find '; Archive created at ' line and get toc_archive_created - everything after that block
+                                            if pg_restore_line.lstrip().rstrip().startswith("; Archive created at "):
+                                                toc_archive_created = pg_restore_line.split("; Archive created at ")[1]
+                                            # Find line that contains 'dbname: ' and get toc_dbname
+                                            if "dbname: " in pg_restore_line.lstrip().rstrip():
+                                                toc_dbname = pg_restore_line.split("dbname: ")[1]
+                                            # Find line that contains 'TOC Entries: ' and get toc_entries
+                                            if "TOC Entries: " in pg_restore_line.lstrip().rstrip():
+                                                toc_entries = pg_restore_line.split("TOC Entries: ")[1]
+                                            # Each line that contains " TABLE DATA " increases toc_table_data_count
+                                            if " TABLE DATA " in pg_restore_line.lstrip().rstrip():
+                                                toc_table_data_count += 1
 
                                     else:
-                                        log_and_print("ERROR", "Found no xtrabackup_info.qp or xtrabackup_info.zst file in dump dir on item number {number}".format(number=item["number"]), logger)
+                                        log_and_print("ERROR", "pg_restore cmd failed on item number {number}".format(number=number), logger)
                                         errors += 1
 
-                                    # Check xtrabackup end_time
-                                    if xtrabackup_end_time is not None:
-                                        seconds_between_end_time_and_now = (datetime.now() - datetime.strptime(xtrabackup_end_time, "%Y-%m-%d %H:%M:%S")).total_seconds()
-                                        # Dump files shouldn't be older than 1 day
-                                        if seconds_between_end_time_and_now < 60*60*24:
-                                            log_and_print("NOTICE", "Dump xtrabackup end_time signature age {seconds} secs is less than 1d for the dump dir {dump_dir} on item number {number}".format(seconds=int(seconds_between_end_time_and_now), dump_dir=dump_dir, number=item["number"]), logger)
-                                            oks += 1
-                                        else:
-                                            log_and_print("ERROR", "Dump xtrabackup end_time signature age {seconds} secs is more than 1d for the dump dir {dump_dir} on item number {number}".format(seconds=int(seconds_between_end_time_and_now), dump_dir=dump_dir, number=item["number"]), logger)
-                                            errors += 1
-                                    else:
-                                        log_and_print("ERROR", "There is no xtrabackup end_time signature in file {xtrabackup_info_file} on item number {number}".format(xtrabackup_info_file=xtrabackup_info_file, number=item["number"]), logger)
-                                        errors += 1
 
                                 else:
-                                    log_and_print("ERROR", "{dump_dir} dump dir is missing on item number {number}".format(dump_dir=dump_dir, number=item["number"]), logger)
+                                    log_and_print("ERROR", "Found no {toc_dat_file} file in dump dir on item number {number}".format(toc_dat_file=toc_dat_file, number=number), logger)
                                     errors += 1
 
-                            # mariadb-backup
-                            if item["type"] == "MYSQL_SSH" and check["type"] == "MYSQL" and "mysql_dump_type" in item and item["mysql_dump_type"] == "mariadb-backup":
-
-                                if item["source"] == "ALL":
-                                    dump_dir = "{path}/.sync/rsnapshot{db_dump_dir}/all.mariadb-backup".format(path=item["path"], db_dump_dir=item["mysql_dump_dir"])
-                                else:
-                                    dump_dir = "{path}/.sync/rsnapshot{db_dump_dir}/{source}.mariadb-backup".format(path=item["path"], db_dump_dir=item["mysql_dump_dir"], source=item["source"])
-
-                                # Check dump dir exists
-                                if os.path.isdir(dump_dir):
-
-                                    log_and_print("NOTICE", "{dump_dir} dump dir exists on item number {number}".format(dump_dir=dump_dir, number=item["number"]), logger)
-                                    oks += 1
+                                # Check toc_archive_created time, example: '2024-02-17 13:53:50 EET'
+                                if toc_archive_created is not None:
+                                    seconds_between_archive_created_and_now = (datetime.now() - datetime.strptime(toc_archive_created, "%Y-%m-%d %H:%M:%S %Z")).total_seconds()
+                                    # Dump files shouldn't be older than 1 day
+                                    if seconds_between_archive_created_and_now < 60*60*24:
+                                        log_and_print("NOTICE", "Dump Archive created at signature age {seconds} secs is less than 1d for the dump dir {dump_dir} on item number {number}".format(seconds=int(seconds_between_archive_created_and_now), dump_dir=dump_dir, number=number), logger)
+                                        oks += 1
+                                    else:
+                                        log_and_print("ERROR", "Dump Archive created at signature age {seconds} secs is more than 1d for the dump dir {dump_dir} on item number {number}".format(seconds=int(seconds_between_archive_created_and_now), dump_dir=dump_dir, number=number), logger)
+                                        errors += 1
 
-                                    # Check if ibdata1.qp or ibdata1.zst exist
-                                    if os.path.exists("{dump_dir}/ibdata1.qp".format(dump_dir=dump_dir)):
-                                        # Should be at least 100 Kb
-                                        if os.stat("{dump_dir}/ibdata1.qp".format(dump_dir=dump_dir)).st_size > 100000:
-                                            log_and_print("NOTICE", "Found ibdata1.qp file larger than 100 Kb in dump dir on item number {number}".format(number=item["number"]), logger)
-                                            oks += 1
-                                    elif os.path.exists("{dump_dir}/ibdata1.zst".format(dump_dir=dump_dir)):
-                                        # Should be at least 100 Kb
-                                        if os.stat("{dump_dir}/ibdata1.zst".format(dump_dir=dump_dir)).st_size > 100000:
-                                            log_and_print("NOTICE", "Found ibdata1.zst file larger than 100 Kb in dump dir on item number {number}".format(number=item["number"]), logger)
-                                            oks += 1
+                                # Check toc_dbname matches with item["source"]
+                                if toc_dbname is not None:
+                                    if toc_dbname == source:
+                                        log_and_print("NOTICE", "Dump dbname signature matches with source {source} for the dump dir {dump_dir} on item number {number}".format(source=source, dump_dir=dump_dir, number=number), logger)
+                                        oks += 1
                                     else:
-                                        log_and_print("ERROR", "Found no ibdata1.qp or ibdata1.zst file larger than 100 Kb in dump dir on item number {number}".format(number=item["number"]), logger)
+                                        log_and_print("ERROR", "Dump dbname signature {toc_dbname} does not match with source {source} for the dump dir {dump_dir} on item number {number}".format(toc_dbname=toc_dbname, source=source, dump_dir=dump_dir, number=number), logger)
                                         errors += 1
 
-                                    # Read xtrabackup_info.qp or xtrabackup_info.zst - mariadb-backup is a xtrabackup fork, so the file name is xtrabackup_info
-                                    if os.path.exists("{dump_dir}/xtrabackup_info.qp".format(dump_dir=dump_dir)):
-                                        xtrabackup_info_file = "{dump_dir}/xtrabackup_info.qp".format(dump_dir=dump_dir)
-                                        qpress_cmd = "qpress -do {xtrabackup_info_file}".format(xtrabackup_info_file=xtrabackup_info_file)
-                                        xtrabackup_end_time = None
-                                        log_and_print("NOTICE", "Found {xtrabackup_info_file} file in dump dir on item number {number}".format(xtrabackup_info_file=xtrabackup_info_file, number=item["number"]), logger)
+                                # Check toc_entries is not empty
+                                if toc_entries is not None:
+                                    if int(toc_entries) > 0:
+                                        log_and_print("NOTICE", "Found {toc_entries} TOC Entries in dump dir on item number {number}".format(toc_entries=toc_entries, number=number), logger)
                                         oks += 1
+                                    else:
+                                        log_and_print("ERROR", "Found 0 TOC Entries in dump dir on item number {number}".format(number=number), logger)
+                                        errors += 1
 
-                                        try:
+                                # Check toc_table_data_count is not empty
+                                # Skip this check for databases in empty_db
+                                empty_db = check.get("empty_db")
+                                if not isinstance(empty_db, list):
+                                    empty_db = []
+                                if toc_table_data_count > 0:
+                                    log_and_print("NOTICE", "Found {toc_table_data_count} TABLE DATA entries in dump dir on item number {number}".format(toc_table_data_count=toc_table_data_count, number=number), logger)
+                                    oks += 1
+                                elif "empty_db" in check and (source in empty_db or "ALL" in empty_db):
+                                    log_and_print("NOTICE", "Skipping TABLE DATA entries check for empty_db source {source} in dump dir {dump_dir} on item number {number}".format(source=source, dump_dir=dump_dir, number=number), logger)
+                                else:
+                                    log_and_print("ERROR", "Found 0 TABLE DATA entries in dump dir on item number {number}".format(number=number), logger)
+                                    errors += 1
 
-                                            retcode, stdout, stderr = run_cmd_pipe(qpress_cmd)
-                                            if retcode == 0:
+                        else:
+                            log_and_print("ERROR", "{dump_dir} dump dir is missing on item number {number}".format(dump_dir=dump_dir, number=number), logger)
+                            errors += 1
 
-                                                for xtrabackup_info_line in stdout.split("\n"):
-                                                    if xtrabackup_info_line.lstrip().rstrip().split(" = ")[0] == "end_time":
-                                                        xtrabackup_end_time = xtrabackup_info_line.lstrip().rstrip().split(" = ")[1]
+                # Native DB dumps have similiar logic
+                if (
+                        (item["type"] == "MYSQL_SSH" and check["type"] == "MYSQL" and not ("mysql_dump_type" in item and (item["mysql_dump_type"] == "xtrabackup" or item["mysql_dump_type"] == "mariadb-backup" or item["mysql_dump_type"] == "mysqlsh")))
+                        or
+                        (item["type"] == "POSTGRESQL_SSH" and check["type"] == "POSTGRESQL" and not ("postgresql_dump_type" in item and item["postgresql_dump_type"] == "directory"))
+                        or
+                        (item["type"] == "MONGODB_SSH" and check["type"] == "MONGODB")
+                    ):
+
+                    sources_to_check = []
+
+                    if check["type"] == "MYSQL":
+                        db_dump_dir = item["mysql_dump_dir"]
+                        db_dump_ext = ".gz"
+                    elif check["type"] == "POSTGRESQL":
+                        db_dump_dir = item["postgresql_dump_dir"]
+                        db_dump_ext = ".zst" if item["compressor"] == "zstd" else ".gz"
+                    elif check["type"] == "MONGODB":
+                        db_dump_dir = item["mongodb_dump_dir"]
+                        if item["mongodump_skip_tar"]:
+                            db_dump_ext = ""
+                        elif item["mongodump_archive"]:
+                            db_dump_ext = ".archive.gz"
+                        else:
+                            db_dump_ext = ".tar.zst" if item["compressor"] == "zstd" else ".tar.gz"
 
-                                            else:
-                                                log_and_print("ERROR", "qpress cmd failed on item number {number}".format(number=item["number"]), logger)
-                                                errors += 1
+                    if item["source"] == "ALL":
 
-                                        except Exception as e:
-                                            logger.exception(e)
-                                            raise Exception("Caught exception on subprocess.run execution")
+                        db_list_file_path = "{path}/.sync/rsnapshot{db_dump_dir}/db_list.txt".format(path=item["path"], db_dump_dir=db_dump_dir)
 
-                                    elif os.path.exists("{dump_dir}/xtrabackup_info.zst".format(dump_dir=dump_dir)):
-                                        xtrabackup_info_file = "{dump_dir}/xtrabackup_info.zst".format(dump_dir=dump_dir)
-                                        zstd_cmd = "zstd -d -c {xtrabackup_info_file}".format(xtrabackup_info_file=xtrabackup_info_file)
-                                        xtrabackup_end_time = None
-                                        log_and_print("NOTICE", "Found {xtrabackup_info_file} file in dump dir on item number {number}".format(xtrabackup_info_file=xtrabackup_info_file, number=item["number"]), logger)
-                                        oks += 1
+                        if os.path.exists(db_list_file_path):
+                            with open(db_list_file_path, "r") as db_list_file:
+                                while True:
+                                    db_list_file_line = db_list_file.readline().rstrip()
+                                    if not db_list_file_line:
+                                        break
+                                    sources_to_check.append(db_list_file_line)
+                        else:
+                            log_and_print("ERROR", "{db_list_file_path} file is missing on item number {number}".format(db_list_file_path=db_list_file_path, number=number), logger)
+                            errors += 1
 
-                                        try:
+                    else:
+                        sources_to_check.append(item["source"])
 
-                                            retcode, stdout, stderr = run_cmd_pipe(zstd_cmd)
-                                            if retcode == 0:
+                    # Check sources
+                    for source in sources_to_check:
 
-                                                for xtrabackup_info_line in stdout.split("\n"):
-                                                    if xtrabackup_info_line.lstrip().rstrip().split(" = ")[0] == "end_time":
-                                                        xtrabackup_end_time = xtrabackup_info_line.lstrip().rstrip().split(" = ")[1]
+                        dump_dir_or_file = "{path}/.sync/rsnapshot{db_dump_dir}/{source}{db_dump_ext}".format(path=item["path"], db_dump_dir=db_dump_dir, source=source, db_dump_ext=db_dump_ext)
 
-                                            else:
-                                                log_and_print("ERROR", "zstd cmd failed on item number {number}".format(number=item["number"]), logger)
-                                                errors += 1
+                        # Check dump dir or file exists
+                        if os.path.exists(dump_dir_or_file):
 
-                                        except Exception as e:
-                                            logger.exception(e)
-                                            raise Exception("Caught exception on subprocess.run execution")
+                            log_and_print("NOTICE", "{dump_dir_or_file} dump dir or file exists on item number {number}".format(dump_dir_or_file=dump_dir_or_file, number=number), logger)
+                            oks += 1
 
+                            # With MYSQL and POSTGRESQL we read dump dir or files
+                            if check["type"] in ["MYSQL", "POSTGRESQL"]:
+
+                                # Do dump_dir_or_file_inserts check only if source or ALL is not in empty_db
+                                dump_dir_or_file_lines_number = 0
+                                dump_dir_or_file_inserts = 0
+                                dump_completed_date = None
+                                # zstd dumps are read through the zstd binary as there is no stdlib support
+                                if dump_dir_or_file.endswith(".zst"):
+                                    zstd_process = subprocess.Popen(["zstd", "-q", "-dc", dump_dir_or_file], stdout=subprocess.PIPE)
+                                    dump_dir_or_file_stream = zstd_process.stdout
+                                else:
+                                    zstd_process = None
+                                    dump_dir_or_file_stream = gzip.open(dump_dir_or_file, "r")
+                                with dump_dir_or_file_stream as dump_dir_or_file_file:
+                                    while True:
+                                        dump_dir_or_file_lines_number += 1
+                                        dump_dir_or_file_line = dump_dir_or_file_file.readline()
+                                        if not dump_dir_or_file_line:
+                                            log_and_print("NOTICE", "Read {dump_dir_or_file_lines_number} lines in dump dir or file {dump_dir_or_file} on item number {number}".format(dump_dir_or_file_lines_number=dump_dir_or_file_lines_number, dump_dir_or_file=dump_dir_or_file, number=number), logger)
+                                            break
+                                        if not ("empty_db" in check and (source in check["empty_db"] or "ALL" in check["empty_db"])) and check["type"] == "MYSQL" and re.match("^INSERT INTO", dump_dir_or_file_line.decode(errors="ignore")):
+                                            dump_dir_or_file_inserts += 1
+                                        elif not ("empty_db" in check and (source in check["empty_db"] or "ALL" in check["empty_db"])) and check["type"] == "POSTGRESQL" and re.match("^COPY.*FROM stdin", dump_dir_or_file_line.decode(errors="ignore")):
+                                            dump_dir_or_file_inserts += 1
+                                        elif check["type"] == "MYSQL" and re.match("^-- Dump completed on", dump_dir_or_file_line.decode(errors="ignore")):
+                                            re_match = re.match("^-- Dump completed on (.+)$", dump_dir_or_file_line.decode(errors="ignore"))
+                                            if re_match:
+                                                dump_completed_date = re_match.group(1)
+                                        elif check["type"] == "POSTGRESQL" and re.match("^-- Completed on", dump_dir_or_file_line.decode(errors="ignore")):
+                                            re_match = re.match("^-- Completed on (.+)$", dump_dir_or_file_line.decode(errors="ignore"))
+                                            if re_match:
+                                                dump_completed_date = re_match.group(1)
+
+                                if zstd_process is not None:
+                                    zstd_process.wait()
+
+                                # Do dump_dir_or_file_inserts check only if source or ALL is not in empty_db
+                                if not ("empty_db" in check and (source in check["empty_db"] or "ALL" in check["empty_db"])):
+                                    if dump_dir_or_file_inserts > 0:
+                                        log_and_print("NOTICE", "Found {dump_dir_or_file_inserts} inserts in dump dir or file {dump_dir_or_file} on item number {number}".format(dump_dir_or_file_inserts=dump_dir_or_file_inserts, dump_dir_or_file=dump_dir_or_file, number=number), logger)
+                                        oks += 1
                                     else:
-                                        log_and_print("ERROR", "Found no xtrabackup_info.qp or xtrabackup_info.zst file in dump dir on item number {number}".format(number=item["number"]), logger)
+                                        log_and_print("ERROR", "Found 0 inserts in dump dir or file {dump_dir_or_file} on item number {number}".format(dump_dir_or_file=dump_dir_or_file, number=number), logger)
                                         errors += 1
-
-                                    # Check xtrabackup end_time
-                                    if xtrabackup_end_time is not None:
-                                        seconds_between_end_time_and_now = (datetime.now() - datetime.strptime(xtrabackup_end_time, "%Y-%m-%d %H:%M:%S")).total_seconds()
-                                        # Dump files shouldn't be older than 1 day
-                                        if seconds_between_end_time_and_now < 60*60*24:
-                                            log_and_print("NOTICE", "Dump mariadb-backup end_time signature age {seconds} secs is less than 1d for the dump dir {dump_dir} on item number {number}".format(seconds=int(seconds_between_end_time_and_now), dump_dir=dump_dir, number=item["number"]), logger)
-                                            oks += 1
-                                        else:
-                                            log_and_print("ERROR", "Dump mariadb-backup end_time signature age {seconds} secs is more than 1d for the dump dir {dump_dir} on item number {number}".format(seconds=int(seconds_between_end_time_and_now), dump_dir=dump_dir, number=item["number"]), logger)
-                                            errors += 1
+                                else:
+                                    log_and_print("NOTICE", "Skipping dump dir or file inserts check on item number {number} because source or ALL is in empty_db".format(number=number), logger)
+
+                                # Check dump completed date
+                                if dump_completed_date is not None:
+                                    if check["type"] == "MYSQL":
+                                        seconds_between_dump_completed_date_and_now = (datetime.now() - datetime.strptime(dump_completed_date, "%Y-%m-%d %H:%M:%S")).total_seconds()
+                                    elif check["type"] == "POSTGRESQL":
+                                        seconds_between_dump_completed_date_and_now = (datetime.now() - datetime.strptime(dump_completed_date, "%Y-%m-%d %H:%M:%S %Z")).total_seconds()
+                                    # Dump files shouldn't be older than 1 day
+                                    if seconds_between_dump_completed_date_and_now < 60*60*24:
+                                        log_and_print("NOTICE", "Dump completion signature age {seconds} secs is less than 1d for the dump dir or file {dump_dir_or_file} on item number {number}".format(seconds=int(seconds_between_dump_completed_date_and_now), dump_dir_or_file=dump_dir_or_file, number=number), logger)
+                                        oks += 1
                                     else:
-                                        log_and_print("ERROR", "There is no mariadb-backup end_time signature in file {xtrabackup_info_file} on item number {number}".format(xtrabackup_info_file=xtrabackup_info_file, number=item["number"]), logger)
+                                        log_and_print("ERROR", "Dump completion signature age {seconds} secs is more than 1d for the dump dir or file {dump_dir_or_file} on item number {number}".format(seconds=int(seconds_between_dump_completed_date_and_now), dump_dir_or_file=dump_dir_or_file, number=number), logger)
                                         errors += 1
+                                else:
+                                    log_and_print("ERROR", "There is no dump completion signature in dump dir or file {dump_dir_or_file} on item number {number}".format(dump_dir_or_file=dump_dir_or_file, number=number), logger)
+                                    errors += 1
 
+                            # With MONGODB we read tar archive
+                            elif check["type"] in ["MONGODB"]:
+
+                                tarfile_or_dumpdir_bsons_number = 0
+                                tarfile_or_dumpdir_non_zero_sized_bson_date = None
+                                tarfile_or_dumpdir_non_zero_sized_bsons_number = 0
+
+                                if item["mongodump_skip_tar"]:
+                                    with os.scandir(dump_dir_or_file) as dump_dir_or_file_dir:
+                                        for dump_dir_or_file_member in dump_dir_or_file_dir:
+                                            if "bson" in dump_dir_or_file_member.name:
+                                                tarfile_or_dumpdir_bsons_number += 1
+                                                if dump_dir_or_file_member.stat().st_size > 0:
+                                                    tarfile_or_dumpdir_non_zero_sized_bsons_number += 1
+                                                    tarfile_or_dumpdir_non_zero_sized_bson_date = datetime.fromtimestamp(dump_dir_or_file_member.stat().st_mtime)
+                                elif item["mongodump_archive"]:
+                                    # mongodump archives are not tar, validate the gzip stream is readable and use file mtime for age
+                                    archive_stat = os.stat(dump_dir_or_file)
+                                    if archive_stat.st_size > 0:
+                                        with gzip.open(dump_dir_or_file, "rb") as archive_file:
+                                            if archive_file.read(16):
+                                                tarfile_or_dumpdir_bsons_number += 1
+                                                tarfile_or_dumpdir_non_zero_sized_bsons_number += 1
+                                                tarfile_or_dumpdir_non_zero_sized_bson_date = datetime.fromtimestamp(archive_stat.st_mtime)
+                                else:
+                                    # .tar.zst archives are piped through the zstd binary and read in tar stream mode
+                                    if dump_dir_or_file.endswith(".tar.zst"):
+                                        zstd_process = subprocess.Popen(["zstd", "-q", "-dc", dump_dir_or_file], stdout=subprocess.PIPE)
+                                        tar_stream = tarfile.open(fileobj=zstd_process.stdout, mode="r|")
+                                    else:
+                                        zstd_process = None
+                                        tar_stream = tarfile.open(dump_dir_or_file, "r")
+                                    with tar_stream as dump_dir_or_file_file:
+                                        for tarfile_or_dumpdir_member in dump_dir_or_file_file:
+                                            if "bson" in tarfile_or_dumpdir_member.name:
+                                                tarfile_or_dumpdir_bsons_number += 1
+                                                if tarfile_or_dumpdir_member.size > 0:
+                                                    tarfile_or_dumpdir_non_zero_sized_bsons_number += 1
+                                                    tarfile_or_dumpdir_non_zero_sized_bson_date = datetime.fromtimestamp(tarfile_or_dumpdir_member.mtime)
+                                    if zstd_process is not None:
+                                        zstd_process.wait()
+
+                                log_and_print("NOTICE", "Found {tarfile_or_dumpdir_bsons_number} bsons in dump dir or file {dump_dir_or_file} on item number {number}".format(tarfile_or_dumpdir_bsons_number=tarfile_or_dumpdir_bsons_number, dump_dir_or_file=dump_dir_or_file, number=number), logger)
+
+                                # Check non zero sized bsons
+                                if tarfile_or_dumpdir_non_zero_sized_bsons_number > 0:
+                                    log_and_print("NOTICE", "Found {tarfile_or_dumpdir_non_zero_sized_bsons_number} non zero sized bsons in dump dir or file {dump_dir_or_file} on item number {number}".format(tarfile_or_dumpdir_non_zero_sized_bsons_number=tarfile_or_dumpdir_non_zero_sized_bsons_number, dump_dir_or_file=dump_dir_or_file, number=number), logger)
+                                    oks += 1
                                 else:
-                                    log_and_print("ERROR", "{dump_dir} dump dir is missing on item number {number}".format(dump_dir=dump_dir, number=item["number"]), logger)
+                                    log_and_print("ERROR", "Found 0 non zero sized bsons in dump dir or file {dump_dir_or_file} on item number {number}".format(dump_dir_or_file=dump_dir_or_file, number=number), logger)
                                     errors += 1
 
-                            # mysqlsh
-                            if item["type"] == "MYSQL_SSH" and check["type"] == "MYSQL" and "mysql_dump_type" in item and item["mysql_dump_type"] == "mysqlsh":
+                                # Check dump completed date
+                                if tarfile_or_dumpdir_non_zero_sized_bson_date is not None:
+                                    seconds_between_tarfile_or_dumpdir_non_zero_sized_bson_date_and_now = (datetime.now() - tarfile_or_dumpdir_non_zero_sized_bson_date).total_seconds()
+                                    # Dump files shouldn't be older than 1 day
+                                    if seconds_between_tarfile_or_dumpdir_non_zero_sized_bson_date_and_now < 60*60*24:
+                                        log_and_print("NOTICE", "Dump bsons age {seconds} secs is less than 1d for the dump dir or file {dump_dir_or_file} on item number {number}".format(seconds=int(seconds_between_tarfile_or_dumpdir_non_zero_sized_bson_date_and_now), dump_dir_or_file=dump_dir_or_file, number=number), logger)
+                                        oks += 1
+                                    else:
+                                        log_and_print("ERROR", "Dump bsons age {seconds} secs is more than 1d for the dump dir or file {dump_dir_or_file} on item number {number}".format(seconds=int(seconds_between_tarfile_or_dumpdir_non_zero_sized_bson_date_and_now), dump_dir_or_file=dump_dir_or_file, number=number), logger)
+                                        errors += 1
 
-                                if item["source"] == "ALL":
-                                    dump_dir = "{path}/.sync/rsnapshot{db_dump_dir}/all.mysqlsh".format(path=item["path"], db_dump_dir=item["mysql_dump_dir"])
-                                else:
-                                    dump_dir = "{path}/.sync/rsnapshot{db_dump_dir}/{source}.mysqlsh".format(path=item["path"], db_dump_dir=item["mysql_dump_dir"], source=item["source"])
+                        else:
+                            log_and_print("ERROR", "{dump_dir_or_file} dump dir or file is missing on item number {number}".format(dump_dir_or_file=dump_dir_or_file, number=number), logger)
+                            errors += 1
 
-                                # Check dump dir exists
-                                if os.path.isdir(dump_dir):
+                # .backup and FILE_AGE
+                if item["type"] in RSYNC_TYPES:
 
-                                        log_and_print("NOTICE", "{dump_dir} dump dir exists on item number {number}".format(dump_dir=dump_dir, number=item["number"]), logger)
-                                        oks += 1
+                    sources_to_check = []
 
-                                        # Read @.done.json
-                                        mysqlsh_info_file = "{dump_dir}/@.done.json".format(dump_dir=dump_dir)
-                                        cat_json_cmd = "cat {mysqlsh_info_file} | grep -e '.end.:'".format(mysqlsh_info_file=mysqlsh_info_file)
-                                        mysqlsh_end_time = None
-                                        if os.path.exists(mysqlsh_info_file):
+                    # Expand paths to check for RSYNC_SSH
+                    if item["type"] == "RSYNC_SSH":
 
-                                            log_and_print("NOTICE", "Found {mysqlsh_info_file} file in dump dir on item number {number}".format(mysqlsh_info_file=mysqlsh_info_file, number=item["number"]), logger)
-                                            oks += 1
+                        if item["source"] in DATA_EXPAND:
+                            for source in DATA_EXPAND[item["source"]]:
+                                if not ("exclude" in item and source in item["exclude"]):
+                                    sources_to_check.append(source)
+                        else:
+                            sources_to_check.append(item["source"])
 
-                                            try:
+                    # For RSYNC_NATIVE we need to strip first dir path (share name) from source
+                    if item["type"] == "RSYNC_NATIVE":
+                        sources_to_check.append("/{path}".format(path="/".join(item["source"].split("/")[2:])))
 
-                                                retcode, stdout, stderr = run_cmd_pipe(cat_json_cmd)
-                                                if retcode == 0:
+                    # Check sources
+                    for source in sources_to_check:
 
-                                                    for mysqlsh_info_line in stdout.split("\n"):
-                                                        if '"end":' in mysqlsh_info_line.lstrip().rstrip():
-                                                            mysqlsh_end_time = mysqlsh_info_line.lstrip().rstrip().replace('"end": "', "").replace('",', "")
+                        # FILE_AGE
+                        if check["type"] == "FILE_AGE":
 
-                                                else:
-                                                    log_and_print("ERROR", "cat cmd failed on item number {number}".format(number=item["number"]), logger)
-                                                    errors += 1
+                            find_cmd = "find {item_path}/.sync/rsnapshot{source} -type f -regex '.*/{mask}'".format(item_path=item["path"], source=source, mask=check["files_mask"])
+                            log_and_print("NOTICE", "find cmd: {find_cmd} on item number {number}".format(find_cmd=find_cmd, number=number), logger)
 
-                                            except Exception as e:
-                                                logger.exception(e)
-                                                raise Exception("Caught exception on subprocess.run execution")
+                            retcode, stdout, stderr = run_cmd_pipe(find_cmd)
+                            if retcode == 0:
 
+                                # Process find results
+
+                                file_list = stdout
+                                file_list_file_count = 0
+                                file_list_last_file_timestamp = 0
+                                file_list_last_file_datetime = None
+                                file_list_last_file = None
+
+                                for file_list_file in file_list.split("\n"):
+                                    if len(file_list_file) > 0:
+                                        file_list_file_count += 1
+
+                                        # Find last file
+                                        file_list_file_timestamp = os.path.getmtime(file_list_file)
+                                        if file_list_file_timestamp > file_list_last_file_timestamp:
+                                            file_list_last_file_timestamp = file_list_file_timestamp
+                                            file_list_last_file_datetime = datetime.fromtimestamp(file_list_file_timestamp)
+                                            file_list_last_file = file_list_file
+
+                                        # Check min_file_size
+                                        file_list_file_size = os.stat(file_list_file).st_size
+                                        if file_list_file_size >= check["min_file_size"]:
+                                            log_and_print("NOTICE", "File {file_count} {file_list_file} size {size} is not less than needed {min_file_size} on item number {number}".format(file_count=file_list_file_count, size=file_list_file_size, file_list_file=file_list_file, min_file_size=check["min_file_size"], number=number), logger)
+                                            oks += 1
                                         else:
-                                            log_and_print("ERROR", "Found no {mysqlsh_info_file} file in dump dir on item number {number}".format(mysqlsh_info_file=mysqlsh_info_file, number=item["number"]), logger)
+                                            log_and_print("ERROR", "File {file_count} {file_list_file} size {size} is less than needed {min_file_size} on item number {number}".format(file_count=file_list_file_count, size=file_list_file_size, file_list_file=file_list_file, min_file_size=check["min_file_size"], number=number), logger)
                                             errors += 1
 
-                                        # Check mysqlsh end time
-                                        if mysqlsh_end_time is not None:
-                                            seconds_between_end_time_and_now = (datetime.now() - datetime.strptime(mysqlsh_end_time, "%Y-%m-%d %H:%M:%S")).total_seconds()
-                                            # Dump files shouldn't be older than 1 day
-                                            if seconds_between_end_time_and_now < 60*60*24:
-                                                log_and_print("NOTICE", "Dump @.done.json end time signature age {seconds} secs is less than 1d for the dump dir {dump_dir} on item number {number}".format(seconds=int(seconds_between_end_time_and_now), dump_dir=dump_dir, number=item["number"]), logger)
+                                        # Check file_type
+                                        ft_retcode, ft_stdout, ft_stderr = run_cmd_pipe("file -b '{file_list_file}'".format(file_list_file=file_list_file))
+                                        if ft_retcode == 0:
+                                            file_type_received = ft_stdout.lstrip().rstrip()
+                                            if re.match(check["file_type"], file_type_received):
+                                                log_and_print("NOTICE", "File {file_count} {file_list_file} type {file_type_received} matched needed {check_file_type} on item number {number}".format(file_count=file_list_file_count, file_list_file=file_list_file, file_type_received=file_type_received, check_file_type=check["file_type"], number=number), logger)
                                                 oks += 1
                                             else:
-                                                log_and_print("ERROR", "Dump @.done.json end time signature age {seconds} secs is more than 1d for the dump dir {dump_dir} on item number {number}".format(seconds=int(seconds_between_end_time_and_now), dump_dir=dump_dir, number=item["number"]), logger)
+                                                log_and_print("ERROR", "File {file_count} {file_list_file} type {file_type_received} mismatched needed {check_file_type} on item number {number}".format(file_count=file_list_file_count, file_list_file=file_list_file, file_type_received=file_type_received, check_file_type=check["file_type"], number=number), logger)
                                                 errors += 1
                                         else:
-                                            log_and_print("ERROR", "There is no @.done.json end time signature in file {mysqlsh_info_file} on item number {number}".format(mysqlsh_info_file=mysqlsh_info_file, number=item["number"]), logger)
+                                            log_and_print("ERROR", "Getting file {file_list_file} type failed on item number {number}".format(file_list_file=file_list_file, number=number), logger)
                                             errors += 1
 
+                                # Check files_total
+                                if file_list_file_count >= check["files_total"]:
+                                    log_and_print("NOTICE", "Found {file_list_file_count} of needed {files_total} files on item number {number}".format(file_list_file_count=file_list_file_count, files_total=check["files_total"], number=number), logger)
+                                    oks += 1
                                 else:
-                                    log_and_print("ERROR", "{dump_dir} dump dir is missing on item number {number}".format(dump_dir=dump_dir, number=item["number"]), logger)
+                                    log_and_print("ERROR", "Found {file_list_file_count} of needed {files_total} files on item number {number}".format(file_list_file_count=file_list_file_count, files_total=check["files_total"], number=number), logger)
                                     errors += 1
 
-                            # pg_dump directory
-                            if item["type"] == "POSTGRESQL_SSH" and check["type"] == "POSTGRESQL" and "postgresql_dump_type" in item and item["postgresql_dump_type"] == "directory":
-
-                                sources_to_check = []
-
-                                if item["source"] == "ALL":
-
-                                    db_list_file_path = "{path}/.sync/rsnapshot{postgresql_dump_dir}/db_list.txt".format(path=item["path"], postgresql_dump_dir=item["postgresql_dump_dir"])
+                                # Check files_total_max, this check is optional
+                                if "files_total_max" in check:
+                                    if file_list_file_count <= check["files_total_max"]:
+                                        log_and_print("NOTICE", "Found {file_list_file_count} of max {files_total_max} files on item number {number}".format(file_list_file_count=file_list_file_count, files_total_max=check["files_total_max"], number=number), logger)
+                                        oks += 1
+                                    else:
+                                        log_and_print("ERROR", "Found {file_list_file_count} of max {files_total_max} files on item number {number}".format(file_list_file_count=file_list_file_count, files_total_max=check["files_total_max"], number=number), logger)
+                                        errors += 1
 
-                                    if os.path.exists(db_list_file_path):
-                                        with open(db_list_file_path, "r") as db_list_file:
-                                            while True:
-                                                db_list_file_line = db_list_file.readline().rstrip()
-                                                if not db_list_file_line:
-                                                    break
-                                                sources_to_check.append(db_list_file_line)
+                                # Check last_file_age
+                                if file_list_file_count > 0:
+                                    seconds_between_file_list_last_file_datetime_and_now = (datetime.now() - file_list_last_file_datetime).total_seconds()
+                                    if seconds_between_file_list_last_file_datetime_and_now < check["last_file_age"]*60*60*24:
+                                        log_and_print("NOTICE", "Last file {file_list_last_file} date {date} is not older than allowed {last_file_age} days old on item number {number}".format(file_list_last_file=file_list_last_file, date=file_list_last_file_datetime, last_file_age=check["last_file_age"], number=number), logger)
+                                        oks += 1
                                     else:
-                                        log_and_print("ERROR", "{db_list_file_path} file is missing on item number {number}".format(db_list_file_path=db_list_file_path, number=item["number"]), logger)
+                                        log_and_print("ERROR", "Last file {file_list_last_file} date {date} is older than allowed {last_file_age} days old on item number {number}".format(file_list_last_file=file_list_last_file, date=file_list_last_file_datetime, last_file_age=check["last_file_age"], number=number), logger)
                                         errors += 1
 
-                                else:
-                                    sources_to_check.append(item["source"])
+                            else:
+                                log_and_print("ERROR", "find cmd failed on item number {number}".format(number=number), logger)
+                                errors += 1
 
-                                # Check sources
-                                for source in sources_to_check:
 
-                                    dump_dir = "{path}/.sync/rsnapshot{postgresql_dump_dir}/{source}".format(path=item["path"], postgresql_dump_dir=item["postgresql_dump_dir"], source=source)
+                        # .backup
+                        if check["type"] in [".backup", "s3/.backup"]:
 
-                                    # Check dump dir exists
-                                    if os.path.isdir(dump_dir):
+                            # Construct path
+                            check_file = "{item_path}/.sync/rsnapshot{source}/.backup".format(item_path=item["path"], source=source)
 
-                                            log_and_print("NOTICE", "{dump_dir} dump dir exists on item number {number}".format(dump_dir=dump_dir, number=item["number"]), logger)
-                                            oks += 1
+                            # Check check file existance
+                            if os.path.exists(check_file):
 
-                                            # Check toc.dat at least 10 Kb
-                                            # Skip this check for databases in empty_db
-                                            empty_db = check.get("empty_db")
-                                            if not isinstance(empty_db, list):
-                                                empty_db = []
-                                            toc_dat_file = "{dump_dir}/toc.dat".format(dump_dir=dump_dir)
-                                            if os.path.exists(toc_dat_file) and os.stat(toc_dat_file).st_size > 10000:
-                                                log_and_print("NOTICE", "Found {toc_dat_file} file larger than 10 Kb in dump dir on item number {number}".format(toc_dat_file=toc_dat_file, number=item["number"]), logger)
-                                                oks += 1
-                                            elif "empty_db" in check and (source in empty_db or "ALL" in empty_db):
-                                                log_and_print("NOTICE", "Skipping toc.dat size check for empty_db source {source} in dump dir {dump_dir} on item number {number}".format(source=source, dump_dir=dump_dir, number=item["number"]), logger)
-                                            else:
-                                                log_and_print("ERROR", "Found no {toc_dat_file} file larger than 10 Kb in dump dir on item number {number}".format(toc_dat_file=toc_dat_file, number=item["number"]), logger)
-                                                errors += 1
+                                log_and_print("NOTICE", ".backup file exists on item number {number}: {check_file}".format(number=number, check_file=check_file), logger)
+                                oks += 1
 
-                                            # Read dump_dir stats using pg_restore
-                                            toc_dat_file = "{dump_dir}/toc.dat".format(dump_dir=dump_dir)
-                                            pg_restore_cmd = "pg_restore --list {dump_dir}".format(dump_dir=dump_dir)
-                                            toc_archive_created = None
-                                            toc_dbname = None
-                                            toc_entries = None
-                                            toc_table_data_count = 0
-                                            if os.path.exists(toc_dat_file):
+                                # Gather check file data
+                                check_file_dict = {}
+                                with open(check_file, "r") as check_file_file:
+                                    while True:
+                                        check_file_line = check_file_file.readline().rstrip()
+                                        if not check_file_line:
+                                            break
+                                        check_file_line_key = check_file_line.split(": ")[0]
+                                        check_file_line_val = check_file_line.split(": ")[1]
+                                        check_file_dict[check_file_line_key] = check_file_line_val
 
-                                                log_and_print("NOTICE", "Found {toc_dat_file} file in dump dir on item number {number}".format(toc_dat_file=toc_dat_file, number=item["number"]), logger)
-                                                oks += 1
+                                if check["type"] == ".backup":
 
-                                                try:
-
-                                                    retcode, stdout, stderr = run_cmd_pipe(pg_restore_cmd)
-                                                    if retcode == 0:
-
-                                                        for pg_restore_line in stdout.split("\n"):
-                                                            # Find '; Archive created at ' line and get toc_archive_created - everything after that block
-                                                            if pg_restore_line.lstrip().rstrip().startswith("; Archive created at "):
-                                                                toc_archive_created = pg_restore_line.split("; Archive created at ")[1]
-                                                            # Find line that contains 'dbname: ' and get toc_dbname
-                                                            if "dbname: " in pg_restore_line.lstrip().rstrip():
-                                                                toc_dbname = pg_restore_line.split("dbname: ")[1]
-                                                            # Find line that contains 'TOC Entries: ' and get toc_entries
-                                                            if "TOC Entries: " in pg_restore_line.lstrip().rstrip():
-                                                                toc_entries = pg_restore_line.split("TOC Entries: ")[1]
-                                                            # Each line that contains " TABLE DATA " increases toc_table_data_count
-                                                            if " TABLE DATA " in pg_restore_line.lstrip().rstrip():
-                                                                toc_table_data_count += 1
-
-                                                    else:
-                                                        log_and_print("ERROR", "pg_restore cmd failed on item number {number}".format(number=item["number"]), logger)
-                                                        errors += 1
-
-                                                except Exception as e:
-                                                    logger.exception(e)
-                                                    raise Exception("Caught exception on subprocess.run execution")
+                                    # Check file Host
+                                    if "Host" in check_file_dict:
+                                        if check_file_dict["Host"].lower() == item["host"].lower():
+                                            log_and_print("NOTICE", ".backup file host {file_host} matched {item_host} on item number {number}: {check_file}".format(file_host=check_file_dict["Host"], item_host=item["host"], number=number, check_file=check_file), logger)
+                                            oks += 1
+                                        else:
+                                            log_and_print("ERROR", ".backup file host {file_host} mismatched {item_host} on item number {number}: {check_file}".format(file_host=check_file_dict["Host"], item_host=item["host"], number=number, check_file=check_file), logger)
+                                            errors += 1
+                                    else:
+                                        log_and_print("ERROR", ".backup file doesn't contain Host on item number {number}: {check_file}".format(number=number, check_file=check_file), logger)
+                                        errors += 1
 
-                                            else:
-                                                log_and_print("ERROR", "Found no {toc_dat_file} file in dump dir on item number {number}".format(toc_dat_file=toc_dat_file, number=item["number"]), logger)
-                                                errors += 1
+                                    # Check file Path
+                                    if "Path" in check_file_dict:
 
-                                            # Check toc_archive_created time, example: '2024-02-17 13:53:50 EET'
-                                            if toc_archive_created is not None:
-                                                seconds_between_archive_created_and_now = (datetime.now() - datetime.strptime(toc_archive_created, "%Y-%m-%d %H:%M:%S %Z")).total_seconds()
-                                                # Dump files shouldn't be older than 1 day
-                                                if seconds_between_archive_created_and_now < 60*60*24:
-                                                    log_and_print("NOTICE", "Dump Archive created at signature age {seconds} secs is less than 1d for the dump dir {dump_dir} on item number {number}".format(seconds=int(seconds_between_archive_created_and_now), dump_dir=dump_dir, number=item["number"]), logger)
-                                                    oks += 1
-                                                else:
-                                                    log_and_print("ERROR", "Dump Archive created at signature age {seconds} secs is more than 1d for the dump dir {dump_dir} on item number {number}".format(seconds=int(seconds_between_archive_created_and_now), dump_dir=dump_dir, number=item["number"]), logger)
-                                                    errors += 1
-
-                                            # Check toc_dbname matches with item["source"]
-                                            if toc_dbname is not None:
-                                                if toc_dbname == source:
-                                                    log_and_print("NOTICE", "Dump dbname signature matches with source {source} for the dump dir {dump_dir} on item number {number}".format(source=source, dump_dir=dump_dir, number=item["number"]), logger)
-                                                    oks += 1
-                                                else:
-                                                    log_and_print("ERROR", "Dump dbname signature {toc_dbname} does not match with source {source} for the dump dir {dump_dir} on item number {number}".format(toc_dbname=toc_dbname, source=source, dump_dir=dump_dir, number=item["number"]), logger)
-                                                    errors += 1
-
-                                            # Check toc_entries is not empty
-                                            if toc_entries is not None:
-                                                if int(toc_entries) > 0:
-                                                    log_and_print("NOTICE", "Found {toc_entries} TOC Entries in dump dir on item number {number}".format(toc_entries=toc_entries, number=item["number"]), logger)
-                                                    oks += 1
-                                                else:
-                                                    log_and_print("ERROR", "Found 0 TOC Entries in dump dir on item number {number}".format(number=item["number"]), logger)
-                                                    errors += 1
-
-                                            # Check toc_table_data_count is not empty
-                                            # Skip this check for databases in empty_db
-                                            empty_db = check.get("empty_db")
-                                            if not isinstance(empty_db, list):
-                                                empty_db = []
-                                            if toc_table_data_count > 0:
-                                                log_and_print("NOTICE", "Found {toc_table_data_count} TABLE DATA entries in dump dir on item number {number}".format(toc_table_data_count=toc_table_data_count, number=item["number"]), logger)
-                                                oks += 1
-                                            elif "empty_db" in check and (source in empty_db or "ALL" in empty_db):
-                                                log_and_print("NOTICE", "Skipping TABLE DATA entries check for empty_db source {source} in dump dir {dump_dir} on item number {number}".format(source=source, dump_dir=dump_dir, number=item["number"]), logger)
-                                            else:
-                                                log_and_print("ERROR", "Found 0 TABLE DATA entries in dump dir on item number {number}".format(number=item["number"]), logger)
-                                                errors += 1
+                                        # Path could be defined in check
+                                        if "path" in check:
+                                            path_to_check = check["path"]
+                                        else:
+                                            path_to_check = source
 
+                                        if check_file_dict["Path"] == path_to_check:
+                                            log_and_print("NOTICE", ".backup file path {file_path} matched {item_path} on item number {number}: {check_file}".format(file_path=check_file_dict["Path"], item_path=path_to_check, number=number, check_file=check_file), logger)
+                                            oks += 1
+                                        else:
+                                            log_and_print("ERROR", ".backup file path {file_path} mismatched {item_path} on item number {number}: {check_file}".format(file_path=check_file_dict["Path"], item_path=path_to_check, number=number, check_file=check_file), logger)
+                                            errors += 1
                                     else:
-                                        log_and_print("ERROR", "{dump_dir} dump dir is missing on item number {number}".format(dump_dir=dump_dir, number=item["number"]), logger)
+                                        log_and_print("ERROR", ".backup file doesn't contain Path on item number {number}: {check_file}".format(number=number, check_file=check_file), logger)
                                         errors += 1
 
-                            # Native DB dumps have similiar logic
-                            if (
-                                    (item["type"] == "MYSQL_SSH" and check["type"] == "MYSQL" and not ("mysql_dump_type" in item and (item["mysql_dump_type"] == "xtrabackup" or item["mysql_dump_type"] == "mariadb-backup" or item["mysql_dump_type"] == "mysqlsh")))
-                                    or
-                                    (item["type"] == "POSTGRESQL_SSH" and check["type"] == "POSTGRESQL" and not ("postgresql_dump_type" in item and item["postgresql_dump_type"] == "directory"))
-                                    or
-                                    (item["type"] == "MONGODB_SSH" and check["type"] == "MONGODB")
-                                ):
-
-                                sources_to_check = []
-
-                                if check["type"] == "MYSQL":
-                                    db_dump_dir = item["mysql_dump_dir"]
-                                    db_dump_ext = ".gz"
-                                elif check["type"] == "POSTGRESQL":
-                                    db_dump_dir = item["postgresql_dump_dir"]
-                                    db_dump_ext = ".gz"
-                                elif check["type"] == "MONGODB":
-                                    db_dump_dir = item["mongodb_dump_dir"]
-                                    if item["mongodump_skip_tar"]:
-                                        db_dump_ext = ""
+                                elif check["type"] == "s3/.backup":
+
+                                    # Check file Bucket
+                                    if "Bucket" in check_file_dict:
+                                        if check_file_dict["Bucket"] == check["s3_bucket"]:
+                                            log_and_print("NOTICE", ".backup file bucket {file_bucket} matched s3 {check_bucket} on item number {number}: {check_file}".format(file_bucket=check_file_dict["Bucket"], check_bucket=check["s3_bucket"], number=number, check_file=check_file), logger)
+                                            oks += 1
+                                        else:
+                                            log_and_print("ERROR", ".backup file bucket {file_bucket} mismatched s3 {check_bucket} on item number {number}: {check_file}".format(file_bucket=check_file_dict["Bucket"], check_bucket=check["s3_bucket"], number=number, check_file=check_file), logger)
+                                            errors += 1
                                     else:
-                                        db_dump_ext = ".tar.gz"
+                                        log_and_print("ERROR", ".backup file doesn't contain Bucket on item number {number}: {check_file}".format(number=number, check_file=check_file), logger)
+                                        errors += 1
 
-                                if item["source"] == "ALL":
+                                    # Check file Path
+                                    if "Path" in check_file_dict:
 
-                                    db_list_file_path = "{path}/.sync/rsnapshot{db_dump_dir}/db_list.txt".format(path=item["path"], db_dump_dir=db_dump_dir)
+                                        if check_file_dict["Path"] == check["s3_path"]:
+                                            log_and_print("NOTICE", ".backup file path {file_path} matched s3 {check_path} on item number {number}: {check_file}".format(file_path=check_file_dict["Path"], check_path=check["s3_path"], number=number, check_file=check_file), logger)
+                                            oks += 1
+                                        else:
+                                            log_and_print("ERROR", ".backup file path {file_path} mismatched s3 {check_path} on item number {number}: {check_file}".format(file_path=check_file_dict["Path"], check_path=check["s3_path"], number=number, check_file=check_file), logger)
+                                            errors += 1
+                                    else:
+                                        log_and_print("ERROR", ".backup file doesn't contain Path on item number {number}: {check_file}".format(number=number, check_file=check_file), logger)
+                                        errors += 1
 
-                                    if os.path.exists(db_list_file_path):
-                                        with open(db_list_file_path, "r") as db_list_file:
-                                            while True:
-                                                db_list_file_line = db_list_file.readline().rstrip()
-                                                if not db_list_file_line:
-                                                    break
-                                                sources_to_check.append(db_list_file_line)
+                                # Check file UTC 
+                                if "UTC" in check_file_dict:
+                                    seconds_between_check_file_utc_and_now = (datetime.now() - datetime.strptime(check_file_dict["UTC"], "%Y-%m-%d %H:%M:%S")).total_seconds()
+                                    # .backups files shouldn't be older than 1 day
+                                    if seconds_between_check_file_utc_and_now < 60*60*24:
+                                        log_and_print("NOTICE", ".backup file date age {seconds} secs is less than 1d on item number {number}: {check_file}".format(seconds=int(seconds_between_check_file_utc_and_now), number=number, check_file=check_file), logger)
+                                        oks += 1
                                     else:
-                                        log_and_print("ERROR", "{db_list_file_path} file is missing on item number {number}".format(db_list_file_path=db_list_file_path, number=item["number"]), logger)
+                                        log_and_print("ERROR", ".backup file date age {seconds} secs is more than 1d on item number {number}: {check_file}".format(seconds=int(seconds_between_check_file_utc_and_now), number=number, check_file=check_file), logger)
                                         errors += 1
+                                else:
+                                    log_and_print("ERROR", ".backup file doesn't contain UTC on item number {number}: {check_file}".format(number=number, check_file=check_file), logger)
+                                    errors += 1
 
+                                # Check file backup hosts to find self
+                                if "Backup 1 Host" in check_file_dict and "Backup 1 Path" in check_file_dict:
+                                    check_file_backup_item = 1
+                                    backup_host_found = False
+                                    backup_host_path_found = False
+                                    while True:
+                                        if "Backup {n} Host".format(n=check_file_backup_item) in check_file_dict and "Backup {n} Path".format(n=check_file_backup_item) in check_file_dict:
+                                            if check_file_dict["Backup {n} Host".format(n=check_file_backup_item)] == SELF_HOSTNAME:
+                                                backup_host_found = True
+                                                if check_file_dict["Backup {n} Path".format(n=check_file_backup_item)] == item["path"]:
+                                                    backup_host_path_found = True
+                                            check_file_backup_item += 1
+                                        else:
+                                            break
+                                    if backup_host_found and backup_host_path_found:
+                                        log_and_print("NOTICE", ".backup file backup host {host} and path {path} are found on item number {number}: {check_file}".format(host=SELF_HOSTNAME, path=item["path"], number=number, check_file=check_file), logger)
+                                        oks += 1
+                                    else:
+                                        log_and_print("ERROR", ".backup file backup host {host} and path {path} are not found on item number {number}: {check_file}".format(host=SELF_HOSTNAME, path=item["path"], number=number, check_file=check_file), logger)
+                                        errors += 1
                                 else:
-                                    sources_to_check.append(item["source"])
-                                
-                                # Check sources
-                                for source in sources_to_check:
+                                    log_and_print("ERROR", ".backup file doesn't contain at least one backup host/path on item number {number}: {check_file}".format(number=number, check_file=check_file), logger)
+                                    errors += 1
 
-                                    dump_dir_or_file = "{path}/.sync/rsnapshot{db_dump_dir}/{source}{db_dump_ext}".format(path=item["path"], db_dump_dir=db_dump_dir, source=source, db_dump_ext=db_dump_ext)
+                            else:
+                                log_and_print("ERROR", ".backup file is missing on item number {number}: {check_file}".format(number=number, check_file=check_file), logger)
+                                errors += 1
 
-                                    # Check dump dir or file exists
-                                    if os.path.exists(dump_dir_or_file):
+    except Exception as e:
+        logger.error("Caught exception, but not interrupting")
+        logger.exception(e)
+        errors += 1
 
-                                        log_and_print("NOTICE", "{dump_dir_or_file} dump dir or file exists on item number {number}".format(dump_dir_or_file=dump_dir_or_file, number=item["number"]), logger)
-                                        oks += 1
+    return errors, oks
 
-                                        # With MYSQL and POSTGRESQL we read dump dir or files
-                                        if check["type"] in ["MYSQL", "POSTGRESQL"]:
-
-                                            # Do dump_dir_or_file_inserts check only if source or ALL is not in empty_db
-                                            dump_dir_or_file_lines_number = 0
-                                            dump_dir_or_file_inserts = 0
-                                            dump_completed_date = None
-                                            with gzip.open(dump_dir_or_file, "r") as dump_dir_or_file_file:
-                                                while True:
-                                                    dump_dir_or_file_lines_number += 1
-                                                    dump_dir_or_file_line = dump_dir_or_file_file.readline()
-                                                    if not dump_dir_or_file_line:
-                                                        log_and_print("NOTICE", "Read {dump_dir_or_file_lines_number} lines in dump dir or file {dump_dir_or_file} on item number {number}".format(dump_dir_or_file_lines_number=dump_dir_or_file_lines_number, dump_dir_or_file=dump_dir_or_file, number=item["number"]), logger)
-                                                        break
-                                                    if not ("empty_db" in check and (source in check["empty_db"] or "ALL" in check["empty_db"])) and check["type"] == "MYSQL" and re.match("^INSERT INTO", dump_dir_or_file_line.decode(errors="ignore")):
-                                                        dump_dir_or_file_inserts += 1
-                                                    elif not ("empty_db" in check and (source in check["empty_db"] or "ALL" in check["empty_db"])) and check["type"] == "POSTGRESQL" and re.match("^COPY.*FROM stdin", dump_dir_or_file_line.decode(errors="ignore")):
-                                                        dump_dir_or_file_inserts += 1
-                                                    elif check["type"] == "MYSQL" and re.match("^-- Dump completed on", dump_dir_or_file_line.decode(errors="ignore")):
-                                                        re_match = re.match("^-- Dump completed on (.+)$", dump_dir_or_file_line.decode(errors="ignore"))
-                                                        if re_match:
-                                                            dump_completed_date = re_match.group(1)
-                                                    elif check["type"] == "POSTGRESQL" and re.match("^-- Completed on", dump_dir_or_file_line.decode(errors="ignore")):
-                                                        re_match = re.match("^-- Completed on (.+)$", dump_dir_or_file_line.decode(errors="ignore"))
-                                                        if re_match:
-                                                            dump_completed_date = re_match.group(1)
-
-                                            # Do dump_dir_or_file_inserts check only if source or ALL is not in empty_db
-                                            if not ("empty_db" in check and (source in check["empty_db"] or "ALL" in check["empty_db"])):
-                                                if dump_dir_or_file_inserts > 0:
-                                                    log_and_print("NOTICE", "Found {dump_dir_or_file_inserts} inserts in dump dir or file {dump_dir_or_file} on item number {number}".format(dump_dir_or_file_inserts=dump_dir_or_file_inserts, dump_dir_or_file=dump_dir_or_file, number=item["number"]), logger)
-                                                    oks += 1
-                                                else:
-                                                    log_and_print("ERROR", "Found 0 inserts in dump dir or file {dump_dir_or_file} on item number {number}".format(dump_dir_or_file=dump_dir_or_file, number=item["number"]), logger)
-                                                    errors += 1
-                                            else:
-                                                log_and_print("NOTICE", "Skipping dump dir or file inserts check on item number {number} because source or ALL is in empty_db".format(number=item["number"]), logger)
-
-                                            # Check dump completed date
-                                            if dump_completed_date is not None:
-                                                if check["type"] == "MYSQL":
-                                                    seconds_between_dump_completed_date_and_now = (datetime.now() - datetime.strptime(dump_completed_date, "%Y-%m-%d %H:%M:%S")).total_seconds()
-                                                elif check["type"] == "POSTGRESQL":
-                                                    seconds_between_dump_completed_date_and_now = (datetime.now() - datetime.strptime(dump_completed_date, "%Y-%m-%d %H:%M:%S %Z")).total_seconds()
-                                                # Dump files shouldn't be older than 1 day
-                                                if seconds_between_dump_completed_date_and_now < 60*60*24:
-                                                    log_and_print("NOTICE", "Dump completion signature age {seconds} secs is less than 1d for the dump dir or file {dump_dir_or_file} on item number {number}".format(seconds=int(seconds_between_dump_completed_date_and_now), dump_dir_or_file=dump_dir_or_file, number=item["number"]), logger)
-                                                    oks += 1
-                                                else:
-                                                    log_and_print("ERROR", "Dump completion signature age {seconds} secs is more than 1d for the dump dir or file {dump_dir_or_file} on item number {number}".format(seconds=int(seconds_between_dump_completed_date_and_now), dump_dir_or_file=dump_dir_or_file, number=item["number"]), logger)
-                                                    errors += 1
-                                            else:
-                                                log_and_print("ERROR", "There is no dump completion signature in dump dir or file {dump_dir_or_file} on item number {number}".format(dump_dir_or_file=dump_dir_or_file, number=item["number"]), logger)
-                                                errors += 1
+# Main
 
-                                        # With MONGODB we read tar archive
-                                        elif check["type"] in ["MONGODB"]:
-
-                                            tarfile_or_dumpdir_bsons_number = 0
-                                            tarfile_or_dumpdir_non_zero_sized_bson_date = None
-                                            tarfile_or_dumpdir_non_zero_sized_bsons_number = 0
-
-                                            if item["mongodump_skip_tar"]:
-                                                with os.scandir(dump_dir_or_file) as dump_dir_or_file_dir:
-                                                    for dump_dir_or_file_member in dump_dir_or_file_dir:
-                                                        if "bson" in dump_dir_or_file_member.name:
-                                                            tarfile_or_dumpdir_bsons_number += 1
-                                                            if dump_dir_or_file_member.stat().st_size > 0:
-                                                                tarfile_or_dumpdir_non_zero_sized_bsons_number += 1
-                                                                tarfile_or_dumpdir_non_zero_sized_bson_date = datetime.fromtimestamp(dump_dir_or_file_member.stat().st_mtime)
-                                            else:
-                                                with tarfile.open(dump_dir_or_file, "r") as dump_dir_or_file_file:
-                                                    for tarfile_or_dumpdir_member in dump_dir_or_file_file.getmembers():
-                                                        if "bson" in tarfile_or_dumpdir_member.name:
-                                                            tarfile_or_dumpdir_bsons_number += 1
-                                                            if tarfile_or_dumpdir_member.size > 0:
-                                                                tarfile_or_dumpdir_non_zero_sized_bsons_number += 1
-                                                                tarfile_or_dumpdir_non_zero_sized_bson_date = datetime.fromtimestamp(tarfile_or_dumpdir_member.mtime)
-
-                                            log_and_print("NOTICE", "Found {tarfile_or_dumpdir_bsons_number} bsons in dump dir or file {dump_dir_or_file} on item number {number}".format(tarfile_or_dumpdir_bsons_number=tarfile_or_dumpdir_bsons_number, dump_dir_or_file=dump_dir_or_file, number=item["number"]), logger)
-
-                                            # Check non zero sized bsons
-                                            if tarfile_or_dumpdir_non_zero_sized_bsons_number > 0:
-                                                log_and_print("NOTICE", "Found {tarfile_or_dumpdir_non_zero_sized_bsons_number} non zero sized bsons in dump dir or file {dump_dir_or_file} on item number {number}".format(tarfile_or_dumpdir_non_zero_sized_bsons_number=tarfile_or_dumpdir_non_zero_sized_bsons_number, dump_dir_or_file=dump_dir_or_file, number=item["number"]), logger)
-                                                oks += 1
-                                            else:
-                                                log_and_print("ERROR", "Found 0 non zero sized bsons in dump dir or file {dump_dir_or_file} on item number {number}".format(dump_dir_or_file=dump_dir_or_file, number=item["number"]), logger)
-                                                errors += 1
+if __name__ == "__main__":
 
-                                            # Check dump completed date
-                                            if tarfile_or_dumpdir_non_zero_sized_bson_date is not None:
-                                                seconds_between_tarfile_or_dumpdir_non_zero_sized_bson_date_and_now = (datetime.now() - tarfile_or_dumpdir_non_zero_sized_bson_date).total_seconds()
-                                                # Dump files shouldn't be older than 1 day
-                                                if seconds_between_tarfile_or_dumpdir_non_zero_sized_bson_date_and_now < 60*60*24:
-                                                    log_and_print("NOTICE", "Dump bsons age {seconds} secs is less than 1d for the dump dir or file {dump_dir_or_file} on item number {number}".format(seconds=int(seconds_between_tarfile_or_dumpdir_non_zero_sized_bson_date_and_now), dump_dir_or_file=dump_dir_or_file, number=item["number"]), logger)
-                                                    oks += 1
-                                                else:
-                                                    log_and_print("ERROR", "Dump bsons age {seconds} secs is more than 1d for the dump dir or file {dump_dir_or_file} on item number {number}".format(seconds=int(seconds_between_tarfile_or_dumpdir_non_zero_sized_bson_date_and_now), dump_dir_or_file=dump_dir_or_file, number=item["number"]), logger)
-                                                    errors += 1
+    # Everything this script creates (ControlMaster sockets, generated confs and passwd files) is private to root
+    os.umask(0o077)
 
-                                    else:
-                                        log_and_print("ERROR", "{dump_dir_or_file} dump dir or file is missing on item number {number}".format(dump_dir_or_file=dump_dir_or_file, number=item["number"]), logger)
-                                        errors += 1
+    # Set logger
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.DEBUG)
+    log_path = os.path.join(LOG_DIR, LOG_FILE)
+    os.makedirs(LOG_DIR, mode=0o755, exist_ok=True)
+    log_handler = RotatingFileHandler(log_path, maxBytes=10485760, backupCount=10, encoding="utf-8")
+    os.chmod(log_path, 0o600)
+    log_handler.setLevel(logging.DEBUG)
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.ERROR)
+    formatter = logging.Formatter(fmt='%(asctime)s %(filename)s %(name)s %(process)d/%(threadName)s %(levelname)s: %(message)s', datefmt="%Y-%m-%d %H:%M:%S %Z")
+    log_handler.setFormatter(formatter)
+    console_handler.setFormatter(formatter)
+    # Worker threads only enqueue records; a single listener thread owns the file and
+    # console handlers, so parallel items never serialize on handler locks or disk flushes
+    log_queue = queue.Queue(-1)
+    log_listener = QueueListener(log_queue, log_handler, console_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+    logger.addHandler(QueueHandler(log_queue))
 
-                            # .backup and FILE_AGE
-                            if item["type"] in ["RSYNC_SSH", "RSYNC_NATIVE"]:
+    # Set parser and parse args
 
-                                sources_to_check = []
+    parser = argparse.ArgumentParser(description="{LOGO} functions.".format(LOGO=LOGO))
 
-                                # Expand paths to check for RSYNC_SSH
-                                if item["type"] == "RSYNC_SSH":
+    parser.add_argument("--debug", dest="debug", help="enable debug", action="store_true")
+    parser.add_argument("--config", dest="config", help="override config")
+    parser.add_argument("--item-number", dest="item_number", help="run only for config item NUMBER", nargs=1, metavar=("NUMBER"))
+    parser.add_argument("--host", dest="host", help="run only for items with HOST", nargs=1, metavar=("HOST"))
+    parser.add_argument("--ignore-lock", dest="ignore_lock", help="ignore locking to allow many instances of rsnapshot_backup.py in the same time (use only for testing)", action="store_true")
+    parser.add_argument("--parallel", dest="parallel", help="process up to PARALLEL backup items in parallel, overrides the parallel_items config key, default 1", type=int, metavar=("PARALLEL"))
 
-                                    if item["source"] in DATA_EXPAND:
-                                        for source in DATA_EXPAND[item["source"]]:
-                                            if not ("exclude" in item and source in item["exclude"]):
-                                                sources_to_check.append(source)
-                                    else:
-                                        sources_to_check.append(item["source"])
-
-                                # For RSYNC_NATIVE we need to strip first dir path (share name) from source
-                                if item["type"] == "RSYNC_NATIVE":
-                                    sources_to_check.append("/{path}".format(path="/".join(item["source"].split("/")[2:])))
-
-                                # Check sources
-                                for source in sources_to_check:
-
-                                    # FILE_AGE
-                                    if check["type"] == "FILE_AGE":
-
-                                        find_cmd = "find {item_path}/.sync/rsnapshot{source} -type f -regex '.*/{mask}'".format(item_path=item["path"], source=source, mask=check["files_mask"])
-                                        log_and_print("NOTICE", "find cmd: {find_cmd} on item number {number}".format(find_cmd=find_cmd, number=item["number"]), logger)
-
-                                        try:
-                                            retcode, stdout, stderr = run_cmd_pipe(find_cmd)
-                                            if retcode == 0:
-
-                                                # Process find results
-
-                                                file_list = stdout
-                                                file_list_file_count = 0
-                                                file_list_last_file_timestamp = 0
-                                                file_list_last_file_datetime = None
-                                                file_list_last_file = None
-
-                                                for file_list_file in file_list.split("\n"):
-                                                    if len(file_list_file) > 0:
-                                                        file_list_file_count += 1
-
-                                                        # Find last file
-                                                        file_list_file_timestamp = os.path.getmtime(file_list_file)
-                                                        if file_list_file_timestamp > file_list_last_file_timestamp:
-                                                            file_list_last_file_timestamp = file_list_file_timestamp
-                                                            file_list_last_file_datetime = datetime.fromtimestamp(file_list_file_timestamp)
-                                                            file_list_last_file = file_list_file
-
-                                                        # Check min_file_size
-                                                        file_list_file_size = os.stat(file_list_file).st_size
-                                                        if file_list_file_size >= check["min_file_size"]:
-                                                            log_and_print("NOTICE", "File {file_count} {file_list_file} size {size} is not less than needed {min_file_size} on item number {number}".format(file_count=file_list_file_count, size=file_list_file_size, file_list_file=file_list_file, min_file_size=check["min_file_size"], number=item["number"]), logger)
-                                                            oks += 1
-                                                        else:
-                                                            log_and_print("ERROR", "File {file_count} {file_list_file} size {size} is less than needed {min_file_size} on item number {number}".format(file_count=file_list_file_count, size=file_list_file_size, file_list_file=file_list_file, min_file_size=check["min_file_size"], number=item["number"]), logger)
-                                                            errors += 1
-
-                                                        # Check file_type
-                                                        try:
-                                                            ft_retcode, ft_stdout, ft_stderr = run_cmd_pipe("file -b '{file_list_file}'".format(file_list_file=file_list_file))
-                                                            if ft_retcode == 0:
-                                                                file_type_received = ft_stdout.lstrip().rstrip()
-                                                                if re.match(check["file_type"], file_type_received):
-                                                                    log_and_print("NOTICE", "File {file_count} {file_list_file} type {file_type_received} matched needed {check_file_type} on item number {number}".format(file_count=file_list_file_count, file_list_file=file_list_file, file_type_received=file_type_received, check_file_type=check["file_type"], number=item["number"]), logger)
-                                                                    oks += 1
-                                                                else:
-                                                                    log_and_print("ERROR", "File {file_count} {file_list_file} type {file_type_received} mismatched needed {check_file_type} on item number {number}".format(file_count=file_list_file_count, file_list_file=file_list_file, file_type_received=file_type_received, check_file_type=check["file_type"], number=item["number"]), logger)
-                                                                    errors += 1
-                                                            else:
-                                                                log_and_print("ERROR", "Getting file {file_list_file} type failed on item number {number}".format(file_list_file=file_list_file, number=item["number"]), logger)
-                                                                errors += 1
-                                                        except Exception as e:
-                                                            logger.exception(e)
-                                                            raise Exception("Caught exception on subprocess.run execution")
-
-                                                # Check files_total
-                                                if file_list_file_count >= check["files_total"]:
-                                                    log_and_print("NOTICE", "Found {file_list_file_count} of needed {files_total} files on item number {number}".format(file_list_file_count=file_list_file_count, files_total=check["files_total"], number=item["number"]), logger)
-                                                    oks += 1
-                                                else:
-                                                    log_and_print("ERROR", "Found {file_list_file_count} of needed {files_total} files on item number {number}".format(file_list_file_count=file_list_file_count, files_total=check["files_total"], number=item["number"]), logger)
-                                                    errors += 1
-
-                                                # Check files_total_max, this check is optional
-                                                if "files_total_max" in check:
-                                                    if file_list_file_count <= check["files_total_max"]:
-                                                        log_and_print("NOTICE", "Found {file_list_file_count} of max {files_total_max} files on item number {number}".format(file_list_file_count=file_list_file_count, files_total_max=check["files_total_max"], number=item["number"]), logger)
-                                                        oks += 1
-                                                    else:
-                                                        log_and_print("ERROR", "Found {file_list_file_count} of max {files_total_max} files on item number {number}".format(file_list_file_count=file_list_file_count, files_total_max=check["files_total_max"], number=item["number"]), logger)
-                                                        errors += 1
-
-                                                # Check last_file_age
-                                                if file_list_file_count > 0:
-                                                    seconds_between_file_list_last_file_datetime_and_now = (datetime.now() - file_list_last_file_datetime).total_seconds()
-                                                    if seconds_between_file_list_last_file_datetime_and_now < check["last_file_age"]*60*60*24:
-                                                        log_and_print("NOTICE", "Last file {file_list_last_file} date {date} is not older than allowed {last_file_age} days old on item number {number}".format(file_list_last_file=file_list_last_file, date=file_list_last_file_datetime, last_file_age=check["last_file_age"], number=item["number"]), logger)
-                                                        oks += 1
-                                                    else:
-                                                        log_and_print("ERROR", "Last file {file_list_last_file} date {date} is older than allowed {last_file_age} days old on item number {number}".format(file_list_last_file=file_list_last_file, date=file_list_last_file_datetime, last_file_age=check["last_file_age"], number=item["number"]), logger)
-                                                        errors += 1
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--sync", dest="sync", help="prepare rsnapshot configs and run sync, we use sync_first rsnapshot option", action="store_true")
+    group.add_argument("--rotate-hourly", dest="rotate_hourly", help="prepare rsnapshot configs and run hourly rotate", action="store_true")
+    group.add_argument("--rotate-daily", dest="rotate_daily", help="prepare rsnapshot configs and run daily rotate", action="store_true")
+    group.add_argument("--rotate-weekly", dest="rotate_weekly", help="prepare rsnapshot configs and run weekly rotate", action="store_true")
+    group.add_argument("--rotate-monthly", dest="rotate_monthly", help="prepare rsnapshot configs and run monthly rotate", action="store_true")
+    group.add_argument("--check", dest="check", help="run checks for rsnapshot backups", action="store_true")
 
-                                            else:
-                                                log_and_print("ERROR", "find cmd failed on item number {number}".format(number=item["number"]), logger)
-                                                errors += 1
+    if len(sys.argv) > 1:
+        args = parser.parse_args()
+    else:
+        parser.print_help()
+        sys.exit(1)
 
-                                        except Exception as e:
-                                            logger.exception(e)
-                                            raise Exception("Caught exception on subprocess.run execution")
+    # Enable debug
+    if args.debug:
+        console_handler.setLevel(logging.DEBUG)
 
-                                    # .backup
-                                    if check["type"] in [".backup", "s3/.backup"]:
+    # Catch exception to logger
+    try:
 
-                                        # Construct path
-                                        check_file = "{item_path}/.sync/rsnapshot{source}/.backup".format(item_path=item["path"], source=source)
+        # Load YAML config
+        if args.config:
+            # Override config
+            logger.info("Loading YAML config {config_file}".format(config_file=args.config))
+            config = load_yaml_config("{config_file}".format(config_file=args.config), logger)
+        else:
+            logger.info("Loading YAML config {work_dir}/{config_file}".format(work_dir=WORK_DIR, config_file=CONFIG_FILE))
+            config = load_yaml_config("{work_dir}/{config_file}".format(work_dir=WORK_DIR, config_file=CONFIG_FILE), logger)
 
-                                        # Check check file existance
-                                        if os.path.exists(check_file):
+        # Check if enabled in config
+        if config["enabled"] != True:
+            logger.info("{LOGO} not enabled in config, exiting".format(LOGO=LOGO))
+            sys.exit(0)
 
-                                            log_and_print("NOTICE", ".backup file exists on item number {number}: {check_file}".format(number=item["number"], check_file=check_file), logger)
-                                            oks += 1
+        # Check for self hostname override in config
+        if "hostname_override" in config:
+            SELF_HOSTNAME = config["hostname_override"]
+        else:
+            SELF_HOSTNAME = socket.gethostname()
+        log_and_print("NOTICE", "Starting {LOGO} on {hostname}".format(LOGO=LOGO, hostname=SELF_HOSTNAME), logger)
 
-                                            # Gather check file data
-                                            check_file_dict = {}
-                                            with open(check_file, "r") as check_file_file:
-                                                while True:
-                                                    check_file_line = check_file_file.readline().rstrip()
-                                                    if not check_file_line:
-                                                        break
-                                                    check_file_line_key = check_file_line.split(": ")[0]
-                                                    check_file_line_val = check_file_line.split(": ")[1]
-                                                    check_file_dict[check_file_line_key] = check_file_line_val
-
-                                            if check["type"] == ".backup":
-
-                                                # Check file Host
-                                                if "Host" in check_file_dict:
-                                                    if check_file_dict["Host"].lower() == item["host"].lower():
-                                                        log_and_print("NOTICE", ".backup file host {file_host} matched {item_host} on item number {number}: {check_file}".format(file_host=check_file_dict["Host"], item_host=item["host"], number=item["number"], check_file=check_file), logger)
-                                                        oks += 1
-                                                    else:
-                                                        log_and_print("ERROR", ".backup file host {file_host} mismatched {item_host} on item number {number}: {check_file}".format(file_host=check_file_dict["Host"], item_host=item["host"], number=item["number"], check_file=check_file), logger)
-                                                        errors += 1
-                                                else:
-                                                    log_and_print("ERROR", ".backup file doesn't contain Host on item number {number}: {check_file}".format(number=item["number"], check_file=check_file), logger)
-                                                    errors += 1
-
-                                                # Check file Path
-                                                if "Path" in check_file_dict:
-
-                                                    # Path could be defined in check
-                                                    if "path" in check:
-                                                        path_to_check = check["path"]
-                                                    else:
-                                                        path_to_check = source
-
-                                                    if check_file_dict["Path"] == path_to_check:
-                                                        log_and_print("NOTICE", ".backup file path {file_path} matched {item_path} on item number {number}: {check_file}".format(file_path=check_file_dict["Path"], item_path=path_to_check, number=item["number"], check_file=check_file), logger)
-                                                        oks += 1
-                                                    else:
-                                                        log_and_print("ERROR", ".backup file path {file_path} mismatched {item_path} on item number {number}: {check_file}".format(file_path=check_file_dict["Path"], item_path=path_to_check, number=item["number"], check_file=check_file), logger)
-                                                        errors += 1
-                                                else:
-                                                    log_and_print("ERROR", ".backup file doesn't contain Path on item number {number}: {check_file}".format(number=item["number"], check_file=check_file), logger)
-                                                    errors += 1
-
-                                            elif check["type"] == "s3/.backup":
-
-                                                # Check file Bucket
-                                                if "Bucket" in check_file_dict:
-                                                    if check_file_dict["Bucket"] == check["s3_bucket"]:
-                                                        log_and_print("NOTICE", ".backup file bucket {file_bucket} matched s3 {check_bucket} on item number {number}: {check_file}".format(file_bucket=check_file_dict["Bucket"], check_bucket=check["s3_bucket"], number=item["number"], check_file=check_file), logger)
-                                                        oks += 1
-                                                    else:
-                                                        log_and_print("ERROR", ".backup file bucket {file_bucket} mismatched s3 {check_bucket} on item number {number}: {check_file}".format(file_bucket=check_file_dict["Bucket"], check_bucket=check["s3_bucket"], number=item["number"], check_file=check_file), logger)
-                                                        errors += 1
-                                                else:
-                                                    log_and_print("ERROR", ".backup file doesn't contain Bucket on item number {number}: {check_file}".format(number=item["number"], check_file=check_file), logger)
-                                                    errors += 1
-
-                                                # Check file Path
-                                                if "Path" in check_file_dict:
-
-                                                    if check_file_dict["Path"] == check["s3_path"]:
-                                                        log_and_print("NOTICE", ".backup file path {file_path} matched s3 {check_path} on item number {number}: {check_file}".format(file_path=check_file_dict["Path"], check_path=check["s3_path"], number=item["number"], check_file=check_file), logger)
-                                                        oks += 1
-                                                    else:
-                                                        log_and_print("ERROR", ".backup file path {file_path} mismatched s3 {check_path} on item number {number}: {check_file}".format(file_path=check_file_dict["Path"], check_path=check["s3_path"], number=item["number"], check_file=check_file), logger)
-                                                        errors += 1
-                                                else:
-                                                    log_and_print("ERROR", ".backup file doesn't contain Path on item number {number}: {check_file}".format(number=item["number"], check_file=check_file), logger)
-                                                    errors += 1
-
-                                            # Check file UTC 
-                                            if "UTC" in check_file_dict:
-                                                seconds_between_check_file_utc_and_now = (datetime.now() - datetime.strptime(check_file_dict["UTC"], "%Y-%m-%d %H:%M:%S")).total_seconds()
-                                                # .backups files shouldn't be older than 1 day
-                                                if seconds_between_check_file_utc_and_now < 60*60*24:
-                                                    log_and_print("NOTICE", ".backup file date age {seconds} secs is less than 1d on item number {number}: {check_file}".format(seconds=int(seconds_between_check_file_utc_and_now), number=item["number"], check_file=check_file), logger)
-                                                    oks += 1
-                                                else:
-                                                    log_and_print("ERROR", ".backup file date age {seconds} secs is more than 1d on item number {number}: {check_file}".format(seconds=int(seconds_between_check_file_utc_and_now), number=item["number"], check_file=check_file), logger)
-                                                    errors += 1
-                                            else:
-                                                log_and_print("ERROR", ".backup file doesn't contain UTC on item number {number}: {check_file}".format(number=item["number"], check_file=check_file), logger)
-                                                errors += 1
-                                            
-                                            # Check file backup hosts to find self
-                                            if "Backup 1 Host" in check_file_dict and "Backup 1 Path" in check_file_dict:
-                                                check_file_backup_item = 1
-                                                backup_host_found = False
-                                                backup_host_path_found = False
-                                                while True:
-                                                    if "Backup {n} Host".format(n=check_file_backup_item) in check_file_dict and "Backup {n} Path".format(n=check_file_backup_item) in check_file_dict:
-                                                        if check_file_dict["Backup {n} Host".format(n=check_file_backup_item)] == SELF_HOSTNAME:
-                                                            backup_host_found = True
-                                                            if check_file_dict["Backup {n} Path".format(n=check_file_backup_item)] == item["path"]:
-                                                                backup_host_path_found = True
-                                                        check_file_backup_item += 1
-                                                    else:
-                                                        break
-                                                if backup_host_found and backup_host_path_found:
-                                                    log_and_print("NOTICE", ".backup file backup host {host} and path {path} are found on item number {number}: {check_file}".format(host=SELF_HOSTNAME, path=item["path"], number=item["number"], check_file=check_file), logger)
-                                                    oks += 1
-                                                else:
-                                                    log_and_print("ERROR", ".backup file backup host {host} and path {path} are not found on item number {number}: {check_file}".format(host=SELF_HOSTNAME, path=item["path"], number=item["number"], check_file=check_file), logger)
-                                                    errors += 1
-                                            else:
-                                                log_and_print("ERROR", ".backup file doesn't contain at least one backup host/path on item number {number}: {check_file}".format(number=item["number"], check_file=check_file), logger)
-                                                errors += 1
+        # Lock before trying to run, exception and exit if locked by another instance is ok
+        # flock is one syscall and the kernel releases it automatically on process exit, so no stale lock files
+        if not args.ignore_lock:
+            lock_fd = os.open(LOCK_FILE, os.O_CREAT | os.O_WRONLY, 0o600)
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                raise Exception("Another instance seems to be running, {lock_file} is locked".format(lock_file=LOCK_FILE))
+        try:
 
-                                        else:
-                                            log_and_print("ERROR", ".backup file is missing on item number {number}: {check_file}".format(number=item["number"], check_file=check_file), logger)
-                                            errors += 1
+            errors = 0
+            oks = 0
+            paths_processed = set()
+
+            # Pick the rotate period once instead of re-testing the four args flags per item
+            rotate_command = next((period for period in ("hourly", "daily", "weekly", "monthly") if getattr(args, "rotate_{period}".format(period=period))), None)
+
+            # Loop backup items
+            items_to_process = []
+            for item in config["items"]:
+
+                if not item["enabled"]:
+                    continue
+
+                # Apply filters
+                if args.item_number is not None:
+                    if str(item["number"]) != str(args.item_number[0]):
+                        continue
+                if args.host is not None:
+                    if item["host"] != str(args.host[0]):
+                        continue
+
+                items_to_process.append(item)
+
+            # Items mostly wait on remote commands, so they can be processed in a worker pool
+            # --parallel overrides the parallel_items config key, both default to one item at a time
+            max_workers = args.parallel if args.parallel is not None else config.get("parallel_items", 1)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                item_futures = [executor.submit(process_item, item, args, SELF_HOSTNAME, logger, paths_processed, rotate_command) for item in items_to_process]
+                for item_future in concurrent.futures.as_completed(item_futures):
+                    item_errors, item_oks = item_future.result()
+                    errors += item_errors
+                    oks += item_oks
 
-                except Exception as e:
-                    logger.error("Caught exception, but not interrupting")
-                    logger.exception(e)
-                    errors += 1
 
             # Exit with error if there were errors
             if errors > 0:
@@ -2795,7 +3216,7 @@ if __name__ == "__main__":
 
         finally:
             if not args.ignore_lock:
-                lock.release()
+                os.close(lock_fd)
 
     # Reroute catched exception to log
     except Exception as e: